@@ -0,0 +1,154 @@
+"""
+Pool of warm SeleniumBase browser sessions.
+
+Starting undetected-chrome is the bulk of the wall-clock time of a scrape cycle,
+so sessions are kept alive across pages, monitors and scheduler cycles and only
+recycled after a configurable number of pages or when a captcha is hit.
+
+Examples:
+    >>> with get_pool().session() as Session:
+    ...     Session.sb.uc_open_with_reconnect('https://www.example.com', 4)
+"""
+import atexit as _atexit
+import threading as _threading
+from contextlib import contextmanager as _contextmanager
+
+import fuckit as _fuckit
+
+import config as _config
+
+__all__ = ['BrowserPool', 'BrowserSession', 'get_pool', 'shutdown']
+
+
+class BrowserSession:
+    """
+    A single long-lived SeleniumBase session.
+
+    SB is a context manager, we enter it on construction and exit it on close
+    so the browser survives between pages.
+
+    Attributes:
+        sb: The SeleniumBase BaseCase instance, use as you would the "sb" in "with SB() as sb"
+        pages: Number of pages loaded in this session
+        recycle: Set to True to have the pool close this session rather than reuse it
+    """
+
+    def __init__(self):
+        from seleniumbase import SB as _SB  # on first use, so runs with only http monitors never load selenium
+        self._cm = _SB(uc=True, test=True, incognito=True, undetectable=True, undetected=True)
+        self.sb = self._cm.__enter__()  # noqa
+        self.pages = 0
+        self.recycle = False
+
+    def close(self) -> None:
+        """Close the browser. Errors are ignored, the driver may already be dead."""
+        with _fuckit:
+            self._cm.__exit__(None, None, None)
+        self.sb = None
+
+
+class BrowserPool:
+    """
+    Thread-safe pool of up to size warm browser sessions.
+
+    Args:
+        size: Maximum number of concurrent browser sessions
+        recycle_after_pages: Close and replace a session after it has loaded this many pages
+    """
+
+    def __init__(self, size: int = 1, recycle_after_pages: int = 50):
+        self.size = max(1, size)
+        self.recycle_after_pages = recycle_after_pages
+        self._idle = []  # used as a stack so the warmest session is reused first
+        self._cond = _threading.Condition()
+        self._created = 0
+        self._closed = False
+
+    @_contextmanager
+    def session(self):
+        """
+        Check out a session for the duration of the with block.
+
+        Blocks if all sessions are in use. Any exception raised in the with
+        block recycles the session, as the driver may be in an unknown state.
+
+        Yields:
+            BrowserSession: The checked out session
+        """
+        Session = self._acquire()
+        try:
+            yield Session
+            Session.pages += 1
+        except BaseException:
+            Session.recycle = True
+            raise
+        finally:
+            self._release(Session)
+
+    def shutdown(self) -> None:
+        """Close every idle session and refuse new checkouts.
+        Sessions currently checked out are closed when they are released."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for Session in idle:
+            Session.close()
+
+    def _acquire(self) -> BrowserSession:
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('BrowserPool has been shut down')
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                self._cond.wait()
+
+        # Start chrome outside the lock, it takes seconds
+        try:
+            return BrowserSession()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, Session: BrowserSession) -> None:
+        with self._cond:
+            close = Session.recycle or self._closed or Session.pages >= self.recycle_after_pages
+            if close:
+                self._created -= 1
+            else:
+                self._idle.append(Session)
+            self._cond.notify()
+        if close:
+            Session.close()
+
+
+# region module methods
+_POOL: BrowserPool | None = None
+_POOL_LOCK = _threading.Lock()
+
+
+def get_pool() -> BrowserPool:
+    """Get the process wide browser pool, creating it on first use from the settings in config.py"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = BrowserPool(_config.BROWSER_POOL_SIZE, _config.BROWSER_RECYCLE_AFTER_PAGES)
+        return _POOL
+
+
+@_atexit.register
+def shutdown() -> None:
+    """Close all browsers in the process wide pool. Registered with atexit."""
+    global _POOL
+    with _POOL_LOCK:
+        Pool, _POOL = _POOL, None
+    if Pool is not None:
+        Pool.shutdown()
+# endregion module methods
@@ -5,14 +5,104 @@ from enums import EnumNotifiers as _EnumNotifiers
 
 
 DB_PATH = 'C:/development/price_watch/prices.db'
+DB_MAX_CONNECTIONS = 16  # pooled, one per thread using the database
+DB_BUSY_TIMEOUT_SECONDS = 10  # how long to wait on a locked database before giving up
+DB_CACHE_MB = 64
+DB_MMAP_MB = 256
 
 # Where a single monitor/parser checks across multiple pages (e.g. CCL 9070xt),
 # what is the mean delay between pages.
 SCRAPE_DELAY_BETWEEN_PAGES_SECONDS = 5
 SCRAPE_DELAY_RANDOM_FACTOR = 0.2  # i.e. 20%, so 5 seconds would be randomised between 4 and 6 seconds
 
+# Rules for closing up model numbers in page sources, e.g. '9070 XT' to '9070xt'.
+# None uses normaliser.DEFAULT_RULES, otherwise a list of dicts in the same format.
+SOURCE_FIX_RULES = None
+
+# Selector spec files merged over parser_specs.json, e.g. to add a supplier or fix one after a site change
+# without touching the repo. See parser_specs for the format.
+PARSER_SPECS_FILES = []
+
+# Pages of a monitor are fetched, parsed and scraped one at a time. Fetch this many pages ahead, so the next
+# page downloads while this one is parsed and scraped. Only the page sources are held ahead, not their soups.
+SCRAPE_PREFETCH_PAGES = 0
+
+# Opt in to fetching the known pagination pages of a monitor concurrently, rather than one after another.
+# Each page starts after a random jitter and no more than SCRAPE_PARALLEL_PAGES_PER_HOST pages are fetched
+# from a single host at once. Browser backed pages are also limited by BROWSER_POOL_SIZE.
+SCRAPE_PARALLEL_PAGES = False
+SCRAPE_PARALLEL_PAGES_PER_HOST = 3
+SCRAPE_PARALLEL_PAGES_JITTER_SECONDS = 3
+
+# On-disk page cache, see page_cache. Http monitors send conditional requests using the cached ETag/Last-Modified.
+# With PAGE_CACHE_SKIP_UNCHANGED, pages whose normalised source is unchanged since the monitor last scraped them
+# successfully are not parsed or scraped again. Entries are evicted by age and when the cache exceeds PAGE_CACHE_MAX_MB.
+PAGE_CACHE_DIR = 'C:/development/price_watch/page_cache'
+PAGE_CACHE_SKIP_UNCHANGED = True
+PAGE_CACHE_MAX_AGE_HOURS = 24
+PAGE_CACHE_MAX_MB = 500
+
+# Capture and replay of page sources, see fixtures. 'record' saves every page fetched to FIXTURES_DIR,
+# 'replay' reads pages back from FIXTURES_DIR rather than fetching them. None fetches as normal.
+FIXTURES_MODE = None
+FIXTURES_DIR = 'C:/development/price_watch/fixtures'
+
+# Max number of hosts scraped at the same time by the scheduler.
+# Monitors for the same host are always scraped one after another.
+SCHEDULER_MAX_WORKERS = 4
+
+# Each monitor is scraped every SCHEDULER_INTERVAL_SECONDS plus a random jitter of up to SCHEDULER_JITTER_SECONDS.
+# A captcha, an HTTP 403, 429 or 5xx, or a timeout backs off the host that failed, and only that host,
+# for SCHEDULER_BACKOFF_SECONDS, doubling on each consecutive failure up to SCHEDULER_MAX_BACKOFF_SECONDS.
+SCHEDULER_INTERVAL_SECONDS = 600
+SCHEDULER_JITTER_SECONDS = 120
+SCHEDULER_BACKOFF_SECONDS = 60
+SCHEDULER_MAX_BACKOFF_SECONDS = 3600
+# Page requests allowed per host per minute, across all monitors, in bursts of up to SCHEDULER_HOST_BURST
+SCHEDULER_HOST_REQUESTS_PER_MINUTE = 20
+SCHEDULER_HOST_BURST = 5
+# Longest sleep between looking for due monitors, so new and re-enabled monitors are picked up
+SCHEDULER_POLL_SECONDS = 60
+
+# Warm browser sessions kept alive across pages, monitors and cycles by browser_pool.
+# A session is closed and replaced after BROWSER_RECYCLE_AFTER_PAGES pages, or straight away on a captcha.
+BROWSER_POOL_SIZE = 1  # set to SCHEDULER_MAX_WORKERS if browser backed suppliers shouldn't queue for a browser
+BROWSER_RECYCLE_AFTER_PAGES = 50
+
+# Pooled HTTP client used by monitors with fetch_mode 'http', see http_fetch
+HTTP_TIMEOUT_SECONDS = 20
+HTTP_RETRIES = 2
+HTTP_BACKOFF_SECONDS = 1  # doubled on every retry
+HTTP_MAX_PER_HOST = 4
+
+# Rows for the log table are queued and written in batches by a background thread, see log_sink.
+# Rows below LOG_LEVEL ('DEBUG', 'INFO', 'WARNING' or 'ERROR') are dropped, as are rows when the queue is full.
+LOG_LEVEL = 'INFO'
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_SECONDS = 2
+
+# Metrics, see metrics. Stage timings of every scrape are also written to the scrape_run table.
+# METRICS_TEXTFILE is rewritten after every price checker cycle, e.g. for the node_exporter textfile collector.
+# METRICS_PORT serves the same text at http://METRICS_HOST:METRICS_PORT/metrics. None disables either.
+METRICS_TEXTFILE = None  # e.g. 'C:/development/price_watch/price_watch.prom'
+METRICS_PORT = None  # e.g. 9108
+METRICS_HOST = '127.0.0.1'
+
 # Notifiers to use, as enums
 NOTIFIERS = [_EnumNotifiers.PushBullet]
+NOTIFIER_MAX_WORKERS = 4  # carriers sent to at the same time by notifier.send_all
+NOTIFIER_TIMEOUT_SECONDS = 20
+
+# Alerts are written to the outbox table and sent by a background dispatcher, see outbox.
+# Messages for a carrier fired within OUTBOX_COALESCE_SECONDS of each other are sent as one digest,
+# no carrier is sent to more often than OUTBOX_MIN_SECONDS_BETWEEN_SENDS (override per carrier by its
+# EnumNotifiers value), and failed sends are retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS times.
+OUTBOX_COALESCE_SECONDS = 30
+OUTBOX_MIN_SECONDS_BETWEEN_SENDS = {'default': 10, 'TwilioSMS': 60, 'WhatsApp': 60}
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BACKOFF_SECONDS = 30  # doubled on every retry
+OUTBOX_POLL_SECONDS = 5
 
 
 class WhatsApp(ABC):
@@ -1,7 +1,7 @@
 """All enums here"""
 from enum import Enum as _Enum
 
-__all__ = ['EnumAlertCarriers', 'EnumLogAction', 'EnumLogLevel', 'EnumParsers']
+__all__ = ['EnumAlertCarriers', 'EnumFetchMode', 'EnumLogAction', 'EnumLogLevel', 'EnumNotifiers', 'EnumOutboxStatus', 'EnumParsers', 'EnumScrapeStatus']
 
 
 # region Enums
@@ -11,6 +11,12 @@ class EnumAlertCarriers(_Enum):
     SMS_Twilio = 'SMS_Twilio'
     WhatsApp = 'WhatsApp'
 
+class EnumFetchMode(_Enum):
+    """Used for the fetch_mode field in table monitor.
+    Http is for sites that don't need a real browser to get past bot detection."""
+    Selenium = 'selenium'
+    Http = 'http'
+
 class EnumLogAction(_Enum):
     """Log action enum"""
     Notify = 'Notify'
@@ -49,7 +55,21 @@ class EnumParsers(_Enum):
 class EnumNotifiers(_Enum):
     PushBullet = 'PushBullet'
     Telegram = 'Telegram'
+    TwilioSMS = 'TwilioSMS'
     WhatsApp = 'WhatsApp'
 
 
+class EnumOutboxStatus(_Enum):
+    """Used for the status field in table outbox"""
+    Pending = 'pending'
+    Sent = 'sent'
+    Failed = 'failed'  # gave up after OUTBOX_MAX_ATTEMPTS
+
+
+class EnumScrapeStatus(_Enum):
+    """Used for the status field in table scrape_run"""
+    Ok = 'ok'
+    Error = 'error'
+
+
 # endregion Enums
\ No newline at end of file
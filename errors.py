@@ -1,9 +1,21 @@
 """Custom errors"""
-__all__ = ['CaptchaError', 'DBWhatInvalidStringError']
+__all__ = ['CaptchaError', 'DBWhatInvalidStringError', 'FixtureMissingError', 'MockCarrierError', 'UnknownParserError']
 
 
 class CaptchaError(Exception):
     pass
 
 class DBWhatInvalidStringError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class FixtureMissingError(Exception):
+    """A page wasn't recorded in the fixture store, see fixtures"""
+    pass
+
+class MockCarrierError(Exception):
+    """Injected failure from a mock_notifier backend"""
+    pass
+
+class UnknownParserError(Exception):
+    """No parser is registered under the name, see parser_registry"""
+    pass
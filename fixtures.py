@@ -0,0 +1,163 @@
+"""
+Capture and replay of fetched page sources, so parsers can be run and benchmarked with no network.
+
+In record mode every page a monitor fetches is saved, as fetched and before _fix_source, along with
+the monitor row it was fetched for. In replay mode pages are read back from the store rather than fetched,
+so any parser can be run against the recordings, e.g. in CI or by scripts/benchmark.py parsers.
+
+The store is a folder per parser, each with an index.json of
+    {"pages": {url: file name}, "monitors": {monitorid: monitor row}}
+and the page sources as <sha1 of url>.html.
+
+Set FIXTURES_MODE and FIXTURES_DIR in config.py, or call configure, e.g. from a command line flag.
+
+Examples:
+    >>> configure('record', 'C:/development/price_watch/fixtures')
+    >>> Currys.get_by_id(3).scrape()  # fetched pages are saved
+    >>> configure('replay', 'C:/development/price_watch/fixtures')
+    >>> Currys.get_by_id(3).scrape()  # pages are read back, nothing is fetched
+"""
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import os.path as _path
+import threading as _threading
+
+import config as _config
+from errors import FixtureMissingError
+
+__all__ = ['FixtureStore', 'MODES', 'configure', 'get_store']
+
+MODES = ('record', 'replay')
+
+
+class FixtureStore:
+    """
+    Folder of recorded page sources, by parser.
+
+    Args:
+        root: Folder to keep the fixtures in, created if it doesn't exist
+        mode: 'record' or 'replay'
+    """
+
+    def __init__(self, root: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(f'Unknown fixtures mode "{mode}", expected one of {MODES}')
+        self.root = root
+        self.mode = mode
+        self._lock = _threading.Lock()
+        _os.makedirs(root, exist_ok=True)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def save(self, parser: str, url: str, source: str, monitor: dict | None = None) -> None:
+        """
+        Save the source fetched from url by a monitor, replacing any earlier recording of url.
+
+        Args:
+            parser: Parser name, e.g. 'Currys'
+            url: The page url
+            source: The page source, before _fix_source
+            monitor: The monitor row, saved so the monitor can be recreated for replay
+        """
+        fname = self._key(url) + '.html'
+        with self._lock:
+            _os.makedirs(self._folder(parser), exist_ok=True)
+            with open(_path.join(self._folder(parser), fname), 'w', encoding='utf-8') as f:
+                f.write(source)
+            index = self._read_index(parser)
+            index['pages'][url] = fname
+            if monitor:
+                index['monitors'][str(monitor['monitorid'])] = monitor
+            self._write_index(parser, index)
+
+    def load(self, parser: str, url: str) -> str:
+        """
+        Load the source recorded for url.
+
+        Raises:
+            errors.FixtureMissingError: If url wasn't recorded for parser
+        """
+        fname = self._read_index(parser)['pages'].get(url)
+        if fname is None:
+            raise FixtureMissingError(f'No {parser} fixture for "{url}" in {self.root}')
+        with open(_path.join(self._folder(parser), fname), encoding='utf-8') as f:
+            return f.read()
+
+    def parsers(self) -> list[str]:
+        """Names of the parsers with recordings"""
+        return sorted(name for name in _os.listdir(self.root) if _path.isfile(_path.join(self.root, name, 'index.json')))
+
+    def monitors(self, parser: str) -> list[dict]:
+        """The monitor rows recorded for parser"""
+        return list(self._read_index(parser)['monitors'].values())
+
+    def urls(self, parser: str) -> list[str]:
+        """The page urls recorded for parser"""
+        return list(self._read_index(parser)['pages'])
+
+    # region private methods
+    @staticmethod
+    def _key(url: str) -> str:
+        return _hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _folder(self, parser: str) -> str:
+        return _path.join(self.root, parser)
+
+    def _read_index(self, parser: str) -> dict:
+        try:
+            with open(_path.join(self._folder(parser), 'index.json'), encoding='utf-8') as f:
+                return _json.load(f)
+        except (OSError, ValueError):
+            return {'pages': {}, 'monitors': {}}
+
+    def _write_index(self, parser: str, index: dict) -> None:
+        fname = _path.join(self._folder(parser), 'index.json')
+        tmp = f'{fname}.{_threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            _json.dump(index, f, indent=1, default=str)
+        _os.replace(tmp, fname)
+    # endregion private methods
+
+
+# region module methods
+_STORE: FixtureStore | None = None
+_CONFIGURED = False
+_STORE_LOCK = _threading.Lock()
+
+
+def get_store() -> FixtureStore | None:
+    """Get the process wide fixture store, or None if we are neither recording nor replaying.
+    Created on first use from FIXTURES_MODE and FIXTURES_DIR in config.py, unless configure was called."""
+    global _STORE, _CONFIGURED
+    with _STORE_LOCK:
+        if not _CONFIGURED:
+            _CONFIGURED = True
+            if _config.FIXTURES_MODE:
+                _STORE = FixtureStore(_config.FIXTURES_DIR, _config.FIXTURES_MODE)
+        return _STORE
+
+
+def configure(mode: str | None, root: str | None = None) -> FixtureStore | None:
+    """
+    Set the fixtures mode for this process, overriding config.py.
+
+    Args:
+        mode: 'record', 'replay' or None to fetch pages as normal
+        root: Fixtures folder, defaults to config.FIXTURES_DIR
+
+    Returns:
+        FixtureStore | None: The store, None if mode is None
+    """
+    global _STORE, _CONFIGURED
+    with _STORE_LOCK:
+        _CONFIGURED = True
+        _STORE = FixtureStore(root or _config.FIXTURES_DIR, mode) if mode else None
+        return _STORE
+# endregion module methods
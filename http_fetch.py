@@ -0,0 +1,232 @@
+"""
+asyncio HTTP fetch engine for sites that don't need a real browser.
+
+A single httpx.AsyncClient runs on a background event loop, so connections are
+pooled and kept alive per host across pages, monitors and cycles.
+HTTP/2 is negotiated when the h2 package is installed. Requests have a timeout,
+a per-host concurrency cap and retries with exponential backoff.
+
+Synchronous callers (e.g. orm_extensions._request_to_str) use HttpFetcher.get,
+async callers can await HttpFetcher.aget or HttpFetcher.agather.
+
+If httpx is not installed, we fall back to a pooled requests.Session.
+"""
+import asyncio as _asyncio
+import atexit as _atexit
+import random as _random
+import threading as _threading
+from time import sleep as _sleep
+from urllib.parse import urlparse as _urlparse
+
+import requests as _requests
+from requests.adapters import HTTPAdapter as _HTTPAdapter
+
+import config as _config
+
+__all__ = ['FetchResult', 'HttpFetcher', 'TRANSPORT_ERRORS', 'get_fetcher', 'shutdown']
+
+try:
+    import httpx as _httpx
+except ImportError:
+    print('Failed to import httpx. Falling back to requests.Session.')
+    _httpx = None
+
+try:
+    import h2 as _h2  # noqa
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Errors raised by get when a host can't be reached or doesn't answer in time, whichever http library is in use
+TRANSPORT_ERRORS = (_requests.Timeout, _requests.ConnectionError) + ((_httpx.TransportError,) if _httpx is not None else ())
+
+
+class FetchResult:
+    """
+    The bits of an HTTP response we use, independent of the http library.
+
+    Attributes:
+        url: The requested url
+        status_code: HTTP status code
+        text: Decoded body
+        headers: Response headers, keys lower case
+        http_version: e.g. 'HTTP/2'
+    """
+
+    def __init__(self, url: str, status_code: int, text: str, headers: dict, http_version: str = 'HTTP/1.1'):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = {k.lower(): v for k, v in headers.items()}
+        self.http_version = http_version
+
+    def raise_for_status(self) -> None:
+        """Raise requests.HTTPError for 4xx and 5xx responses, with this result as its response.
+        304 Not Modified is not an error."""
+        if self.status_code >= 400:
+            raise _requests.HTTPError(f'{self.status_code} error fetching "{self.url}"', response=self)
+
+
+class HttpFetcher:
+    """
+    Pooled HTTP client.
+
+    Args:
+        timeout: Total timeout in seconds for a single attempt
+        retries: Retry attempts after the first on connection errors, timeouts and RETRY_STATUS_CODES
+        backoff: Base backoff in seconds, doubled on every retry and jittered
+        max_per_host: Max concurrent requests to a single host
+    """
+
+    def __init__(self, timeout: float = 20, retries: int = 2, backoff: float = 1, max_per_host: int = 4):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self._host_semaphores = {}
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._session = None
+        self._lock = _threading.Lock()
+
+    # region sync interface
+    def get(self, url: str, headers: dict | None = None) -> FetchResult:
+        """
+        GET url, blocking until done.
+
+        Args:
+            url: The url
+            headers: Extra request headers
+
+        Returns:
+            FetchResult: The response, after retries
+        """
+        if _httpx is None:
+            return self._get_requests(url, headers)
+        return _asyncio.run_coroutine_threadsafe(self.aget(url, headers), self._ensure_loop()).result()
+
+    def close(self) -> None:
+        """Close pooled connections and stop the event loop"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._loop is not None:
+                if self._client is not None:
+                    _asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+                    self._client = None
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+                self._loop = None
+    # endregion sync interface
+
+    # region async interface
+    async def aget(self, url: str, headers: dict | None = None) -> FetchResult:
+        """Async GET with retries. Must be awaited on the fetcher's loop, use get from other threads."""
+        Client = self._ensure_client()
+        async with self._semaphore(url):
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    r = await Client.get(url, headers=headers)
+                except (_httpx.TimeoutException, _httpx.TransportError):
+                    if last: raise
+                else:
+                    if r.status_code not in RETRY_STATUS_CODES or last:
+                        return FetchResult(url, r.status_code, r.text, dict(r.headers), r.http_version)
+                await _asyncio.sleep(self._backoff_seconds(attempt))
+
+    async def agather(self, urls: list[str], headers: dict | None = None) -> list[FetchResult]:
+        """Fetch urls concurrently, results in the same order as urls"""
+        return list(await _asyncio.gather(*[self.aget(url, headers) for url in urls]))
+    # endregion async interface
+
+    # region private methods
+    def _backoff_seconds(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt) * _random.uniform(0.8, 1.2)
+
+    def _semaphore(self, url: str) -> _asyncio.Semaphore:
+        host = _urlparse(url).netloc.lower()
+        if host not in self._host_semaphores:  # only touched from the loop thread, no lock needed
+            self._host_semaphores[host] = _asyncio.Semaphore(self.max_per_host)
+        return self._host_semaphores[host]
+
+    def _ensure_loop(self) -> _asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = _asyncio.new_event_loop()
+                self._thread = _threading.Thread(target=self._loop.run_forever, name='http_fetch', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _ensure_client(self):
+        if self._client is None:
+            self._client = _httpx.AsyncClient(
+                http2=_HTTP2,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=_httpx.Limits(max_connections=None, max_keepalive_connections=self.max_per_host * 8),
+                headers={'Accept-Encoding': 'gzip, deflate, br' if _brotli_available() else 'gzip, deflate'}
+            )
+        return self._client
+
+    def _get_requests(self, url: str, headers: dict | None = None) -> FetchResult:
+        with self._lock:
+            if self._session is None:
+                self._session = _requests.Session()
+                Adapter = _HTTPAdapter(pool_connections=16, pool_maxsize=self.max_per_host)
+                self._session.mount('https://', Adapter)
+                self._session.mount('http://', Adapter)
+            Session = self._session
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                r = Session.get(url, headers=headers, timeout=self.timeout)
+            except (_requests.Timeout, _requests.ConnectionError):
+                if last: raise
+            else:
+                if r.status_code not in RETRY_STATUS_CODES or last:
+                    return FetchResult(url, r.status_code, r.text, dict(r.headers))
+            _sleep(self._backoff_seconds(attempt))
+    # endregion private methods
+
+
+# region module methods
+_FETCHER: HttpFetcher | None = None
+_FETCHER_LOCK = _threading.Lock()
+
+
+def get_fetcher() -> HttpFetcher:
+    """Get the process wide fetcher, creating it on first use from the settings in config.py"""
+    global _FETCHER
+    with _FETCHER_LOCK:
+        if _FETCHER is None:
+            _FETCHER = HttpFetcher(timeout=_config.HTTP_TIMEOUT_SECONDS, retries=_config.HTTP_RETRIES,
+                                   backoff=_config.HTTP_BACKOFF_SECONDS, max_per_host=_config.HTTP_MAX_PER_HOST)
+        return _FETCHER
+
+
+@_atexit.register
+def shutdown() -> None:
+    """Close the process wide fetcher. Registered with atexit."""
+    global _FETCHER
+    with _FETCHER_LOCK:
+        Fetcher, _FETCHER = _FETCHER, None
+    if Fetcher is not None:
+        Fetcher.close()
+
+
+def _brotli_available() -> bool:
+    """Can responses be decoded from br. urllib3 and httpx use brotli, or brotlicffi (e.g. on PyPy) if it isn't installed."""
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            pass
+    return False
+# endregion module methods
@@ -0,0 +1,178 @@
+"""
+Buffered, asynchronous writer for the log table.
+
+Log rows are put on a bounded queue and written in batches with insert_many
+by a background thread, so logging never costs a synchronous sqlite commit
+in the scrape hot path. Rows below config.LOG_LEVEL are dropped on the spot,
+and if the queue is full rows are dropped rather than blocking the caller.
+The queue is flushed on shutdown.
+
+Examples:
+    >>> log(3, 'Currys ScrapingStarted', EnumLogLevel.INFO.value, 'Started scraping')
+"""
+import atexit as _atexit
+import queue as _queue
+import threading as _threading
+import time as _time
+from datetime import datetime as _datetime
+
+import config as _config
+from enums import EnumLogLevel
+from orm import DATABASE as _DATABASE
+from orm import Log as _Log
+
+__all__ = ['LogSink', 'get_sink', 'log', 'shutdown']
+
+LEVELS = {EnumLogLevel.DEBUG.value: 10, EnumLogLevel.INFO.value: 20, EnumLogLevel.WARNING.value: 30, EnumLogLevel.ERROR.value: 40}
+
+
+class LogSink:
+    """
+    Queue of log rows and the thread that writes them.
+
+    Args:
+        min_level: Rows below this level (an EnumLogLevel value) are dropped
+        max_queue: Max rows waiting to be written, further rows are dropped
+        batch_size: Max rows written per transaction
+        flush_seconds: Max time a row waits before it is written
+    """
+
+    def __init__(self, min_level: str = EnumLogLevel.INFO.value, max_queue: int = 10000, batch_size: int = 200, flush_seconds: float = 2):
+        self.min_level = LEVELS[min_level]
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._queue = _queue.Queue(maxsize=max_queue)
+        self._stop = _threading.Event()
+        self._write_lock = _threading.Lock()
+        self._thread = _threading.Thread(target=self._run, name='log_sink', daemon=True)
+        self._thread.start()
+
+    def log(self, monitorid: int | None, action: str, level: str, comment: str) -> None:
+        """
+        Queue a log row. Never blocks.
+
+        Args:
+            monitorid: monitorid, or None
+            action: e.g. 'Currys ScrapingStarted'
+            level: An EnumLogLevel value
+            comment: The log text
+        """
+        if LEVELS.get(level, LEVELS[EnumLogLevel.ERROR.value]) < self.min_level:
+            return
+        row = {'monitorid': monitorid, 'action': action, 'level': level, 'comment': comment,
+               'when': _datetime.now()}
+        try:
+            self._queue.put_nowait(row)
+        except _queue.Full:
+            self.dropped += 1
+            if level == EnumLogLevel.ERROR.value:
+                print(f'Log queue full, dropped: {comment}')
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Write everything queued so far, blocking until done, including any batch the writer thread is part way through.
+
+        Args:
+            timeout: Give up after about this many seconds, None to wait for as long as it takes
+
+        Returns:
+            bool: False if we gave up with rows unwritten
+        """
+        rows = self._drain()
+        try:
+            self._write(rows, timeout)
+        finally:
+            self._done(len(rows))
+        with self._queue.all_tasks_done:  # rows the writer thread has taken but not yet written, a bounded queue.join()
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def close(self) -> None:
+        """Stop the writer thread and flush the queue. Gives up after a few flush_seconds if the writer is stuck."""
+        self._stop.set()
+        self._thread.join(timeout=self.flush_seconds * 2)
+        if self._thread.is_alive():
+            print(f'Log writer still busy after {self.flush_seconds * 2:.0f}s, flushing what we can')
+        if not self.flush(timeout=self.flush_seconds * 2):
+            print(f'Gave up flushing the log, {self._queue.unfinished_tasks} rows not written')
+
+    # region private methods
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except _queue.Empty:
+                continue
+            # Give the batch a moment to fill, so a burst of rows is one transaction
+            deadline = _time.monotonic() + min(self.flush_seconds, 0.5)
+            rows = [first]
+            while len(rows) < self.batch_size and not self._stop.is_set():
+                try:
+                    rows.append(self._queue.get(timeout=max(0., deadline - _time.monotonic())))
+                except _queue.Empty:
+                    break
+            try:
+                self._write(rows)
+            finally:
+                self._done(len(rows))
+
+    def _drain(self) -> list[dict]:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except _queue.Empty:
+                break
+        return rows
+
+    def _done(self, n: int) -> None:
+        """Mark n rows taken from the queue as written, for flush"""
+        for _ in range(n):
+            self._queue.task_done()
+
+    def _write(self, rows: list[dict], timeout: float | None = None) -> None:
+        if not rows:
+            return
+        if not self._write_lock.acquire(timeout=-1 if timeout is None else timeout):  # the writer thread is stuck in a write
+            print(f'Timed out writing {len(rows)} log rows')
+            return
+        try:
+            with _DATABASE.connection_context(), _DATABASE.atomic():
+                for i in range(0, len(rows), self.batch_size):
+                    _Log.insert_many(rows[i:i + self.batch_size]).execute()
+        except Exception as e:
+            print(f'Failed to write {len(rows)} log rows: {repr(e)}')
+        finally:
+            self._write_lock.release()
+    # endregion private methods
+
+
+# region module methods
+_SINK: LogSink | None = None
+_SINK_LOCK = _threading.Lock()
+
+
+def get_sink() -> LogSink:
+    """Get the process wide log sink, creating it on first use from the settings in config.py"""
+    global _SINK
+    with _SINK_LOCK:
+        if _SINK is None:
+            _SINK = LogSink(_config.LOG_LEVEL, max_queue=_config.LOG_QUEUE_SIZE,
+                            batch_size=_config.LOG_BATCH_SIZE, flush_seconds=_config.LOG_FLUSH_SECONDS)
+        return _SINK
+
+
+def log(monitorid: int | None, action: str, level: str, comment: str) -> None:
+    """Queue a row for the log table on the process wide sink. See LogSink.log."""
+    get_sink().log(monitorid, action, level, comment)
+
+
+@_atexit.register
+def shutdown() -> None:
+    """Flush and stop the process wide sink. Registered with atexit."""
+    global _SINK
+    with _SINK_LOCK:
+        Sink, _SINK = _SINK, None
+    if Sink is not None:
+        Sink.close()
+# endregion module methods
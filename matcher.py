@@ -0,0 +1,99 @@
+"""
+Compiled matcher for the match_and and match_or terms of a monitor.
+
+Terms are case-insensitive substrings, spaces included, with two prefixes:
+    !term   negative, the card must not contain term. Allowed in match_and or match_or.
+    =term   whole word, term must be bounded by non-word characters, e.g. '=xt' doesn't match '9070xt'
+These combine, e.g. '!=ti' excludes cards with the word ti.
+
+A card matches when it contains no negative term, every positive match_and term and,
+if there are any positive match_or terms, at least one of them.
+
+All the match_or terms compile into one regex, as do all the negative terms,
+so a card is scanned once for each rather than once per term.
+
+Examples:
+    >>> M = Matcher(('9070xt', '!=oc'), ('sapphire', 'powercolor'))
+    >>> M.match('sapphire pulse 9070xt 16gb')
+    True
+    >>> M.match('sapphire nitro 9070xt oc')
+    False
+"""
+import re as _re
+
+__all__ = ['Matcher']
+
+NEGATE = '!'
+WORD = '='
+
+
+class Matcher:
+    """
+    Compiled match_and and match_or terms.
+
+    Args:
+        and_terms: All positive terms must be found
+        or_terms: At least one positive term must be found, if there are any
+    """
+
+    def __init__(self, and_terms: tuple | list | str = (), or_terms: tuple | list | str = ()):
+        and_pos, and_neg = _split(and_terms)
+        or_pos, or_neg = _split(or_terms)
+
+        # plain substrings are fastest with the in operator, only whole words need a regex
+        self._and_plain = tuple(t for t, word in and_pos if not word)
+        self._and_words = tuple(_re.compile(_pattern(t, True)) for t, word in and_pos if word)
+        self._or = _alternation(or_pos)
+        self._not = _alternation(and_neg + or_neg)
+
+    def match(self, s: str) -> bool:
+        """
+        Does s match.
+
+        Args:
+            s: Lower case text, e.g. from orm_extensions._card_text
+
+        Returns:
+            bool: True if s matches
+        """
+        if self._not is not None and self._not.search(s):
+            return False
+        for t in self._and_plain:
+            if t not in s:
+                return False
+        for R in self._and_words:
+            if not R.search(s):
+                return False
+        return self._or is None or self._or.search(s) is not None
+
+
+# region module helper methods
+def _split(terms: tuple | list | str) -> tuple[list, list]:
+    """Split terms into positive and negative lists of (lower case term, whole word)"""
+    if isinstance(terms, str):
+        terms = (terms,)
+    pos, neg = [], []
+    for t in terms:
+        t = str(t).lower()  # not stripped, ' ti' is an old way of saying the word ti, see WORD
+        negate = t.startswith(NEGATE)
+        if negate:
+            t = t[len(NEGATE):]
+        word = t.startswith(WORD)
+        if word:
+            t = t[len(WORD):]
+        if t:
+            (neg if negate else pos).append((t, word))
+    return pos, neg
+
+
+def _pattern(t: str, word: bool) -> str:
+    return rf'(?<!\w){_re.escape(t)}(?!\w)' if word else _re.escape(t)
+
+
+def _alternation(terms: list) -> _re.Pattern | None:
+    if not terms:
+        return None
+    # longest first so a term that is a prefix of another can't shadow it
+    terms = sorted(terms, key=lambda tw: len(tw[0]), reverse=True)
+    return _re.compile('|'.join(_pattern(t, word) for t, word in terms))
+# endregion module helper methods
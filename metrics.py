@@ -0,0 +1,269 @@
+"""
+Per stage timings of a scrape, and process wide metrics in the Prometheus text format.
+
+Each monitor instance has a StageTimings, filled in as it fetches, normalises, parses, matches
+and writes to the database. Stages are timed with a context manager and accumulate over the pages
+of a run, so a 20 page crawl reports its total fetch time as well as the number of pages fetched.
+
+A price checker cycle is timed in two stages, CYCLE_STAGES: scrape, every due monitor, then notify,
+queueing the alerts found for the outbox to send. Alerts go out once per cycle for all monitors,
+so notify is a stage of the cycle rather than of each monitor run.
+
+Finished runs, notifier sends and price checker cycles are added to the process wide Registry by the
+observe functions. export writes it to config.METRICS_TEXTFILE, e.g. for the node_exporter textfile
+collector, and start serves it at http://METRICS_HOST:METRICS_PORT/metrics.
+Each run is also written to the scrape_run table, see orm.ScrapeRun.
+
+Examples:
+    >>> Timings = StageTimings()
+    >>> with Timings.stage('parse'):
+    ...     soup = BeautifulSoup(src, 'lxml')
+    >>> Timings.seconds
+    {'parse': 0.012}
+    >>> observe_scrape('Currys', Timings, 'ok', products=12)
+    >>> print(render())
+"""
+import atexit as _atexit
+import contextlib as _contextlib
+import os as _os
+import threading as _threading
+import time as _time
+from http.server import BaseHTTPRequestHandler as _BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer as _ThreadingHTTPServer
+
+import config as _config
+
+__all__ = ['CYCLE_STAGES', 'METRICS', 'Registry', 'STAGES', 'StageTimings', 'export', 'get_registry', 'observe_backoff',
+           'observe_budget_wait', 'observe_cycle', 'observe_notify', 'observe_scrape', 'render', 'shutdown', 'start']
+
+STAGES = ('fetch', 'normalise', 'parse', 'match', 'db_write')  # of a monitor run, db_write includes its reads
+CYCLE_STAGES = ('scrape', 'notify')  # of a price checker cycle
+
+# name: (type, help)
+METRICS = {
+    'price_watch_stage_seconds_total': ('counter', 'Seconds spent in each scrape stage'),
+    'price_watch_stage_calls_total': ('counter', 'Times each scrape stage ran, e.g. pages fetched'),
+    'price_watch_scrape_runs_total': ('counter', 'Monitor scrapes by status'),
+    'price_watch_scrape_products_total': ('counter', 'In stock products matched by monitor scrapes'),
+    'price_watch_scrape_last_seconds': ('gauge', 'Seconds the last scrape took, over all stages'),
+    'price_watch_scrape_last_timestamp_seconds': ('gauge', 'Unix time the last scrape finished'),
+    'price_watch_notify_seconds_total': ('counter', 'Seconds spent sending notifications'),
+    'price_watch_notify_total': ('counter', 'Notifications sent by status'),
+    'price_watch_cycle_seconds': ('gauge', 'Seconds the last price checker cycle took'),
+    'price_watch_cycles_total': ('counter', 'Price checker cycles run'),
+    'price_watch_cycle_stage_seconds': ('gauge', 'Seconds each stage of the last price checker cycle took'),
+    'price_watch_host_backoffs_total': ('counter', 'Times each host was backed off after a host error'),
+    'price_watch_host_backoff_seconds': ('gauge', 'Seconds of the current backoff of each host, 0 once it answers again'),
+    'price_watch_host_budget_wait_seconds_total': ('counter', 'Seconds page requests waited for their host request budget'),
+}
+
+
+class StageTimings:
+    """Accumulated seconds and call counts per stage. Thread safe, pages can be fetched concurrently."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self._lock = _threading.Lock()
+
+    @_contextlib.contextmanager
+    def stage(self, name: str):
+        """Time the block as stage name, e.g. 'fetch'. Time is added even if the block raises."""
+        start = _time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, _time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.seconds = {}
+            self.counts = {}
+
+    @property
+    def total(self) -> float:
+        """Seconds over all stages"""
+        with self._lock:
+            return sum(self.seconds.values())
+
+
+class Registry:
+    """
+    Counters and gauges by name and labels, rendered in the Prometheus text format. Thread safe.
+
+    Args:
+        metrics: name: (type, help) of the metrics, see METRICS
+    """
+
+    def __init__(self, metrics: dict[str, tuple[str, str]]):
+        self.metrics = metrics
+        self._values = {}  # name: {labels tuple: value}
+        self._lock = _threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Add value to a counter"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge"""
+        with self._lock:
+            self._values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (type_, help_) in self.metrics.items():
+                if name not in self._values:
+                    continue
+                lines += [f'# HELP {name} {help_}', f'# TYPE {name} {type_}']
+                for key, value in sorted(self._values[name].items()):
+                    labels = ','.join(f'{k}="{_escape(str(v))}"' for k, v in key)
+                    lines.append(f'{name}{{{labels}}} {value!r}' if labels else f'{name} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+
+# region module methods
+_REGISTRY = Registry(METRICS)
+_SERVER: _ThreadingHTTPServer | None = None
+_SERVER_LOCK = _threading.Lock()
+
+
+def get_registry() -> Registry:
+    """Get the process wide registry"""
+    return _REGISTRY
+
+
+def observe_scrape(parser: str, Timings: StageTimings, status: str, products: int = 0) -> None:
+    """
+    Add a finished monitor scrape to the registry.
+
+    Args:
+        parser: Parser name, e.g. 'Currys'
+        Timings: The stage timings of the run
+        status: An EnumScrapeStatus value
+        products: In stock products matched
+    """
+    for stage, seconds in list(Timings.seconds.items()):
+        _REGISTRY.inc('price_watch_stage_seconds_total', seconds, parser=parser, stage=stage)
+        _REGISTRY.inc('price_watch_stage_calls_total', Timings.counts.get(stage, 0), parser=parser, stage=stage)
+    _REGISTRY.inc('price_watch_scrape_runs_total', parser=parser, status=status)
+    _REGISTRY.inc('price_watch_scrape_products_total', products, parser=parser)
+    _REGISTRY.set('price_watch_scrape_last_seconds', Timings.total, parser=parser)
+    _REGISTRY.set('price_watch_scrape_last_timestamp_seconds', _time.time(), parser=parser)
+
+
+def observe_notify(carrier: str, seconds: float, ok: bool) -> None:
+    """Add a notifier send to the registry"""
+    _REGISTRY.inc('price_watch_notify_seconds_total', seconds, carrier=carrier)
+    _REGISTRY.inc('price_watch_notify_total', carrier=carrier, status='ok' if ok else 'error')
+
+
+def observe_cycle(seconds: float, Timings: StageTimings | None = None) -> None:
+    """
+    Add a finished price checker cycle to the registry.
+
+    Args:
+        seconds: Seconds the cycle took
+        Timings: The CYCLE_STAGES timings of the cycle
+    """
+    _REGISTRY.set('price_watch_cycle_seconds', seconds)
+    for stage, seconds_ in list(Timings.seconds.items()) if Timings else []:
+        _REGISTRY.set('price_watch_cycle_stage_seconds', seconds_, stage=stage)
+    _REGISTRY.inc('price_watch_cycles_total')
+
+
+def observe_backoff(host: str, seconds: float) -> None:
+    """Add a host backoff by the scheduler to the registry, seconds is 0 when the host answers again"""
+    if seconds:
+        _REGISTRY.inc('price_watch_host_backoffs_total', host=host)
+    _REGISTRY.set('price_watch_host_backoff_seconds', seconds, host=host)
+
+
+def observe_budget_wait(host: str, seconds: float) -> None:
+    """Add a wait for a host request budget to the registry"""
+    _REGISTRY.inc('price_watch_host_budget_wait_seconds_total', seconds, host=host)
+
+
+def render() -> str:
+    """The process wide metrics in the Prometheus text format"""
+    return _REGISTRY.render()
+
+
+def export(fname: str | None = None) -> None:
+    """
+    Write the metrics to a file, replacing it in one step so a collector never reads half a file.
+
+    Args:
+        fname: The file, defaults to config.METRICS_TEXTFILE. Nothing is written if neither is set.
+    """
+    fname = fname or _config.METRICS_TEXTFILE
+    if not fname:
+        return
+    tmp = f'{fname}.{_os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(render())
+    _os.replace(tmp, fname)
+
+
+def start(port: int | None = None, host: str | None = None) -> None:
+    """
+    Serve the metrics at /metrics on a background thread, once per process.
+
+    Args:
+        port: Port to listen on, defaults to config.METRICS_PORT. Nothing is served if neither is set.
+        host: Address to listen on, defaults to config.METRICS_HOST
+    """
+    global _SERVER
+    port = port or _config.METRICS_PORT
+    if not port:
+        return
+    with _SERVER_LOCK:
+        if _SERVER is not None:
+            return
+        _SERVER = _ThreadingHTTPServer((host or _config.METRICS_HOST, port), _Handler)
+        _SERVER.daemon_threads = True
+        _threading.Thread(target=_SERVER.serve_forever, name='metrics', daemon=True).start()
+
+
+@_atexit.register
+def shutdown() -> None:
+    """Stop the metrics endpoint and write the metrics file a last time. Registered with atexit."""
+    global _SERVER
+    with _SERVER_LOCK:
+        if _SERVER is not None:
+            _SERVER.shutdown()
+            _SERVER.server_close()
+            _SERVER = None
+    export()
+# endregion module methods
+
+
+# region module helper methods
+class _Handler(_BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # quiet, scraped every few seconds
+        pass
+
+
+def _escape(s: str) -> str:
+    return s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+# endregion module helper methods
@@ -0,0 +1,187 @@
+"""
+Stand-in notifier backends, for testing and load testing the alert path without the real carriers.
+
+MockCarrier records messages in process. MockHttpServer is a localhost HTTP stand-in that records
+the messages posted to it, and HttpCarrier is the backend that posts to it, so the network path
+is exercised too. Both can add latency and fail a proportion of messages.
+
+Examples:
+    >>> Mock = MockCarrier(latency_seconds=0.2, failure_rate=0.1)
+    >>> notifier.set_backend(Mock)
+    >>> notifier.send_all('Price Alerts', '9070xt £549.99', ['PushBullet', 'Telegram'])
+    >>> Mock.counts()
+    {'PushBullet': 1, 'Telegram': 1}
+
+    >>> with MockHttpServer(latency_seconds=0.05) as Server:
+    ...     notifier.set_backend(HttpCarrier(Server.url))
+"""
+import json as _json
+import random as _random
+import threading as _threading
+import time as _time
+from dataclasses import dataclass as _dataclass
+from http.server import BaseHTTPRequestHandler as _BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer as _ThreadingHTTPServer
+
+import requests
+
+from errors import MockCarrierError
+
+__all__ = ['HttpCarrier', 'Message', 'MockCarrier', 'MockHttpServer']
+
+
+@_dataclass
+class Message:
+    """A message received by a mock backend"""
+    carrier: str
+    title: str
+    body: str
+    received: float  # time.time()
+
+
+class _Recorder:
+    """Latency, failure injection and the thread safe record of messages shared by the mock backends"""
+
+    def __init__(self, latency_seconds: float = 0, jitter_seconds: float = 0, failure_rate: float = 0, seed: int | None = None):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.failure_rate = failure_rate
+        self.failures = 0
+        self._messages = []
+        self._random = _random.Random(seed)
+        self._lock = _threading.Lock()
+
+    def receive(self, carrier: str, title: str, body: str) -> bool:
+        """Wait the latency, then record the message. Returns False for an injected failure, which isn't recorded."""
+        with self._lock:
+            delay = self.latency_seconds + self._random.uniform(0, self.jitter_seconds)
+            fail = self._random.random() < self.failure_rate
+        if delay:
+            _time.sleep(delay)
+        with self._lock:
+            if fail:
+                self.failures += 1
+                return False
+            self._messages.append(Message(carrier, title, body, _time.time()))
+            return True
+
+    @property
+    def messages(self) -> list[Message]:
+        """Messages received so far, oldest first"""
+        with self._lock:
+            return list(self._messages)
+
+    def counts(self) -> dict[str, int]:
+        """carrier: messages received"""
+        counts = {}
+        for M in self.messages:
+            counts[M.carrier] = counts.get(M.carrier, 0) + 1
+        return counts
+
+    def clear(self) -> None:
+        with self._lock:
+            self._messages = []
+            self.failures = 0
+
+
+class MockCarrier(_Recorder):
+    """
+    In process backend for notifier.set_backend.
+
+    Args:
+        latency_seconds: Time each message takes to send
+        jitter_seconds: Up to this much is added to latency_seconds, at random
+        failure_rate: Proportion of messages that fail with MockCarrierError, e.g. 0.1
+        seed: Random seed, for repeatable failures and jitter
+    """
+
+    def deliver(self, carrier: str, title: str, body: str) -> None:
+        """Send a message, see notifier.deliver"""
+        if not self.receive(carrier, title, body):
+            raise MockCarrierError(f'Injected {carrier} failure')
+
+
+class MockHttpServer(_Recorder):
+    """
+    Localhost HTTP stand-in for the carriers, for use with HttpCarrier.
+
+    Accepts POST / with a JSON body of carrier, title and body. Replies 200, or 503 for an injected failure.
+    Runs on a background thread between start and close, or as a context manager.
+
+    Args:
+        host: Address to listen on
+        port: Port to listen on, 0 picks a free port
+        latency_seconds: Time each request takes
+        jitter_seconds: Up to this much is added to latency_seconds, at random
+        failure_rate: Proportion of requests that fail with a 503
+        seed: Random seed, for repeatable failures and jitter
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_seconds: float = 0,
+                 jitter_seconds: float = 0, failure_rate: float = 0, seed: int | None = None):
+        super().__init__(latency_seconds, jitter_seconds, failure_rate, seed)
+        self._server = _ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = _threading.Thread(target=self._server.serve_forever, name='mock_notifier', daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self) -> 'MockHttpServer':
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'MockHttpServer':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class HttpCarrier:
+    """
+    Backend for notifier.set_backend that posts every message to a MockHttpServer, over a pooled session.
+
+    Args:
+        url: MockHttpServer.url
+        timeout: Request timeout in seconds
+    """
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def deliver(self, carrier: str, title: str, body: str) -> None:
+        """Send a message, see notifier.deliver. Raises requests.HTTPError for an injected failure."""
+        self._session.post(self.url, json={'carrier': carrier, 'title': title, 'body': body}, timeout=self.timeout).raise_for_status()
+
+    def close(self) -> None:
+        self._session.close()
+
+
+# region module helper methods
+def _handler(Server: MockHttpServer) -> type:
+    class _Handler(_BaseHTTPRequestHandler):
+        def do_POST(self):  # noqa
+            try:
+                data = _json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                ok = Server.receive(data['carrier'], data.get('title', ''), data.get('body', ''))
+                status = 200 if ok else 503
+            except (ValueError, KeyError):
+                status = 400
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):  # quiet, this is hit thousands of times in a load test
+            pass
+
+    return _Handler
+# endregion module helper methods
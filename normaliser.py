@@ -0,0 +1,99 @@
+"""
+Single pass, table driven normaliser for page sources.
+
+Model numbers are written inconsistently across sites, e.g. '9070 XT', '9070 Xt' and '9070xt'.
+We close them up to the lower case form, e.g. '9070xt', so match terms only need one spelling.
+
+Rules are plain data. Each rule has numbers and suffixes and closes up '<number> <suffix>'
+to '<number><suffix in lower case>'. Suffixes are matched case sensitively, so only the spellings
+listed are replaced. All rules compile into one regex and the source is scanned once.
+
+Set config.SOURCE_FIX_RULES to a list of rules in the same format to replace DEFAULT_RULES.
+
+Examples:
+    >>> Normaliser().normalise('Sapphire 9070 XT and RTX 5070 Ti')
+    'Sapphire 9070xt and RTX 5070ti'
+"""
+import re as _re
+
+__all__ = ['DEFAULT_RULES', 'Normaliser']
+
+
+DEFAULT_RULES = [
+    {  # AMD RX 5000-7000 series
+        'numbers': ['5600', '5700', '5800', '5900',
+                    '6600', '6700', '6800', '6900',
+                    '7600', '7700', '7800', '7900'],
+        'suffixes': ['xtx', 'XTX', 'Xtx', 'xt', 'XT', 'Xt']
+    },
+    {  # AMD RX 9000 series
+        'numbers': ['9060', '9070'],
+        'suffixes': ['xt', 'XT', 'Xt']
+    },
+    {  # nVidia RTX 3000-6000 series
+        'numbers': ['3050', '3060', '3070', '3080', '3090',
+                    '4050', '4060', '4070', '4080', '4090',
+                    '5050', '5060', '5070', '5080', '5090',
+                    '6050', '6060', '6070', '6080', '6090'],
+        'suffixes': ['ti', 'TI', 'Ti']
+    },
+]
+
+
+class Normaliser:
+    """
+    Compiled normalisation rules.
+
+    The regex only matches the last character of a number, the space and a suffix.
+    The rest of the number is then looked up in the table from the match position,
+    so numbers inside longer digit runs are closed up exactly as a str.replace would.
+
+    Args:
+        rules: List of dicts with keys numbers and suffixes, defaults to DEFAULT_RULES
+    """
+
+    def __init__(self, rules: list[dict] | None = None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self._table = {}  # (number, suffix): replacement suffix
+        for rule in self.rules:
+            for number in rule['numbers']:
+                for suffix in rule['suffixes']:
+                    self._table.setdefault((number, suffix), suffix.lower())
+
+        self._number_lengths = sorted({len(n) for n, _ in self._table}, reverse=True)
+        self._suffix_lengths = sorted({len(s) for _, s in self._table}, reverse=True)
+        if not self._table:
+            self._re = None
+            return
+        # Longest suffix first, so 'xtx' wins over 'xt' at the same position
+        suffixes = sorted({s for _, s in self._table}, key=len, reverse=True)
+        last_chars = ''.join(sorted({n[-1] for n, _ in self._table}))
+        self._re = _re.compile(f'[{_re.escape(last_chars)}] ({"|".join(_re.escape(s) for s in suffixes)})')
+
+    def normalise(self, source: str) -> str:
+        """
+        Normalise source in a single pass.
+
+        Args:
+            source: Page source
+
+        Returns:
+            str: The normalised source
+        """
+        if self._re is None:
+            return source
+        return self._re.sub(self._replace, source)
+
+    def _replace(self, m: _re.Match) -> str:
+        source, start, suffix = m.string, m.start(), m.group(1)
+        for n in self._number_lengths:
+            if start - n + 1 < 0:
+                continue
+            number = source[start - n + 1:start + 1]
+            for length in self._suffix_lengths:
+                if length > len(suffix):
+                    continue
+                replacement = self._table.get((number, suffix[:length]))
+                if replacement is not None:
+                    return f'{number[-1]}{replacement}{suffix[length:]}'
+        return m.group(0)
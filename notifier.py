@@ -1,14 +1,30 @@
-import requests
+"""
+Notifications to the carriers configured in config.py.
+
+Carrier clients (the Pushbullet and Twilio clients, and an HTTP session for Telegram) are created
+on first use and kept for the life of the process. send_all sends to several carriers at once
+on a small thread pool and returns straight away, so a slow carrier never holds up the caller.
+
+set_backend swaps the real carriers for a stand-in, see mock_notifier.
+
+Examples:
+    >>> send_all('Price Alerts', '9070xt £549.99', [EnumNotifiers.PushBullet.value, EnumNotifiers.Telegram.value])
+"""
+import atexit as _atexit
+import threading as _threading
+import time as _time
 from abc import ABC as _ABC
+from concurrent.futures import Future as _Future
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
 
 import fuckit as _fuckit
+import requests
 
-import funclite.stringslib as _stringslib
-
-from orm import Log as _Log
+import log_sink as _log_sink
+import metrics as _metrics
 from enums import *
 
-__all__ = ['PushBullet', 'Telegram', 'WhatsApp', 'TwilioSMS']
+__all__ = ['PushBullet', 'Telegram', 'WhatsApp', 'TwilioSMS', 'deliver', 'send_all', 'set_backend', 'shutdown']
 try:
     import pywhatkit as _pywhatkit  # noqa
 except ImportError:
@@ -21,12 +37,6 @@ except ImportError:
     print('Failed to import pushbullet.')
     _Pushbullet = None
 
-try:
-    from pushbullet import Pushbullet as _Pushbullet
-except ImportError:
-    print('Failed to import pushbullet.')
-    _Pushbullet = None
-
 try:
     from twilio.rest import Client as _TwilioClient
 except ImportError:
@@ -57,18 +67,25 @@ class Telegram(_ABC):
              body(str): The string of the message to be sent
              monitorid(int): The monitorid of the chat, this is optional and is used for logging purposes
         """
-        message = f'{title}\n\n{body}'
         try:
-            data = {
-                "chat_id": _config.Telegram.chat_id,
-                "text": message
-            }
-            headers = {'Content-Type': 'application/json'}
-            url = f"https://api.telegram.org/bot{_config.Telegram.bot_token}/sendMessage"
-            requests.post(url, json=data, headers=headers)
+            deliver(EnumNotifiers.Telegram.value, title, body)
         except Exception as e:
             _logit('Telegram', monitorid, e)
 
+    @staticmethod
+    def _send(title: str, body: str) -> None:
+        """As send, but raises on failure, including an HTTP error status"""
+        data = {
+            "chat_id": _config.Telegram.chat_id,
+            "text": f'{title}\n\n{body}'
+        }
+        url = f"https://api.telegram.org/bot{_config.Telegram.bot_token}/sendMessage"
+        try:
+            _client('Telegram', _telegram_session).post(url, json=data, timeout=_config.NOTIFIER_TIMEOUT_SECONDS).raise_for_status()
+        except Exception:
+            _client_drop('Telegram')  # e.g. a dropped connection, start a fresh session next time
+            raise
+
 
 class WhatsApp(_ABC):
     """
@@ -82,10 +99,16 @@ class WhatsApp(_ABC):
     @staticmethod
     def send(message: str, monitorid: int = None) -> None:
         try:
-            _pywhatkit.sendwhatmsg_instantly(_config.WhatsApp.phone_nr, message, 0, True)
+            deliver(EnumNotifiers.WhatsApp.value, '', message)
         except Exception as e:
             _logit('WhatsApp', monitorid, e)
 
+    @staticmethod
+    def _send(title: str, body: str) -> None:
+        """As send, but with a title for consistency with the other carriers, and raises on failure"""
+        message = f'{title}\n\n{body}' if title else body
+        _pywhatkit.sendwhatmsg_instantly(_config.WhatsApp.phone_nr, message, 0, True)
+
 
 class PushBullet(_ABC):
     """
@@ -98,11 +121,20 @@ class PushBullet(_ABC):
     @staticmethod
     def send(title: str, body: str, monitorid: int = None) -> None:
         try:
-            Pb = _Pushbullet(_config.Pushbullet.token)
-            Pb.push_note(title, body)
+            deliver(EnumNotifiers.PushBullet.value, title, body)
         except Exception as e:
             _logit('PushBullet', monitorid, e)
 
+    @staticmethod
+    def _send(title: str, body: str) -> None:
+        """As send, but raises on failure"""
+        try:
+            Pb = _client('PushBullet', lambda: _Pushbullet(_config.Pushbullet.token))
+            Pb.push_note(title, body)
+        except Exception:
+            _client_drop('PushBullet')  # e.g. a revoked token or dropped connection, start afresh next time
+            raise
+
 
 class TwilioSMS(_ABC):
     """
@@ -127,26 +159,170 @@ class TwilioSMS(_ABC):
         Returns:
             None
         """
+        try:
+            deliver(EnumNotifiers.TwilioSMS.value, title, body)
+        except Exception as e:
+            _logit('TwilioSMS', monitorid, e)
+
+    @staticmethod
+    def _send(title: str, body: str) -> None:
+        """As send, but raises on failure"""
         message = f'{title}\n\n{body}'
         try:
-            TC = _TwilioClient(_config.TwilioSMS.account_sid, _config.TwilioSMS.auth_token)
+            TC = _client('TwilioSMS', lambda: _TwilioClient(_config.TwilioSMS.account_sid, _config.TwilioSMS.auth_token))
             M = TC.messages.create(body=message, to=_config.TwilioSMS.send_to_phone, from_=_config.TwilioSMS.send_from_phone)
             print(M.body)
-        except Exception as e:
-            _logit('TwilioSMS', monitorid, e)
+        except Exception:
+            _client_drop('TwilioSMS')
+            raise
+
+
+# region module methods
+_CLIENTS = {}  # carrier: long-lived client, see _client
+_CLIENTS_LOCK = _threading.Lock()
+_EXECUTOR: _ThreadPoolExecutor | None = None
+_EXECUTOR_LOCK = _threading.Lock()
+_BACKEND = None  # see set_backend
+
+
+def send_all(title: str, body: str, carriers: list[str] | None = None, monitorid: int = None) -> list[_Future]:
+    """
+    Send a notification to several carriers concurrently, without waiting for them.
+
+    Each carrier logs its own failures, as its send method does.
+
+    Args:
+        title: Title of the message, concatenated with body for carriers without titles
+        body: Body of the message
+        carriers: EnumNotifiers (or EnumAlertCarriers) values, defaults to config.NOTIFIERS
+        monitorid: Monitorid, used for logging purposes
+
+    Returns:
+        list[Future]: One future per carrier sent to, for callers that do want to wait
+    """
+    if carriers is None:
+        carriers = [n.value for n in _config.NOTIFIERS]
+    Executor = _executor()
+    futures = []
+    for carrier in dict.fromkeys(carriers):  # dedupe, keeping order
+        if carrier not in _CARRIERS:
+            _logit(carrier, monitorid, ValueError(f'Unknown notifier {carrier}'))
+            continue
+        futures.append(Executor.submit(_send_logged, carrier, title, body, monitorid))
+    return futures
+
+
+def deliver(carrier: str, title: str, body: str) -> None:
+    """
+    Send a notification to one carrier and wait for it. Unlike the send methods, failures are raised
+    rather than logged, so the caller can retry, e.g. outbox.
+
+    Args:
+        carrier: An EnumNotifiers (or EnumAlertCarriers) value
+        title: Title of the message, concatenated with body for carriers without titles
+        body: Body of the message
+
+    Raises:
+        ValueError: If carrier is unknown
+        Exception: Whatever the carrier raised
+    """
+    Carrier = _CARRIERS.get(carrier)
+    if Carrier is None:
+        raise ValueError(f'Unknown notifier {carrier}')
+    start, ok = _time.perf_counter(), False
+    try:
+        if _BACKEND is not None:
+            _BACKEND.deliver(carrier, title, body)
+        else:
+            Carrier._send(title, body)  # noqa
+        ok = True
+    finally:
+        _metrics.observe_notify(carrier, _time.perf_counter() - start, ok)
+
+
+def set_backend(backend) -> object | None:
+    """
+    Send every notification through backend instead of the real carriers, e.g. mock_notifier.MockCarrier
+    for testing. Every send, send_all and deliver goes through backend.deliver.
+
+    Args:
+        backend: Object with a deliver(carrier, title, body) method that raises on failure, or None for the real carriers
+
+    Returns:
+        The previous backend, or None
+    """
+    global _BACKEND
+    previous, _BACKEND = _BACKEND, backend
+    return previous
+
+
+@_atexit.register
+def shutdown() -> None:
+    """Wait for notifications in flight, then close the carrier clients. Registered with atexit."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        Executor, _EXECUTOR = _EXECUTOR, None
+    if Executor is not None:
+        Executor.shutdown(wait=True)
+    for carrier in list(_CLIENTS):
+        _client_drop(carrier)
+# endregion module methods
 
 
 # region helper methods
+_CARRIERS = {  # carrier: namespace class with _send(title, body)
+    EnumNotifiers.PushBullet.value: PushBullet,
+    EnumNotifiers.Telegram.value: Telegram,
+    EnumNotifiers.TwilioSMS.value: TwilioSMS,
+    EnumAlertCarriers.SMS_Twilio.value: TwilioSMS,
+    EnumNotifiers.WhatsApp.value: WhatsApp,
+}
+
+
+def _send_logged(carrier: str, title: str, body: str, monitorid: int | None) -> None:
+    try:
+        deliver(carrier, title, body)
+    except Exception as e:
+        _logit(carrier, monitorid, e)
+
+
+def _client(carrier: str, factory):
+    """Get the long-lived client for carrier, creating it with factory() on first use"""
+    with _CLIENTS_LOCK:
+        Client = _CLIENTS.get(carrier)
+        if Client is None:
+            Client = _CLIENTS[carrier] = factory()
+        return Client
+
+
+def _client_drop(carrier: str) -> None:
+    """Forget the client for carrier, closing it if it can be closed"""
+    with _CLIENTS_LOCK:
+        Client = _CLIENTS.pop(carrier, None)
+    if hasattr(Client, 'close'):
+        with _fuckit:
+            Client.close()
+
+
+def _telegram_session() -> requests.Session:
+    Session = requests.Session()
+    Session.headers.update({'Content-Type': 'application/json'})
+    return Session
+
+
+def _executor() -> _ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = _ThreadPoolExecutor(max_workers=_config.NOTIFIER_MAX_WORKERS, thread_name_prefix='notify')
+        return _EXECUTOR
+
+
 def _logit(notifier: str, monitorid: int | None, e: Exception) -> None:
+    comment = f'Failed to send {notifier} notification for monitorid {monitorid}.\n\nThe error was:\n{repr(e)}'
     with _fuckit:
-        Log_ = _Log()  # noqa
-        Log_.monitorid = monitorid  # noqa
-        Log_.action = f'{self.parser} {EnumLogAction.Notify.value}'  # noqa
-        Log_.level = EnumLogLevel.ERROR.value  # noqa
-        Log_.when = _stringslib.pretty_date_now(with_time=True)
-        Log_.comment = f'Failed to send {notifier} notification for monitorid {monitorid}.\n\nThe error was:\n{repr(e)}'  # noqa
-        Log_.save()
-        print(Log_.comment)
+        _log_sink.log(monitorid, f'{notifier} {EnumLogAction.Notify.value}', EnumLogLevel.ERROR.value, comment)
+    print(comment)
 # endregion helper methods
 
 
@@ -1,11 +1,27 @@
 from peewee import *
+from playhouse.pool import PooledSqliteDatabase
 
 import config as _config
 import funclite.stringslib as _stringslib
 
-_all_ = ['Alert', 'DATABASE', 'Log', 'Monitor', 'MonitorHistory', 'Product']
+_all_ = ['Alert', 'DATABASE', 'Log', 'Monitor', 'MonitorHistory', 'MonitorLatestPrice', 'Outbox', 'Product', 'ScrapeRun']
 
-DATABASE = SqliteDatabase(_config.DB_PATH, pragmas={'foreign_keys': 1})
+# Production profile. WAL lets the scrapers, alert sender and log writer read while another thread writes,
+# synchronous=NORMAL is safe with WAL and saves an fsync per commit, busy_timeout waits on a lock rather than failing.
+PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 1,  # NORMAL
+    'cache_size': -1024 * _config.DB_CACHE_MB,  # negative is KiB
+    'mmap_size': 1024 * 1024 * _config.DB_MMAP_MB,
+    'busy_timeout': 1000 * _config.DB_BUSY_TIMEOUT_SECONDS,
+    'foreign_keys': 1
+}
+
+# One shared database for the whole process. Connections are pooled and handed out per thread,
+# so worker threads should wrap their work in DATABASE.connection_context() to return them.
+DATABASE = PooledSqliteDatabase(_config.DB_PATH, pragmas=PRAGMAS,
+                                max_connections=_config.DB_MAX_CONNECTIONS, stale_timeout=300,
+                                timeout=_config.DB_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
 
 
 class BaseModel(Model):
@@ -26,11 +42,15 @@ class Monitor(BaseModel):
     supplier = CharField(50)  # TEXT (50)
     parser = CharField(50)  # TEXT (50)
     url = CharField(8096)  # TEXT (8096)
-    last_run = CharField(30, null=True)  # TEXT (30)
+    last_run = DateTimeField(null=True)  # TEXT (30), stored as sortable ISO 8601
+    next_run = DateTimeField(null=True)  # TEXT (30), when the scheduler next scrapes the monitor, null for now
+    last_error = CharField(8096, null=True)  # TEXT (8096), repr of the last scrape error, see scheduler
+    last_error_when = DateTimeField(null=True)  # TEXT (30)
     match_and = CharField(1024, constraints=[SQL("DEFAULT ''")])  # TEXT (1024)
     match_or = CharField(1024, constraints=[SQL("DEFAULT ''")])  # TEXT (1024)
     disable_alerts = IntegerField(constraints=[SQL("DEFAULT 0")])
     disable = IntegerField(constraints=[SQL("DEFAULT 0")])
+    fetch_mode = CharField(20, default='selenium', constraints=[SQL("DEFAULT 'selenium'")])  # see enums.EnumFetchMode
 
     class Meta:
         table_name = 'monitor'
@@ -39,18 +59,21 @@ class Log(BaseModel):
     logid = AutoField(primary_key=True)
     monitorid = ForeignKeyField(column_name='monitorid', field='monitorid', model=Monitor, null=True)
     action = CharField(255)  # TEXT (255)
-    when = CharField(30)  # TEXT (30)
+    when = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
     comment = CharField(8096)  # TEXT (8096)
     level = CharField(30)
 
     class Meta:
         table_name = 'log'
+        indexes = (
+            (('when',), False),
+        )
 
 
 class MonitorHistory(BaseModel):
     monitor_historyid = AutoField(primary_key=True)
     monitorid = ForeignKeyField(column_name='monitorid', field='monitorid', model=Monitor)
-    date_when = CharField(30)  # TEXT (30)
+    date_when = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
     product_title = CharField(255, constraints=[SQL("DEFAULT ''")])  # The product_title will be the cheapest variation of the product found, so the productid might be Radeon 9070 xt, but the title could be 'Gigabyte Radeon 9070 xt OC 16GB'
     product_url = CharField(8096, constraints=[SQL("DEFAULT ''")])  # TEXT (8096)
     price = FloatField()
@@ -60,14 +83,29 @@ class MonitorHistory(BaseModel):
         table_name = 'monitor_history'
         indexes = (
             (('monitorid', 'date_when'), True),
+            (('monitorid', 'product_url', 'date_when'), False),  # latest price per product
+            (('alert_sent',), False),
         )
 
 
+class MonitorLatestPrice(BaseModel):
+    """Latest monitor_history price per monitor and product, kept up to date by MonitorBaseMixin._history_flush"""
+    monitorid = ForeignKeyField(column_name='monitorid', field='monitorid', model=Monitor)
+    product_url = CharField(8096)  # TEXT (8096)
+    price = FloatField()
+    product_title = CharField(255, constraints=[SQL("DEFAULT ''")])
+    date_when = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
+
+    class Meta:
+        table_name = 'monitor_latest_price'
+        primary_key = CompositeKey('monitorid', 'product_url')
+
+
 class Alert(BaseModel):
     alertid = AutoField(primary_key=True)
     monitor_historyid = ForeignKeyField(column_name='monitor_historyid', field='monitor_historyid', model=MonitorHistory)
     carrier = CharField(50)
-    date_sent = CharField(30)
+    date_sent = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
     archived = IntegerField(constraints=[SQL("DEFAULT 0")])
     product_title = CharField(255)  # The product_title will be the cheapest variation of the product found, so the productid might be Radeon 9070 xt, but the title could be 'Gigabyte Radeon 9070 xt OC 16GB'
     price = FloatField()
@@ -79,6 +117,55 @@ class Alert(BaseModel):
 
 
 
+class Outbox(BaseModel):
+    """Notifications waiting to be sent, and their outcome. Written by outbox.enqueue, sent by outbox.Dispatcher"""
+    outboxid = AutoField(primary_key=True)
+    carrier = CharField(50)  # see enums.EnumNotifiers
+    title = CharField(255)
+    body = CharField(8096)  # TEXT (8096)
+    monitorid = IntegerField(null=True)  # for logging only
+    status = CharField(20, default='pending', constraints=[SQL("DEFAULT 'pending'")])  # see enums.EnumOutboxStatus
+    attempts = IntegerField(default=0, constraints=[SQL("DEFAULT 0")])
+    created = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
+    next_attempt = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
+    sent = DateTimeField(null=True)  # TEXT (30), stored as sortable ISO 8601
+    error = CharField(8096, null=True)  # the last error
+
+    class Meta:
+        table_name = 'outbox'
+        indexes = (
+            (('status', 'carrier', 'next_attempt'), False),
+        )
+
+
+class ScrapeRun(BaseModel):
+    """One row per monitor scrape, with the seconds spent in each stage. Written by MonitorBaseMixin.scrape, see metrics"""
+    scrape_runid = AutoField(primary_key=True)
+    monitorid = ForeignKeyField(column_name='monitorid', field='monitorid', model=Monitor)
+    parser = CharField(50)
+    supplier = CharField(50)
+    started = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
+    finished = DateTimeField()  # TEXT (30), stored as sortable ISO 8601
+    status = CharField(20)  # see enums.EnumScrapeStatus
+    pages = IntegerField(constraints=[SQL("DEFAULT 0")])  # pages fetched
+    products = IntegerField(constraints=[SQL("DEFAULT 0")])  # in stock products matched
+    changed = IntegerField(constraints=[SQL("DEFAULT 0")])  # monitor_history rows written, new or changed prices
+    fetch_seconds = FloatField(constraints=[SQL("DEFAULT 0")])
+    normalise_seconds = FloatField(constraints=[SQL("DEFAULT 0")])
+    parse_seconds = FloatField(constraints=[SQL("DEFAULT 0")])
+    match_seconds = FloatField(constraints=[SQL("DEFAULT 0")])
+    db_write_seconds = FloatField(constraints=[SQL("DEFAULT 0")])
+    total_seconds = FloatField(constraints=[SQL("DEFAULT 0")])
+    error = CharField(8096, null=True)
+
+    class Meta:
+        table_name = 'scrape_run'
+        indexes = (
+            (('monitorid', 'started'), False),
+            (('started',), False),
+        )
+
+
 class SqliteSequence(BaseModel):
     name = BareField(null=True)
     seq = BareField(null=True)
@@ -4,23 +4,39 @@ Enables us to regenerate the model using pwiz then set the classes to
 inherit from these extensions
 """
 import ast as _ast
-import requests
+import functools as _functools
 import random as _random
+import threading as _threading
+from collections import deque as _deque
+from collections.abc import Iterator as _Iterator
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from datetime import datetime as _datetime
+from datetime import timedelta as _timedelta
+from itertools import islice as _islice
 from time import sleep as _sleep
 from urllib.parse import urlparse as _urlparse
 
-from bs4 import BeautifulSoup
-from seleniumbase import SB as _SB
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 import fuckit as _fuckit
 from peewee import *  # noqa
 
 import funclite.stringslib as _stringslib
 
+import browser_pool as _browser_pool
+import config as _config
 import errors as _errors
+import fixtures as _fixtures
+import http_fetch as _http_fetch
+import log_sink as _log_sink
+import matcher as _matcher
+import metrics as _metrics
+import normaliser as _normaliser
+import outbox as _outbox
+import page_cache as _page_cache
+import parser_specs as _parser_specs
+import scheduler as _scheduler
 from enums import *
 from orm import *
-from notifier import PushBullet as _PushBullet
-from notifier import WhatsApp as _WhatsApp
 
 __all__ = ['Argos', 'AWDIT', 'AlertExt',
             'Box',
@@ -30,23 +46,89 @@ __all__ = ['Argos', 'AWDIT', 'AlertExt',
            'RyobiSingleProduct',
            'Scan',
            'ScrewfixSingleProduct',
-           'ToolStationSingleProduct'
+           'ToolStationSingleProduct',
+           'spec_parser'
            ]
 
+try:
+    import lxml  # noqa
+    _PARSER = 'lxml'
+except ImportError:
+    print('Failed to import lxml. Falling back to html.parser.')
+    _PARSER = 'html.parser'
+
+_NORMALISER = _normaliser.Normaliser(_config.SOURCE_FIX_RULES)
+
+_HOST_SEMAPHORES: dict[str, _threading.Semaphore] = {}
+_HOST_SEMAPHORES_LOCK = _threading.Lock()
+
 
 class MonitorBaseMixin:
     """Implements reusable code for specific monitor instances"""
 
+    PRODUCT_CONTAINER: tuple = ()  # find_all args for a product card, e.g. ('div', 'productitem')
+
     # region instance methods
     def __init__(self, *args, **kwargs):
-        self._soups = []
+        self._price_alert_threshold = None
+        self._history = {}  # product_url: monitor_history row, buffered by _scrape_product until _history_flush
+        self._latest_prices = None  # product_url: latest price, loaded from monitor_latest_price once per run
+        self._page_hashes = {}  # url: body hash of pages fetched this run, marked as seen in the page cache on success
+        self._unchanged_pages = set()
+        self._timings = _metrics.StageTimings()  # seconds per stage of the last run, see metrics
+        self._error = None  # the last error logged by _log_scraping_error this run
+        self._profiler = None  # set by profiling.Profiler.scrape while the run is profiled
         super().__init__(*args, **kwargs)  # passed to orm.Monitor constructor
 
-    def scrape(self, price: float, product_url: str, product_title: str) -> None:
+    def scrape(self) -> None:
+        """
+        Scrape every page of the monitor, driven by the selector spec of the parser, see parser_specs.
+
+        Pages are fetched, parsed and scraped one at a time, see soups, so memory stays flat however many pages there are.
+        Cards that match match_and and match_or and are in stock are recorded by _scrape_product,
+        then written to monitor_history in one transaction by _history_flush at the end of the run.
+        Errors are logged rather than raised. Time spent in each stage is in _timings,
+        and is written to scrape_run and the process wide metrics, see metrics.
+        match is the time spent on the cards alone, the database reads it needs are loaded first under db_write.
         """
-        Scrape the cheapest price and the product link which has that price.
+        self._timings.clear()
+        self._error = None
+        started, products, changed = _datetime.now(), 0, 0
+        self._log_scrape_started()
+        try:
+            Spec = self.spec
+            with self._timings.stage('db_write'):
+                self.price_alert_threshold, self.latest_prices  # noqa, read once per run, used by _scrape_product
+            for soup in self.soups:
+                products += self._scrape_soup(Spec, soup)
+                if self._profiler is not None:
+                    self._profiler.page(self)  # while the soup is still held
+                del soup  # don't hold this page while the next is fetched
+        except Exception as e:
+            self._log_scraping_error(e)
+            return
+        finally:
+            changed = self._history_flush()
+            self._scrape_run_save(started, products, changed)
+        self._log_scrape_complete()
+
+    def _scrape_soup(self, Spec: _parser_specs.ParserSpec, soup: BeautifulSoup) -> int:
+        """Record the matching, in stock cards on a page with _scrape_product. Returns the number recorded."""
+        products = 0
+        with self._timings.stage('match'):
+            for product in Spec.cards(soup):
+                s = _card_text(product)
+                if self._match(s) and Spec.in_stock(s):
+                    products += 1
+                    self._scrape_product(Spec.price(product), Spec.product_url(product, self.url, self.site), Spec.title(product))  # noqa
+        return products
+
+    def _scrape_product(self, price: float, product_url: str, product_title: str) -> None:
+        """
+        Record a product found by scrape, if it is under the price alert threshold.
 
         The base class handles updating the database tables monitor, monitor_history and logging.
+        Rows are buffered and written in one transaction by _history_flush at the end of the monitor run.
 
         Args:
             price (float): Price of the product.
@@ -58,50 +140,92 @@ class MonitorBaseMixin:
         # Common code to insert monitor history rows. Each scrape event in the inheriting classes
         # can have multiple products below the price threshold for a single monitor. e.g. when looking for bargain 9070xt
         # We only add an alert if the price has changed for the same monitor and the same product AS IDENTIFIED BY ITS URL
-        
-        # No need to capture and logs error here, this is wrapped in a try-catch in child scrape method
-        add_ = True
-        P = Product.get(Product.productid == self.productid)  # noqa
-        product_title = _clean_str(product_title)
-        if price and price <= P.price_alert_threshold:
-            MHCheck = MonitorHistory.select().where(
-                MonitorHistory.monitorid == self.monitorid,  # noqa
-                MonitorHistory.product_url == product_url).order_by(MonitorHistory.date_when.desc()).limit(1)
-
-            for Row in MHCheck:
-                if Row.price != price:
-                    DATABASE.execute_sql('update monitor_history set alert_sent=1 where monitorid=? and product_url=?',
-                                         (self.monitorid, product_url))  # noqa
-                else:
-                    add_ = False
 
-            if add_:
-                MH = MonitorHistory()
-                MH.monitorid = self.monitorid  # noqa
-                MH.price = price
-                MH.product_url = product_url
-                MH.product_title = product_title
-                MH.date_when = _stringslib.pretty_date_now(with_time=True)
-                MH.save()
+        # No need to capture and logs error here, this is wrapped in a try-catch in scrape
+        if price and price <= self.price_alert_threshold:
+            if product_url in self._history:  # same product listed twice, e.g. on two pages. Keep the first.
+                return
+            if self.latest_prices.get(product_url) == price:  # unchanged, nothing to write
+                return
+            self._history[product_url] = {'monitorid': self.monitorid,  # noqa
+                                          'price': price,
+                                          'product_url': product_url,
+                                          'product_title': _clean_str(product_title),
+                                          'date_when': _datetime.now()}
+
+    def _history_flush(self) -> int:
+        """
+        Write the monitor_history rows buffered by scrape in a single transaction.
+        Returns the number of rows written.
+
+        _scrape_product only buffers products which are new or whose price has changed since latest_prices was loaded.
+        Each is inserted, the earlier rows for a changed product are flagged alert_sent,
+        and monitor_latest_price is upserted to match.
+        Errors are logged and the pages of this run are not marked as seen in the page cache,
+        so they are scraped again next time.
+        """
+        rows, self._history = self._history, {}
+        latest, self._latest_prices = self._latest_prices or {}, None  # reloaded next run
+        if not rows:
+            return 0
+
+        try:
+            with self._timings.stage('db_write'), DATABASE.atomic():
+                inserts = list(rows.values())
+                for prev, row in zip(inserts, inserts[1:]):  # (monitorid, date_when) is unique, cards can be microseconds apart
+                    if row['date_when'] <= prev['date_when']:
+                        row['date_when'] = prev['date_when'] + _timedelta(microseconds=1)
+                changed = [url for url in rows if url in latest]
+                for urls in chunked(changed, 500):  # stay under the sqlite variable limit
+                    (MonitorHistory
+                     .update(alert_sent=1)
+                     .where(MonitorHistory.monitorid == self.monitorid, MonitorHistory.product_url.in_(urls))  # noqa
+                     .execute())
+                for batch in chunked(inserts, 100):
+                    MonitorHistory.insert_many(batch).execute()
+                    MonitorLatestPrice.insert_many(batch).on_conflict_replace().execute()
+            return len(inserts)
+        except Exception as e:
+            self._page_hashes = {}
+            self._log_scraping_error(e)
+            return 0
+
+    def _scrape_run_save(self, started: _datetime, products: int, changed: int) -> None:
+        """
+        Write the scrape_run row for this run and add it to the process wide metrics, see metrics.
+
+        Args:
+            started: When the run started
+            products: In stock products matched
+            changed: monitor_history rows written
+        """
+        Timings = self._timings
+        status = EnumScrapeStatus.Error.value if self._error else EnumScrapeStatus.Ok.value
+        _metrics.observe_scrape(self.parser, Timings, status, products)  # noqa
+        try:
+            ScrapeRun.insert(monitorid=self.monitorid, parser=self.parser, supplier=self.supplier,  # noqa
+                             started=started, finished=_datetime.now(), status=status,
+                             pages=Timings.counts.get('fetch', 0), products=products, changed=changed,
+                             total_seconds=Timings.total, error=repr(self._error) if self._error else None,
+                             **{f'{stage}_seconds': Timings.seconds.get(stage, 0) for stage in _metrics.STAGES}).execute()
+        except Exception as e:
+            self._log_scraping_error(e)
 
     def _log_scrape_started(self) -> None:
         # Dont move this to the init. The peewee model wont be initialised.
-        Log_ = Log()  # noqa
-        Log_.monitorid = self.monitorid  # noqa
-        Log_.action = f'{self.parser} {EnumLogAction.ScrapingStarted.value}'  # noqa
-        Log_.level = EnumLogLevel.INFO.value  # noqa
-        Log_.when = _stringslib.pretty_date_now(with_time=True)
-        Log_.comment = f'Started scraping {self.parser} at {self.url}.\nMonitorid:{self.monitorid}'  # noqa
-        Log_.save()
+        _log_sink.log(self.monitorid, f'{self.parser} {EnumLogAction.ScrapingStarted.value}', EnumLogLevel.INFO.value,  # noqa
+                      f'Started scraping {self.parser} at {self.url}.\nMonitorid:{self.monitorid}')  # noqa
 
     def _log_scrape_complete(self) -> None:
-        Log_ = Log()  # noqa
-        Log_.monitorid = self.monitorid  # noqa
-        Log_.action = f'{self.parser} {EnumLogAction.ScrapingFinished.value}'  # noqa
-        Log_.level = EnumLogLevel.INFO.value  # noqa
-        Log_.when = _stringslib.pretty_date_now(with_time=True)
-        Log_.comment = f'Finished scraping {self.parser} at {self.url}.\nMonitorid:{self.monitorid}'  # noqa
-        Log_.save()
+        # Only now is it safe to skip these pages next time if they are unchanged
+        if self._page_hashes:
+            Cache = _page_cache.get_cache()
+            for url, hash_ in self._page_hashes.items():
+                Cache.mark_seen(url, self._page_cache_consumer, hash_)
+            self._page_hashes = {}
+
+        _log_sink.log(self.monitorid, f'{self.parser} {EnumLogAction.ScrapingFinished.value}', EnumLogLevel.INFO.value,  # noqa
+                      f'Finished scraping {self.parser} at {self.url}.\nMonitorid:{self.monitorid}')  # noqa
 
     def _log_scraping_error(self, e: Exception) -> None:
         """Log an error, passing in an error instance, e
@@ -109,18 +233,14 @@ class MonitorBaseMixin:
         Args:
             e: Exception instance
         """
-        L = Log()
-        L.when = _stringslib.pretty_date_now(with_time=True)
-        L.monitorid = self.monitorid  # noqa
-        L.level = EnumLogLevel.ERROR.value
-        L.action = self.parser  # noqa
-        L.comment = 'Error while scraping "%s". The error was:\n%s' % (self.url, repr(e))  # noqa
-        L.save()
+        self._error = e
+        _log_sink.log(self.monitorid, self.parser, EnumLogLevel.ERROR.value,  # noqa
+                      'Error while scraping "%s". The error was:\n%s' % (self.url, repr(e)))  # noqa
 
     def _match(self, s: str):
-        and_ = all([match.lower() in s.lower() for match in self._match_and_tuple]) or not self._match_and_tuple
-        or_ = any([match.lower() in s.lower() for match in self._match_or_tuple]) or not self._match_or_tuple
-        return and_ and or_
+        """Does s match match_and and match_or. s must already be normalised by _card_text.
+        See matcher for the term syntax, including negative and whole word terms."""
+        return _compiled_matcher(self.match_and, self.match_or).match(s)  # noqa
         # endregion instance methods
 
     # region instance properties
@@ -138,23 +258,196 @@ class MonitorBaseMixin:
         """
         return _make_tuple(self.match_or)  # noqa
 
+    @property
+    def latest_prices(self) -> dict[str, float]:
+        """product_url: latest price for this monitor, from monitor_latest_price.
+        Loaded on first use in a monitor run and dropped by _history_flush at the end of it."""
+        if self._latest_prices is None:
+            query = (MonitorLatestPrice
+                     .select(MonitorLatestPrice.product_url, MonitorLatestPrice.price)
+                     .where(MonitorLatestPrice.monitorid == self.monitorid)  # noqa
+                     .tuples())
+            self._latest_prices = dict(query)
+        return self._latest_prices
+
+    @property
+    def price_alert_threshold(self) -> float:
+        """The price alert threshold of the monitored product, read once per instance"""
+        if self._price_alert_threshold is None:
+            self._price_alert_threshold = Product.get(Product.productid == self.productid).price_alert_threshold  # noqa
+        return self._price_alert_threshold
+
+    @property
+    def _page_cache_consumer(self) -> str:
+        """Key for this monitor in the page cache seen hashes.
+        Includes everything that changes the result of scraping an unchanged page."""
+        return f'{self.monitorid}:{self.match_and}|{self.match_or}|{self.price_alert_threshold}'  # noqa
+
     @property
     def site(self) -> str:
-        """Get the site address from the monitor url.
+        """Get the site address from the monitor url, e.g. https://www.scan.co.uk.
         Ensures that the site address DOES NOT end in /"""
-        s = _urlparse(self.Monitor.url).netloc  # noqa
-        if s[-1] == '/':
-            s = s[:-1]
-        return s
+        parts = _urlparse(self.url)  # noqa
+        return f'{parts.scheme}://{parts.netloc}'
+
+    @property
+    def _fixture_monitor(self) -> dict:
+        """The monitor row and its price alert threshold, saved with recorded pages so the monitor can be recreated for replay"""
+        return {'monitorid': self.monitorid, 'productid': self.productid_id, 'supplier': self.supplier,  # noqa
+                'parser': self.parser, 'url': self.url, 'match_and': self.match_and, 'match_or': self.match_or,  # noqa
+                'fetch_mode': self.fetch_mode, 'price_alert_threshold': self.price_alert_threshold}  # noqa
+
+    @property
+    def spec(self) -> _parser_specs.ParserSpec:
+        """The compiled selector spec of this parser, see parser_specs"""
+        return _parser_specs.get(type(self).__name__)
 
     # endregion instance properties
 
+    def _page_to_str(self, url: str) -> str:
+        """
+        Get the page source at url using the fetch mode of this monitor.
+        Pages are saved to, or read back from, the fixture store when recording or replaying, see fixtures.
+        Fetches wait for the request budget of the host, see scheduler.
+
+        Args:
+            url: The url
+
+        Returns:
+            str: The page source, after _fix_source
+        """
+        Store = _fixtures.get_store()
+        with self._timings.stage('fetch'):
+            if Store is not None and Store.replaying:
+                src = Store.load(self.parser, url)  # noqa
+            else:
+                _scheduler.get_scheduler().acquire(url)  # the host's request budget
+                if self.fetch_mode == EnumFetchMode.Http.value:  # noqa
+                    src = _request_to_str(url)
+                else:
+                    src = _selenium_to_str(url)
+        if Store is not None and Store.recording:
+            Store.save(self.parser, url, src, self._fixture_monitor)  # noqa
+
+        with self._timings.stage('normalise'):
+            src = _fix_source(src)
+
+        if _config.PAGE_CACHE_SKIP_UNCHANGED and not _replaying():  # replays always scrape every page
+            hash_ = _page_cache.body_hash(src)
+            self._page_hashes[url] = hash_
+            if _page_cache.get_cache().seen(url, self._page_cache_consumer) == hash_:
+                self._unchanged_pages.add(url)
+        return src
+
+    def _page_unchanged(self, url: str) -> bool:
+        """
+        Is the page at url unchanged since this monitor last scraped it successfully.
+        Call after _page_to_str. Unchanged pages need not be parsed or scraped.
+        """
+        return url in self._unchanged_pages
+
+    def _soupify(self, src: str, strain: bool = True) -> BeautifulSoup:
+        """
+        Parse a page source with lxml (falls back to html.parser).
+
+        Args:
+            src: The page source
+            strain: Only build the product cards defined by PRODUCT_CONTAINER, rather than the whole page.
+                Pass False if you need anything outside the cards, e.g. pagination links.
+
+        Returns:
+            BeautifulSoup: The soup
+        """
+        with self._timings.stage('parse'):
+            if not strain or not self.PRODUCT_CONTAINER:
+                return BeautifulSoup(src, _PARSER)
+            return BeautifulSoup(src, _PARSER, parse_only=_strainer(self.PRODUCT_CONTAINER))
+
+    def _soupify_pages(self, urls: list[str], delay: bool = True) -> _Iterator[BeautifulSoup]:
+        """
+        Fetch and soupify already known pagination urls, one page at a time.
+
+        By default pages are fetched one after another with a random pause between them, unless delay is False,
+        and with config.SCRAPE_PREFETCH_PAGES the next pages are fetched while this one is parsed and scraped.
+        If config.SCRAPE_PARALLEL_PAGES is set, up to SCRAPE_PARALLEL_PAGES_PER_HOST pages are fetched concurrently,
+        each starting after a random jitter of up to SCRAPE_PARALLEL_PAGES_JITTER_SECONDS and with no more than
+        SCRAPE_PARALLEL_PAGES_PER_HOST in flight for any one host across all monitors.
+        Either way only page sources are fetched ahead, pages are parsed one at a time by the consumer.
+
+        Args:
+            urls: The page urls
+            delay: Pause before each page, see parser_specs.ParserSpec.page_delay. Parallel fetches are always jittered.
+
+        Yields:
+            BeautifulSoup: Soups in the same order as urls. Pages unchanged since the last successful scrape are left out.
+                Each soup is decomposed when the next is asked for, so don't keep them.
+        """
+        if _config.SCRAPE_PARALLEL_PAGES:
+            workers = _config.SCRAPE_PARALLEL_PAGES_PER_HOST
+            ahead = max(workers, _config.SCRAPE_PREFETCH_PAGES)
+        else:
+            workers, ahead = 1, _config.SCRAPE_PREFETCH_PAGES
+
+        if not ahead or len(urls) < 2:
+            for url in urls:
+                if delay and not _replaying():
+                    _sleep(_random.randrange(1, 5))
+                src = self._page_to_str(url)
+                if not self._page_unchanged(url):
+                    yield from _released(self._soupify(src))
+            return
+
+        def _fetch(url: str) -> str:
+            if _config.SCRAPE_PARALLEL_PAGES and not _replaying():
+                _sleep(_random.uniform(0, _config.SCRAPE_PARALLEL_PAGES_JITTER_SECONDS))
+            elif delay and not _replaying():
+                _sleep(_random.randrange(1, 5))
+            with _host_semaphore(url):
+                return self._page_to_str(url)
+
+        with _ThreadPoolExecutor(max_workers=workers, thread_name_prefix='page') as Pool:
+            todo = iter(urls)
+            pending = _deque((url, Pool.submit(_fetch, url)) for url in _islice(todo, ahead))
+            try:
+                while pending:
+                    url, Future = pending.popleft()
+                    for next_url in _islice(todo, 1):  # keep the window full
+                        pending.append((next_url, Pool.submit(_fetch, next_url)))
+                    src = Future.result()
+                    if not self._page_unchanged(url):
+                        yield from _released(self._soupify(src))
+                    del src
+            finally:  # e.g. the consumer gave up on an error, don't fetch the rest
+                for _, Future in pending:
+                    Future.cancel()
+
     @property
-    def soups(self) -> list[str]:  # noqa
+    def soups(self) -> _Iterator[BeautifulSoup]:
         """Monitor pages frequently have additional paginated product pages
-        we need to get those pages so we can soupify them to extract our products
+        we need to get those pages so we can soupify them to extract our products.
+        The other pages are found with the pagination rule of the spec.
+
+        A generator, fetching and parsing one page at a time as it is iterated, so only one page's soup
+        is alive at once. Each soup is decomposed when the next is asked for, so don't keep them.
+        Pages unchanged since the last successful scrape are left out.
         """
-        pass
+        Spec = self.spec
+        url = Spec.first_page(self.url)  # noqa
+        res = self._page_to_str(url)
+        if not Spec.needs_full_first_page:
+            if not self._page_unchanged(url):
+                yield from _released(self._soupify(res))
+            return
+
+        soup = self._soupify(res, strain=False)  # page 1 in full, we need the pagination
+        del res
+        page_urls = list(dict.fromkeys([url] + Spec.page_urls(soup, url, self.site)))  # dedupe, keeping the first page first as we already have its soup
+        if Spec.replaces_first_page and len(page_urls) > 1:
+            _decompose(soup)
+        elif not self._page_unchanged(url):
+            yield from _released(soup)
+        del soup
+        yield from self._soupify_pages(page_urls[1:], Spec.page_delay)
 
 
 class LogExt(Log):
@@ -181,7 +474,7 @@ class MonitorHistoryExt(MonitorHistory):
             True if record generates an alert, False otherwise
         """
         # Global check for alert toggle at monitor level
-        if not Monitor.get_by_id(self.monitorid).alert_required: return False
+        if Monitor.get_by_id(self.monitorid).disable_alerts: return False
         if self.alert_sent: return False
         try:
             _ = Alert.get(Alert.price == self.price, Alert.product_title == self.product_title, Alert.monitorid == self.monitorid)
@@ -192,9 +485,10 @@ class MonitorHistoryExt(MonitorHistory):
     @property
     def alert_text(self) -> str:
         """Generate text for an alert for current instance"""
-        M = Monitor.get_by_id(self.monitorid)
-        # P = Product.get_by_id(M.productid)
-        s = f'{self.date_when[0:14]} {M.supplier} {self.product_title} £{self.price}\n{self.product_url}\n'
+        supplier = getattr(self, 'supplier', None)  # joined in by AlertExt.alerts
+        if supplier is None:
+            supplier = Monitor.get_by_id(self.monitorid).supplier
+        s = f'{_when_str(self.date_when)} {supplier} {self.product_title} £{self.price}\n{self.product_url}\n'
         return s
     # endregion instance properties
 
@@ -209,33 +503,41 @@ class AlertExt(Alert):
     # region static methods
     @staticmethod
     def alerts() -> list[MonitorHistoryExt]:
-        """Generate a list of monitorhistory instances that require alerting
-        Note that monitorhistory table only includes rows where the price threshold
-        has been met, hence no filtering on this is required (currently)
         """
-        alerts = []
-        histories = MonitorHistoryExt.select().where(alert_sent=0)
-        h: MonitorHistoryExt
-        for h in histories:
-            alerts += [h]
-        return alerts
+        Get the monitor_history rows that require alerting, in one query.
+
+        Rows are unsent, for a monitor with alerts enabled, and with no alert row for the same monitor,
+        price and product title. This is the set based equivalent of MonitorHistoryExt.alert_required.
+        The price alert threshold was applied when the row was recorded, see MonitorBaseMixin._scrape_product,
+        so rows are alerted even if the threshold has since been lowered. The monitor supplier is joined in for alert_text.
+        """
+        query = (MonitorHistoryExt
+                 .select(MonitorHistoryExt, Monitor.supplier)
+                 .join(Monitor, on=(MonitorHistoryExt.monitorid == Monitor.monitorid))
+                 .join(Alert, JOIN.LEFT_OUTER, on=((Alert.monitorid == MonitorHistoryExt.monitorid) &
+                                                   (Alert.price == MonitorHistoryExt.price) &
+                                                   (Alert.product_title == MonitorHistoryExt.product_title)))
+                 .where(MonitorHistoryExt.alert_sent == 0,
+                        Monitor.disable_alerts == 0,
+                        Alert.alertid.is_null())
+                 .order_by(MonitorHistoryExt.date_when)
+                 .objects())  # supplier as an attribute of each row
+        return list(query)
 
     @staticmethod
     def alerts_send(carriers=[EnumAlertCarriers.PushBullet.value]):  # noqa
-        """Send alerts"""
+        """Queue alerts in the outbox and flag the rows sent, in one transaction.
+        outbox.Dispatcher does the sending, coalescing and retrying."""
         alerts_ = AlertExt.alerts()
+        if not alerts_:
+            return
         body = '\n'.join([h.alert_text for h in alerts_])
         title = 'Price Alerts %s' % _stringslib.pretty_date_now(with_time=True)
-        if 'PushBullet' in carriers:
-            _PushBullet.send(title, body)
-
-        if 'WhatsApp' in carriers:
-            _WhatsApp.send(body)
 
-        h: MonitorHistoryExt
-        for h in alerts_:
-            h.alert_sent = 1
-            h.save()
+        with DATABASE.atomic():
+            _outbox.enqueue(title, body, carriers)
+            for ids in chunked([h.monitor_historyid for h in alerts_], 500):  # stay under the sqlite variable limit
+                MonitorHistory.update(alert_sent=1).where(MonitorHistory.monitor_historyid.in_(ids)).execute()
     # endregion static methods
 
 
@@ -247,814 +549,96 @@ class ProductExt(Product):
         super().__init__(*args, **kwargs)
 
 
-# region monitors
-class Argos(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Argos
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'ProductCardstyles__Wrapper-h52kot-1 dWoMVd StyledProductCard-sc-1o1topz-0 fOIrbR')  # noqa
-                for product in products:
-                    # incase website inconsistent
-                    s = str(product).lower()
-                    if self._match(s) and 'add to trolley' in s:  # today is in stock test
-                        element = product.find('div', 'ProductCardstyles__PriceText-h52kot-17 kpmggk')  # noqa
-                        price = element.strong.text
-                        price = float(price.replace('£', ''))
-
-                        element = product.find('a', 'ProductCardstyles__Link-h52kot-14 iGahUl')  # noqa
-                        element = element.find('a')
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-
-                        element = product.find('div', 'ProductCardstyles__Title-h52kot-13 eSMKzA')
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        elements = soup.find_all('a', 'Paginationstyles__PageLink-sc-1temk9l-1 ifyeGc xs-hidden sm-row')  # noqa
-        if elements:
-            s = '' if self.url[-1] == '/' else '/'
-            try:
-                _ = elements[0]['href']
-                page_urls.extend([f'{self.url}{s}{element.a['href']}' for element in elements])
-            except KeyError:  # not enough products to require pagination
-                pass
-
-        page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-        if len(page_urls) > 1:
-            for url in page_urls[1:]:
-                _sleep(_random.randrange(1, 5))
-                soups += [BeautifulSoup(_selenium_to_str(url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-
-class AWDIT(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test AWDIT
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'product details product-item-details')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'in stock' in s:
-                        soup_tmp = BeautifulSoup(str(product.span.span), 'html.parser')
-                        tag = soup_tmp.find('span', 'price-wrapper price-including-tax')  # noqa
-                        price = float(tag['data-price-amount'])
-                        product_url = product.a['href']  # lucky its this simple
-                        product_title = product.a.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-
-        anchors = soup.find_all('a', 'page')  # noqa
-        if anchors:
-            for tag in anchors:
-                page_urls += [tag.get('href')]  # this is correct, the hrefs a fully qualified
-            page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-
-        soups = [soup]
-        if len(page_urls) > 1:
-            for link in page_urls[1:]:
-                _sleep(_random.randrange(1, 5))
-                soups += [BeautifulSoup(_selenium_to_str(link), 'html.parser')]
-        self._soups = soups
-        return soups
-
-
-class Box(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Box
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'grid grid-cols-12 gap-x-5 2xl:gap-x-[4.12rem] h-full')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'add to basket' in s:  # today is in stock test
-                        element = product.find('span', 'text-3xl text-heading_primary font-semibold')  # noqa
-                        price = element.text
-                        price = float(price.replace('£', ''))
-
-                        element = product.find('a', 'xl:text-[18px] leading-6 text-sm font-semibold max-h-[76px] min-h-[68px] text-left no-underline block line-clamp-3')  # noqa
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[BeautifulSoup]:
-        if self._soups: return self._soups
-
-        # hack that currently works
-        if 'product_list_limit' not in self.url:
-            if self.url[-1] == '/':
-                self.url = self.url[0:len(self.url) - 1] + '?product_list_limit=1000'
-            else:
-                self.url += '?product_list_limit=1000'
-
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        self._soups = soups
-        return soups
-
-
-class CashConverters(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test CashConverters
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'product-item__body')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s):  # no instock test needed
-                        element = product.find('div', 'product-item__price')  # noqa
-                        price = int(element.text) + 0.99  # This is correct, we first get the pounds without the pence, then all CC items end in 99 pence, so this simple kludge works currently
-
-                        element = product.find('span', 'product-item__text-wrapper')  # noqa
-                        element = element.find('a')
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-
-                        element = product.find('span', 'product-item__title__description')  # noqa
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[BeautifulSoup]:
-        ITEMS_PER_PAGE = 24
-        if self._soups: return self._soups
-
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        # now get number of pages
-        element = soup.find('span', 'result-count__text')  # noqa
-        page_count = int(_stringslib.numbers_in_str(element.text)[0] / ITEMS_PER_PAGE)
-        # cashconverters is weird - if we put the max page count in, we dont get the last page
-        # we get the entire list of items loaded, so we dont need to generate soups for each page
-        # just load the last page and replace the original soup
-        if page_count > 1:
-            # https://www.cashconverters.co.uk/search-results?Sort=default&page=1&f%5Bcategory%5D%5B0%5D=all&f%5Blocations%5D%5B0%5D=all&query=9060
-            # we need to get the page= bit from the url to replace it
-            if '&page=' in self.url:
-                start = self.url.index('&page=') + len('&page=')
-                end = start
-                while True:
-                    if _stringslib.numbers_in_str(element.text[end]):
-                        end += 1
-                    else:
-                        break
-                page_url = self.url.replace(self.url[start:end], f'&page={page_count}')
-                soups = [BeautifulSoup(_selenium_to_str(page_url), 'html.parser')]
-            else:  # easy, no page= in the scrape url to replace
-                if self.url[-1] == '/':
-                    url = self.url[0:len(self.url) - 1]
-                else:
-                    url = self.url
-                page_url = f'{url}&page={page_count}'
-                # This is correct, replace the original soup with this soup that will contain every single paginated item
-                soups = [BeautifulSoup(_selenium_to_str(page_url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-
-class CCLOnline(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test CCLOnline
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'productlistoverlaywrapper position-relative col-12 col-xs-6 col-sm-6 col-md-4 px-2 px-xs-0 px-sm-2')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'today' in s:  # today is in stock test
-                        spans = product.find('p', 'order-xs-2').find_all('span')  # noqa
-                        price = float(f'{spans[1].text}{spans[2].text}')  # yes, the price is weirdly split into 2 spans
-                        product_url = f'{self.site}{product.a['href']}'  # lucky its this simple
-                        element = product.find('h3', 'product-name text-center')  # noqa
-                        product_title = element.a['title'] if element else ''
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        listitems = soup.find_all('li', 'notselected')  # noqa
-        if listitems:
-            page_urls.extend([f'{self.site}{li.a['href']}' for li in listitems if 'cclonline' not in li])
-            page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-            if len(page_urls) > 1:
-                for url in page_urls[1:]:
-                    _sleep(_random.randrange(1, 5))
-                    soups += [BeautifulSoup(_selenium_to_str(url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-
-class Cex(MonitorBaseMixin, Monitor):
-    """ Cex multi product scraper.
-
-    Cex has a really shit search facility, but it mostly uses url query strings to persist searches,
-    so make sure we use a decent selection of filters to minimise the number of returned products.
-
-    Dont forget to include the in-stock filter.
+@_functools.lru_cache(maxsize=None)
+def spec_parser(name: str) -> type:
     """
+    Build the parser class for a selector spec, once per name.
 
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Cex
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'search-product-card')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'in stock' in s:
-                        element = product.find('p', 'product-main-price')  # noqa
-                        price = _stringslib.numbers_in_str(element.text, type_=float)[0]  # noqa
-
-                        element = element.find('a', 'line-clamp')
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-
-        anchors = soup.find_all('a', 'ais-Pagination-link')  # noqa
-        if anchors:
-            for tag in anchors:
-                page_urls += [f'{self.site}{tag.get('href')}']
-            page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-
-        soups = [soup]
-        if len(page_urls) > 1:
-            for link in page_urls[1:]:
-                _sleep(_random.randrange(1, 5))
-                soups += [BeautifulSoup(_selenium_to_str(link), 'html.parser')]
-        self._soups = soups
-        return soups
-
-
-class ComputerOrbit(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test ComputerOrbit
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'productitem')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'in stock' in s:  # today is in stock test
-                        element = product.find('span', 'money')  # noqa
-                        price = element.text
-                        price = float(price.replace('£', ''))
-
-                        element = product.find('h2', 'productitem--title')  # noqa
-                        element = element.find('a')
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-
-                        element = product.find('h2', 'productitem--title')
-                        product_title = element.a.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        elements = soup.find_all('a', 'pagination--item')  # noqa
-        if elements:
-            try:
-                _ = elements[0]['href']
-                page_urls.extend([f'{self.site}{element.a['href']}' for element in elements])
-            except KeyError:  # not enough products to require pagination
-                pass
-
-        page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-        if len(page_urls) > 1:
-            for url in page_urls[1:]:
-                _sleep(_random.randrange(1, 5))
-                soups += [BeautifulSoup(_selenium_to_str(url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-
-class Currys(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Currys
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'row plp-list-grid')  # noqa
-                for product in products:
-                    # incase website inconsistent
-                    s = str(product).lower()
-                    if self._match(s) and 'add to basket' in s:  # today is in stock test
-                        element = product.find('span', 'value')  # noqa
-                        price = float(element['content'])
-
-                        element = product.find('a', 'link text-truncate pdpLink')  # noqa
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-
-                        element = product.find('h2', 'pdp-grid-product-name')
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        # currys does not show every page if lots of pages, we have to construct hidden links
-        # it is also in the middle of a site revision. Dont expect these hidden page
-        # links to work for very long
-        elements = soup.find_all('li', 'page-item')  # noqa
-        if elements:
-            element = soup.find('div', 'page-result-count')  # noqa
-            if element:
-                item_count = _stringslib.numbers_in_str(element.text)[0]
-                pages = (item_count // 20) + 1  # 20 items per page default
-
-                if pages > 1:
-                    # https://www.currys.co.uk/computing/components-and-upgrades/graphics-cards?start=160&sz=20 [page 9]
-                    for page in range(2, pages + 1):
-                        start = page * 20 - 20
-                        s = _urlconcat(self.url, f'?start={start}&sz=20')
-                        page_urls += [f'{s}']
-
-        page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-        if len(page_urls) > 1:
-            for url in page_urls[1:]:
-                _sleep(_random.randrange(1, 5))
-                soups += [BeautifulSoup(_selenium_to_str(url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-class ScrewfixSingleProduct(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'RggDHg')  # noqa  Only one product, but keep same code pattern as multiproduct
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s):
-                        element = product.find('span', '_U1S20')  # noqa
-                        price_pounds = _stringslib.numbers_in_str(element.text, type_=int)[0]
-
-                        element = product.find('span', 'xIIluZ')  # noqa
-                        price_pence = _stringslib.numbers_in_str(element.text, type_=int)[0]
-                        price = price_pounds + (price_pence/100)
-
-                        product_url = self.url  # single product page, this is correct
-
-                        element = product.find('span', {'itemprop': 'name'})  # noqa
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[BeautifulSoup]:
-        if self._soups: return self._soups
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-        self._soups = soups
-        return soups
-
-class Novatech(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Novatech
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'search-box-liner search-box-results search-hover')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'left in stock' in s:  # today is in stock test
-                        element = product.find('p', 'newspec-price-listing')  # noqa
-                        price = _stringslib.numbers_in_str(element.text, type_=float)[0]  # noqa
-
-                        element = product.find('div', 'search-box-details-sizer')  # noqa
-                        element = element.find('a')
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-
-        elements = soup.find_all('div', {'id': 'page-numbers'})  # noqa
-        if elements:
-            try:
-                _ = elements[0]['href']
-                page_urls.extend([f'{self.url}{element.a['href']}' for element in elements])
-                page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-            except KeyError:  # not enough products to require pagination
-                pass
-
-        soups = [soup]
-        if len(page_urls) > 1:
-            for url in page_urls[1:]:
-                soups += [BeautifulSoup(_selenium_to_str(url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-
-class Overclockers(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Overclockers
-    class Meta:
-        table_name = 'monitor'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('ck-product-box', 'custom-element ck-product-box listViewEventAdded')  # noqa
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'in stock' in s:  # today is in stock test
-                        element = product.find('span', 'price__amount')  # noqa
-                        price = float(element.text.replace('£', ''))
-
-                        element = product.find('a', 'text-inherit text-decoration-none js-gtm-product-link')  # noqa
-                        product_url = f'{self.site}{element['href']}'
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
-
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-
-        elements = soup.find_all('div', {'id': 'page-numbers'})  # noqa
-        if elements:
-            try:
-                _ = elements[0]['href']
-                # cater for search based urls, search based urls have pages embedded as fully qualified links
-                if '?query=' in self.url:
-                    page_urls.extend([f'{element.a['href']}' for element in elements])
-                else:
-                    page_urls.extend([f'{_urlconcat(self.site, element.a['href'])}' for element in elements])
-            except KeyError:  # not enough products to require pagination
-                pass
-
-        page_urls = list(set(page_urls))  # we don't need the first page, we already have the soup
-        if len(page_urls) > 1:
-            for url in page_urls[1:]:
-                _sleep(_random.randrange(1, 5))
-                soups += [BeautifulSoup(_selenium_to_str(url), 'html.parser')]
-
-        self._soups = soups
-        return soups
-
-
-class RyobiSingleProduct(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    class Meta:
-        table_name = 'monitor'
+    The class is a model of table monitor, scraped by the generic MonitorBaseMixin.scrape
+    with the spec from parser_specs.
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
-
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'ProductDetailsstyles__Content-hb5d0o-1 ksUgWJ')  # noqa  Only one product, but keep same code pattern as multiproduct
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'add to basket' in s:
-                        element = product.find('span', 'ProductDetailPricestyles__Main-sc-80n9g9-3 frlOqI')  # noqa
-                        element = element.find('span')
-                        price = _stringslib.numbers_in_str(element.text, type_=float)[0]
-
-                        product_url = self.url  # single product page, this is correct
-
-                        element = product.find('h1', 'ProductDetailsstyles__Title-hb5d0o-3 dcvWgw')  # noqa
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
+    Args:
+        name: Parser name, e.g. EnumParsers.Currys.value
 
-    @property
-    def soups(self) -> list[BeautifulSoup]:
-        if self._soups: return self._soups
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-        self._soups = soups
-        return soups
-
-
-class Scan(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    # TODO: Test Scan
-    class Meta:
-        table_name = 'monitor'
+    Raises:
+        errors.UnknownParserError: If there is no spec for name
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
+    Returns:
+        type: The parser class
+    """
+    Spec = _parser_specs.get(name)
+    Meta = type('Meta', (), {'table_name': 'monitor'})  # This has to go on every parser, peewee doesn't inherit it
+    return type(name, (MonitorBaseMixin, Monitor), {'Meta': Meta, 'PRODUCT_CONTAINER': Spec.container, '__module__': __name__})
 
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'search-box-liner search-box-results search-hover')  # noqa
-                for product in products:
-                    # incase website inconsistent
-                    s = str(product).lower()
-                    if self._match(s) and 'left in stock' in s:  # today is in stock test
-                        element = product.find('p', 'newspec-price-listing')  # noqa
-                        price = _stringslib.numbers_in_str(element.text, type_=float)[0]  # noqa
-
-                        element = product.find('div', 'search-box-details-sizer')  # noqa
-                        element = element.find('a')
-                        product_url = element['href']
-                        product_url = f'{self.site}{product_url}'
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
 
-    @property
-    def soups(self) -> list[str]:
-        if self._soups: return self._soups
-
-        page_urls = [self.url]
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-        # Scan doesnt currently paginate results, returning everything, Check though when identifying your url
-        self._soups = soups
-        return soups
+# region monitors
+# Parsers are data, see parser_specs.json. Parsers that are only in the json are built on demand by parser_registry.
+Argos = spec_parser(EnumParsers.Argos.value)
+AWDIT = spec_parser(EnumParsers.AWDIT.value)
+Box = spec_parser(EnumParsers.Box.value)
+CashConverters = spec_parser(EnumParsers.CashConverters.value)
+CCLOnline = spec_parser(EnumParsers.CCLOnline.value)
+Cex = spec_parser(EnumParsers.Cex.value)
+ComputerOrbit = spec_parser(EnumParsers.ComputerOrbit.value)
+Currys = spec_parser(EnumParsers.Currys.value)
+Novatech = spec_parser(EnumParsers.Novatech.value)
+Overclockers = spec_parser(EnumParsers.Overclockers.value)
+RyobiSingleProduct = spec_parser(EnumParsers.RyobiSingleProduct.value)
+Scan = spec_parser(EnumParsers.Scan.value)
+ScrewfixSingleProduct = spec_parser(EnumParsers.ScrewfixSingleProduct.value)
+ToolStationSingleProduct = spec_parser(EnumParsers.ToolStationSingleProduct.value)
 # endregion monitors
 
 
 
 # region module helper methods
+def _when_str(when) -> str:
+    """Format a date for an alert. Rows migrate_dates_to_datetime hasn't converted are still legacy
+    pretty_date_now text, peewee hands those back as str, so they are shown as stored."""
+    if hasattr(when, 'strftime'):
+        return f'{when:%d/%m/%Y %H:%M}'
+    return str(when)[0:16]
+
 def _clean_str(s: str) -> str:
     s = _stringslib.filter_alphanumeric1(s, allow_cr=False, allow_lf=False,
                                          remove_double_quote=True, remove_single_quote=True, strip=True, fix_nbs=True)
     return s
 
 
-def _fix_source(source):
-    """Some random QOL fixes on source strings"""
-    for generation in ('5', '6', '7'):
-        for model in ('600', '700', '800', '900'):
-            source = source.replace(f'{generation}{model} xtx', f'{generation}{model}xtx')
-            source = source.replace(f'{generation}{model} XTX', f'{generation}{model}xtx')
-            source = source.replace(f'{generation}{model} Xtx', f'{generation}{model}xtx')
-
-            source = source.replace(f'{generation}{model} xt', f'{generation}{model}xt')
-            source = source.replace(f'{generation}{model} XT', f'{generation}{model}xt')
-            source = source.replace(f'{generation}{model} Xt', f'{generation}{model}xt')
-
-    source = source.replace('9070 xt', '9070xt')
-    source = source.replace('9060 xt', '9060xt')
-    source = source.replace('9070 XT', '9070xt')
-    source = source.replace('9060 XT', '9060xt')
-    source = source.replace('9070 Xt', '9070xt')
-    source = source.replace('9060 Xt', '9060xt')
-
-    for generation in ('30', '40', '50', '60'):
-        for model in ('50', '60', '70', '80', '90'):
-            source = source.replace(f'{generation}{model} ti', f'{generation}{model}ti')
-            source = source.replace(f'{generation}{model} TI', f'{generation}{model}ti')
-            source = source.replace(f'{generation}{model} Ti', f'{generation}{model}ti')
-    return source
-
-
-class ToolStationSingleProduct(MonitorBaseMixin, Monitor):
-    # This has to go here, it doesnt work in the MonitorBaseMixin
-    class Meta:
-        table_name = 'monitor'
+def _card_text(product: Tag) -> str:
+    """
+    Serialise and normalise a product card once, for sharing between _match and the in stock tests.
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)  # first to the mixin, the mixin then passes to orm.Monitor constructor
+    formatter=None skips entity substitution, which is most of the cost of str(product)
+    and which we don't need to match plain text.
 
-    def scrape(self):  # noqa
-        self._log_scrape_started()
-        try:
-            for soup in self.soups:
-                products = soup.find_all('div', 'content-container px-0 xs:pt-5 md:pt-8 md:pb-22 lg:px-12')  # noqa  Only one product, but keep same code pattern as multiproduct
-                for product in products:
-                    s = str(product).lower()
-                    if self._match(s) and 'available for delivery' in s:
-                        element = product.find('span', 'font-bold text-[28px] md:text-size-9')  # noqa
-                        price = _stringslib.numbers_in_str(element.text, type_=float)[0]
-
-                        product_url = self.url  # single product page, this is correct
-
-                        element = product.find('h1', 'font-bold text-blue text-size-6 md:text-size-8 lg:text-size-9')  # noqa
-                        product_title = element.text
-                        super().scrape(price, product_url, product_title)
-        except Exception as e:
-            self._log_scraping_error(e)
-            return
-        self._log_scrape_complete()
+    Args:
+        product: The product card
 
-    @property
-    def soups(self) -> list[BeautifulSoup]:
-        if self._soups: return self._soups
-        res = _selenium_to_str(self.url)
-        soup = BeautifulSoup(res, "html.parser")
-        soups = [soup]
-        self._soups = soups
-        return soups
+    Returns:
+        str: The card html, lower case
+    """
+    return product.decode(formatter=None).lower()
+
+
+def _fix_source(source):
+    """Some random QOL fixes on source strings, e.g. '9070 XT' to '9070xt'.
+    The fixes are data, see normaliser.DEFAULT_RULES and config.SOURCE_FIX_RULES"""
+    return _NORMALISER.normalise(source)
 
 
 # region module methods
 def _request_to_str(url: str) -> str:
     """
-    Use simple request to get a webpage source as a string
-    Converts to lower case.
+    Use simple request to get a webpage source as a string.
+    Goes through the pooled http_fetch engine, so connections are reused and requests have a timeout and retries.
+    Sends a conditional GET if the page cache has validators for url, and uses the cached body on a 304.
 
     Args:
         url: The url to request
 
     Returns:
-        source of page at url
+        source of page at url, before _fix_source
     """
     user_agents = [
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36",
@@ -1071,16 +655,53 @@ def _request_to_str(url: str) -> str:
     headers = {
         "User-Agent": user_agents[_random.randrange(0, len(user_agents) - 1)]
     }
-    req = requests.get(url, headers=headers)
-    res = _fix_source(req.text)
-    return res
-
-def _urlconcat(url: str, s: str) -> str:
-    tmp_url = url[:-1] if url[-1] == '/' else url
-    if s[0] == '/':
-        return f'{tmp_url}{s}'
-    else:
-        return f'{tmp_url}/{s}'
+    Cache = _page_cache.get_cache()
+    headers.update(Cache.conditional_headers(url))
+    Result = _http_fetch.get_fetcher().get(url, headers=headers)
+    Result.raise_for_status()
+    if Result.status_code == 304:
+        body = Cache.body(url)
+        if body is None:  # evicted between the request and now
+            headers.pop('If-None-Match', None)
+            headers.pop('If-Modified-Since', None)
+            Result = _http_fetch.get_fetcher().get(url, headers=headers)
+            Result.raise_for_status()
+        else:
+            return body
+    Cache.store(url, Result.text, etag=Result.headers.get('etag'), last_modified=Result.headers.get('last-modified'))
+    return Result.text
+
+@_functools.lru_cache(maxsize=None)
+def _strainer(product_container: tuple) -> SoupStrainer:
+    """SoupStrainer for PRODUCT_CONTAINER, built once per parser"""
+    return SoupStrainer(*product_container)
+
+def _released(soup: BeautifulSoup) -> _Iterator[BeautifulSoup]:
+    """Yield soup, then decompose it once the consumer is done with it.
+    Soups are full of reference cycles, decomposing frees them now rather than at the next garbage collection."""
+    try:
+        yield soup
+    finally:
+        _decompose(soup)
+
+def _decompose(soup: BeautifulSoup) -> None:
+    """Decompose a whole soup. BeautifulSoup.decompose alone leaves the tree under it intact."""
+    for element in list(soup.contents):
+        element.decompose()
+    soup.decompose()
+
+def _replaying() -> bool:
+    """Are pages being read back from the fixture store rather than fetched"""
+    Store = _fixtures.get_store()
+    return Store is not None and Store.replaying
+
+def _host_semaphore(url: str) -> _threading.Semaphore:
+    """Get the semaphore capping concurrent page fetches for the host of url"""
+    host = _urlparse(url).netloc.lower()
+    with _HOST_SEMAPHORES_LOCK:
+        if host not in _HOST_SEMAPHORES:
+            _HOST_SEMAPHORES[host] = _threading.Semaphore(_config.SCRAPE_PARALLEL_PAGES_PER_HOST)
+        return _HOST_SEMAPHORES[host]
 
 def _make_tuple(s: str) -> tuple:
     if not s or not isinstance(s, str):  # noqa
@@ -1089,33 +710,49 @@ def _make_tuple(s: str) -> tuple:
     # accept a straight string in the database
     try:
         out = _ast.literal_eval(s)  # noqa
-    except ValueError:
+    except (ValueError, SyntaxError):  # e.g. 9070xt is a SyntaxError, not a ValueError
         out = (s,)  # noqa
 
+    if isinstance(out, str):  # e.g. "'9070xt'"
+        out = (out,)
+    elif not isinstance(out, (tuple, list)):  # e.g. 9070 is an int, keep the text as written
+        out = (s,)
     return out
 
 
+@_functools.lru_cache(maxsize=1024)
+def _compiled_matcher(match_and: str, match_or: str) -> _matcher.Matcher:
+    """Matcher for the raw match_and and match_or column values.
+    Cached on those values, so it is built once per monitor and rebuilt when the monitor row changes."""
+    return _matcher.Matcher(_make_tuple(match_and), _make_tuple(match_or))
+
+
 def _selenium_to_str(url) -> str:
     """mucking around with downloading a page to get around bot detection
 
+    Uses a warm browser session from the pool rather than starting chrome for every page.
+    The session is recycled if we hit a captcha.
+
     Raises:
         errors.CaptchaError: If it looks like a captcha that we cannot circumvent
 
     Returns:
-        str: the page as a string
+        str: the page as a string, before _fix_source
     """
-    with _SB(uc=True, test=True, incognito=True, undetectable=True, undetected=True) as sb:
+    with _browser_pool.get_pool().session() as Session:
+        sb = Session.sb
         sb.uc_open_with_reconnect(url, 4)
         src = sb.get_page_source()
         if 'verify you are human' in src.lower():
+            Session.recycle = True  # don't carry a flagged browser over to the next page
             with _fuckit:
                 sb.driver.uc_switch_to_frame("iframe")
                 sb.driver.uc_click("span.mark")
                 sb.uc_gui_click_captcha()
                 _sleep(5)
                 src = sb.get_page_source()
-                if 'verify you are human' in src.lower():
-                    raise _errors.CaptchaError(f'Could not pass captcha at "{url}"')
+            if 'verify you are human' in src.lower():
+                raise _errors.CaptchaError(f'Could not pass captcha at "{url}"')
 
         # Accept Cookies
         try:
@@ -1130,9 +767,7 @@ def _selenium_to_str(url) -> str:
                     _sleep(3)
         except:
             pass
-
-        src = _fix_source(src)
-        return src
+    return src
 # endregion  module methods
 
 
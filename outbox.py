@@ -0,0 +1,246 @@
+"""
+Persistent outbox for notifications.
+
+enqueue writes one row per carrier to the outbox table and returns straight away,
+so sending never happens on the scrape path. The Dispatcher thread then sends them:
+    - Pending rows for a carrier are held until the oldest is coalesce_seconds old,
+      then sent together as one digest, so a restock burst is one push rather than many.
+    - A carrier is not sent to more often than its min_seconds_between_sends.
+    - A failed digest is retried with exponential backoff. Attempts are counted per row, and a row is marked failed after max_attempts.
+
+Rows survive a restart and anything pending is sent by the next dispatcher.
+Delivery is at least once, a crash between sending and marking the rows sent will send them again.
+
+Examples:
+    >>> enqueue('Price Alerts', '9070xt £549.99', [EnumNotifiers.PushBullet.value])
+    >>> get_dispatcher()  # started on first use
+"""
+import atexit as _atexit
+import threading as _threading
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from datetime import datetime as _datetime
+from datetime import timedelta as _timedelta
+
+from peewee import chunked as _chunked
+from peewee import fn as _fn
+
+import config as _config
+import log_sink as _log_sink
+import notifier as _notifier
+from enums import EnumLogAction, EnumLogLevel, EnumOutboxStatus
+from orm import DATABASE as _DATABASE
+from orm import Outbox as _Outbox
+
+__all__ = ['Dispatcher', 'enqueue', 'get_dispatcher', 'shutdown']
+
+
+def enqueue(title: str, body: str, carriers: list[str] | None = None, monitorid: int | None = None) -> int:
+    """
+    Queue a notification for each carrier. Joins the caller's transaction, if there is one.
+
+    Args:
+        title: Title of the message
+        body: Body of the message
+        carriers: EnumNotifiers values, defaults to config.NOTIFIERS
+        monitorid: Monitorid, used for logging purposes
+
+    Returns:
+        int: Number of rows queued
+    """
+    if carriers is None:
+        carriers = [n.value for n in _config.NOTIFIERS]
+    now = _datetime.now()
+    rows = [{'carrier': carrier, 'title': title[:255], 'body': body, 'monitorid': monitorid,
+             'status': EnumOutboxStatus.Pending.value, 'attempts': 0, 'created': now, 'next_attempt': now}
+            for carrier in dict.fromkeys(carriers)]  # dedupe, keeping order
+    if rows:
+        _Outbox.insert_many(rows).execute()
+        if _DISPATCHER is not None:
+            _DISPATCHER.wake()
+    return len(rows)
+
+
+class Dispatcher:
+    """
+    Thread that sends pending outbox rows as one digest per carrier.
+
+    Args:
+        coalesce_seconds: Hold a carrier's rows until the oldest is this old, so later rows join the digest
+        min_seconds_between_sends: carrier: min seconds between sends, the 'default' key covers other carriers
+        max_attempts: Attempts before rows are marked failed
+        backoff_seconds: Delay before the first retry, doubled on every retry
+        poll_seconds: How often the outbox table is checked
+        max_workers: Max carriers sent to at the same time
+    """
+
+    def __init__(self, coalesce_seconds: float = 30, min_seconds_between_sends: dict | None = None, max_attempts: int = 6,
+                 backoff_seconds: float = 30, poll_seconds: float = 5, max_workers: int = 4):
+        self.coalesce_seconds = coalesce_seconds
+        self.min_seconds_between_sends = min_seconds_between_sends or {}
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+        self._last_sent = {}  # carrier: when we last sent, or tried to
+        self._pool = _ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='outbox_send')
+        self._stop = _threading.Event()
+        self._wake = _threading.Event()
+        self._dispatch_lock = _threading.Lock()
+        self._thread = _threading.Thread(target=self._run, name='outbox', daemon=True)
+
+    def start(self) -> 'Dispatcher':
+        """Start the dispatcher thread. Rate limits carry on from the last sends in the outbox table."""
+        with _DATABASE.connection_context():
+            query = (_Outbox
+                     .select(_Outbox.carrier, _fn.MAX(_Outbox.sent))
+                     .where(_Outbox.sent.is_null(False))
+                     .group_by(_Outbox.carrier)
+                     .tuples())
+            for carrier, sent in query:
+                self._last_sent[carrier] = sent if isinstance(sent, _datetime) else _datetime.fromisoformat(sent)
+        self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        """Check the outbox now, rather than at the next poll"""
+        self._wake.set()
+
+    def dispatch(self, flush: bool = False) -> int:
+        """
+        Send the due digests, blocking until done.
+
+        Args:
+            flush: Send without waiting for the coalesce window, e.g. on shutdown. Rate limits still apply.
+
+        Returns:
+            int: Number of digests sent
+        """
+        with self._dispatch_lock:
+            now = _datetime.now()
+            with _DATABASE.connection_context():
+                rows = list(_Outbox
+                            .select()
+                            .where(_Outbox.status == EnumOutboxStatus.Pending.value, _Outbox.next_attempt <= now)
+                            .order_by(_Outbox.created, _Outbox.outboxid))
+            by_carrier = {}
+            for row in rows:
+                by_carrier.setdefault(row.carrier, []).append(row)
+
+            futures = []
+            for carrier, rows_ in by_carrier.items():
+                if not flush and (now - rows_[0].created).total_seconds() < self.coalesce_seconds:
+                    continue  # still coalescing
+                if not self._allowed(carrier, now):
+                    continue
+                self._last_sent[carrier] = now
+                futures.append(self._pool.submit(self._send, carrier, rows_))
+            return sum(future.result() for future in futures)
+
+    def close(self) -> None:
+        """Stop the dispatcher thread and send anything pending, ignoring the coalesce window"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.poll_seconds * 2)
+        try:
+            self.dispatch(flush=True)
+        finally:
+            self._pool.shutdown(wait=True)
+
+    # region private methods
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.dispatch()
+            except Exception as e:  # e.g. database locked, try again next poll
+                print(f'Outbox dispatch failed: {repr(e)}')
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _allowed(self, carrier: str, now: _datetime) -> bool:
+        min_seconds = self.min_seconds_between_sends.get(carrier, self.min_seconds_between_sends.get('default', 0))
+        last = self._last_sent.get(carrier)
+        return last is None or (now - last).total_seconds() >= min_seconds
+
+    def _send(self, carrier: str, rows: list[_Outbox]) -> int:
+        """Send rows to carrier as one digest and record the outcome. Returns 1 if sent, else 0."""
+        title = rows[-1].title  # the latest, e.g. Price Alerts <date>
+        body = '\n'.join(row.body for row in rows)
+        try:
+            _notifier.deliver(carrier, title, body)
+        except Exception as e:
+            self._failed(carrier, rows, e)
+            return 0
+
+        with _DATABASE.connection_context(), _DATABASE.atomic():
+            for ids in _chunked([row.outboxid for row in rows], 500):  # stay under the sqlite variable limit
+                (_Outbox
+                 .update(status=EnumOutboxStatus.Sent.value, sent=_datetime.now(), attempts=_Outbox.attempts + 1, error=None)
+                 .where(_Outbox.outboxid.in_(ids))
+                 .execute())
+        return 1
+
+    def _failed(self, carrier: str, rows: list[_Outbox], e: Exception) -> None:
+        """Record a failed digest. Attempts are counted per row, so rows that joined a digest
+        already being retried get their own backoff and max_attempts, not those of the older rows."""
+        now = _datetime.now()
+        by_attempts = {}  # attempts, counting this one: outboxids
+        for row in rows:
+            by_attempts.setdefault(row.attempts + 1, []).append(row.outboxid)
+
+        gave_up, retrying = 0, {}  # retrying is attempts: next_attempt
+        with _DATABASE.connection_context(), _DATABASE.atomic():
+            for attempts, ids in by_attempts.items():
+                if attempts >= self.max_attempts:
+                    gave_up += len(ids)
+                    status, next_attempt = EnumOutboxStatus.Failed, now
+                else:
+                    status, next_attempt = EnumOutboxStatus.Pending, now + _timedelta(seconds=self.backoff_seconds * 2 ** (attempts - 1))
+                    retrying[attempts] = next_attempt
+                for ids_ in _chunked(ids, 500):
+                    (_Outbox
+                     .update(status=status.value, attempts=attempts, next_attempt=next_attempt, error=repr(e))
+                     .where(_Outbox.outboxid.in_(ids_))
+                     .execute())
+
+        if gave_up:
+            self._log(carrier, EnumLogLevel.ERROR, f'Gave up sending {gave_up} {carrier} notifications after {self.max_attempts} attempts.\n\nThe error was:\n{repr(e)}')
+        if retrying:
+            attempts = min(retrying)
+            self._log(carrier, EnumLogLevel.WARNING, f'Failed to send {len(rows) - gave_up} {carrier} notifications, attempt {attempts}, '
+                                                     f'retrying from {retrying[attempts]:%H:%M:%S}.\n\nThe error was:\n{repr(e)}')
+
+    @staticmethod
+    def _log(carrier: str, level: EnumLogLevel, comment: str) -> None:
+        _log_sink.log(None, f'{carrier} {EnumLogAction.Notify.value}', level.value, comment)
+        print(comment)
+    # endregion private methods
+
+
+# region module methods
+_DISPATCHER: Dispatcher | None = None
+_DISPATCHER_LOCK = _threading.Lock()
+
+
+def get_dispatcher() -> Dispatcher:
+    """Get the process wide dispatcher, creating and starting it on first use from the settings in config.py"""
+    global _DISPATCHER
+    with _DISPATCHER_LOCK:
+        if _DISPATCHER is None:
+            _DISPATCHER = Dispatcher(coalesce_seconds=_config.OUTBOX_COALESCE_SECONDS,
+                                     min_seconds_between_sends=_config.OUTBOX_MIN_SECONDS_BETWEEN_SENDS,
+                                     max_attempts=_config.OUTBOX_MAX_ATTEMPTS,
+                                     backoff_seconds=_config.OUTBOX_BACKOFF_SECONDS,
+                                     poll_seconds=_config.OUTBOX_POLL_SECONDS,
+                                     max_workers=_config.NOTIFIER_MAX_WORKERS).start()
+        return _DISPATCHER
+
+
+@_atexit.register
+def shutdown() -> None:
+    """Stop the process wide dispatcher, sending anything pending. Registered with atexit."""
+    global _DISPATCHER
+    with _DISPATCHER_LOCK:
+        Dispatcher_, _DISPATCHER = _DISPATCHER, None
+    if Dispatcher_ is not None:
+        Dispatcher_.close()
+# endregion module methods
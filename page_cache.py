@@ -0,0 +1,192 @@
+"""
+On-disk page cache keyed by url.
+
+For each url we keep the ETag and Last-Modified validators and the body of the
+last 200 response, so orm_extensions._request_to_str can send conditional GETs
+and reuse the cached body on a 304.
+
+We also keep, per consumer (a monitor and its match settings), the hash of the
+normalised body it last scraped successfully. Monitors use this to skip the
+parse and the database work for pages that have not changed.
+
+Entries are evicted by age and when the cache exceeds its total size.
+"""
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import os.path as _path
+import re as _re
+import threading as _threading
+import time as _time
+
+import config as _config
+
+__all__ = ['PageCache', 'body_hash', 'get_cache']
+
+_RE_VOLATILE = _re.compile(r'<(script|style|noscript)\b.*?</\1\s*>', _re.IGNORECASE | _re.DOTALL)
+_RE_WHITESPACE = _re.compile(r'\s+')
+
+
+class PageCache:
+    """
+    Cache of page validators, bodies and seen hashes.
+
+    Args:
+        root: Folder to keep the cache in, created if it doesn't exist
+        max_age_seconds: Entries not fetched for this long are evicted
+        max_bytes: Oldest entries are evicted until the cache is smaller than this
+    """
+
+    def __init__(self, root: str, max_age_seconds: float, max_bytes: int):
+        self.root = root
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._lock = _threading.RLock()
+        _os.makedirs(root, exist_ok=True)
+
+    def conditional_headers(self, url: str) -> dict:
+        """
+        Get If-None-Match and If-Modified-Since headers for url.
+
+        Returns:
+            dict: The headers, empty if we have nothing cached for url
+        """
+        meta = self._read_meta(url)
+        if not meta or not _path.isfile(self._body_file(url)):
+            return {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def body(self, url: str) -> str | None:
+        """Get the cached body for url, used on a 304. Also refreshes the entry age."""
+        with self._lock:
+            try:
+                with open(self._body_file(url), encoding='utf-8') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                return None
+            meta = self._read_meta(url) or {'url': url}
+            meta['fetched'] = _time.time()
+            self._write_meta(url, meta)
+            return body
+
+    def store(self, url: str, body: str, etag: str | None = None, last_modified: str | None = None) -> None:
+        """Store a 200 response. The body is only kept if the server gave us a validator."""
+        with self._lock:
+            meta = self._read_meta(url) or {'url': url, 'seen': {}}
+            meta.update({'etag': etag, 'last_modified': last_modified, 'fetched': _time.time()})
+            if etag or last_modified:
+                with open(self._body_file(url), 'w', encoding='utf-8') as f:
+                    f.write(body)
+            elif _path.isfile(self._body_file(url)):
+                _os.remove(self._body_file(url))
+            self._write_meta(url, meta)
+
+    def seen(self, url: str, consumer: str) -> str | None:
+        """Get the body hash consumer last marked as seen for url"""
+        meta = self._read_meta(url)
+        return meta.get('seen', {}).get(consumer) if meta else None
+
+    def mark_seen(self, url: str, consumer: str, hash_: str) -> None:
+        """Record that consumer has successfully processed the page at url with body hash hash_"""
+        with self._lock:
+            meta = self._read_meta(url) or {'url': url, 'fetched': _time.time()}
+            meta.setdefault('seen', {})[consumer] = hash_
+            self._write_meta(url, meta)
+
+    def evict(self) -> int:
+        """
+        Evict entries older than max_age_seconds, then the oldest entries until we are under max_bytes.
+
+        Returns:
+            int: Number of entries evicted
+        """
+        with self._lock:
+            entries = []  # (fetched, key, size)
+            for fname in _os.listdir(self.root):
+                if not fname.endswith('.json'):
+                    continue
+                key = fname[:-5]
+                try:
+                    with open(_path.join(self.root, fname), encoding='utf-8') as f:
+                        fetched = _json.load(f).get('fetched', 0)
+                except (OSError, ValueError):
+                    fetched = 0
+                size = sum(_path.getsize(p) for p in self._files(key) if _path.isfile(p))
+                entries.append((fetched, key, size))
+
+            entries.sort()
+            total = sum(e[2] for e in entries)
+            cutoff = _time.time() - self.max_age_seconds
+            evicted = 0
+            for fetched, key, size in entries:
+                if fetched >= cutoff and total <= self.max_bytes:
+                    break
+                for p in self._files(key):
+                    if _path.isfile(p):
+                        _os.remove(p)
+                total -= size
+                evicted += 1
+            return evicted
+
+    # region private methods
+    @staticmethod
+    def _key(url: str) -> str:
+        return _hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _files(self, key: str) -> tuple[str, str]:
+        return _path.join(self.root, f'{key}.json'), _path.join(self.root, f'{key}.html')
+
+    def _body_file(self, url: str) -> str:
+        return self._files(self._key(url))[1]
+
+    def _read_meta(self, url: str) -> dict | None:
+        try:
+            with open(self._files(self._key(url))[0], encoding='utf-8') as f:
+                return _json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, url: str, meta: dict) -> None:
+        fname = self._files(self._key(url))[0]
+        tmp = f'{fname}.{_threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            _json.dump(meta, f)
+        _os.replace(tmp, fname)
+    # endregion private methods
+
+
+# region module methods
+_CACHE: PageCache | None = None
+_CACHE_LOCK = _threading.Lock()
+
+
+def get_cache() -> PageCache:
+    """Get the process wide page cache, creating it on first use from the settings in config.py"""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = PageCache(_config.PAGE_CACHE_DIR,
+                               max_age_seconds=_config.PAGE_CACHE_MAX_AGE_HOURS * 3600,
+                               max_bytes=_config.PAGE_CACHE_MAX_MB * 1024 * 1024)
+        return _CACHE
+
+
+def body_hash(source: str) -> str:
+    """
+    Hash of a page source, normalised so that script, style and whitespace churn doesn't count as a change.
+
+    Args:
+        source: Page source
+
+    Returns:
+        str: Hex digest
+    """
+    s = _RE_VOLATILE.sub('', source)
+    s = _RE_WHITESPACE.sub(' ', s)
+    return _hashlib.blake2b(s.encode('utf-8'), digest_size=16).hexdigest()
+# endregion module methods
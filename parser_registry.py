@@ -0,0 +1,124 @@
+"""
+Registry of monitor parsers, keyed by EnumParsers value (the monitor.parser column).
+
+Parsers are registered as 'module:attribute' strings and only imported when first asked for,
+so a process loads only the parser modules its monitors use. Parsers that only have a selector
+spec (see parser_specs) are built on demand. Parsers in other packages are discovered through
+the price_watch.parsers entry point group, e.g. in their pyproject.toml:
+
+    [project.entry-points."price_watch.parsers"]
+    AmazonSingleProduct = "price_watch_amazon:AmazonSingleProduct"
+
+A parser is a peewee model of table monitor with a scrape() method, see orm_extensions.MonitorBaseMixin.
+
+Examples:
+    >>> Parser = get(EnumParsers.Currys.value)
+    >>> Monitor = Parser.get_by_id(3)
+"""
+import importlib as _importlib
+import importlib.metadata as _metadata
+import threading as _threading
+
+from enums import EnumParsers
+from errors import UnknownParserError
+
+__all__ = ['ENTRY_POINT_GROUP', 'get', 'names', 'register']
+
+ENTRY_POINT_GROUP = 'price_watch.parsers'
+
+# EnumParsers value: 'module:attribute'. Parsers without an implementation are left out.
+_BUILTIN = {
+    EnumParsers.Argos.value: 'orm_extensions:Argos',
+    EnumParsers.AWDIT.value: 'orm_extensions:AWDIT',
+    EnumParsers.Box.value: 'orm_extensions:Box',
+    EnumParsers.CashConverters.value: 'orm_extensions:CashConverters',
+    EnumParsers.CCLOnline.value: 'orm_extensions:CCLOnline',
+    EnumParsers.Cex.value: 'orm_extensions:Cex',
+    EnumParsers.ComputerOrbit.value: 'orm_extensions:ComputerOrbit',
+    EnumParsers.Currys.value: 'orm_extensions:Currys',
+    EnumParsers.Novatech.value: 'orm_extensions:Novatech',
+    EnumParsers.Overclockers.value: 'orm_extensions:Overclockers',
+    EnumParsers.RyobiSingleProduct.value: 'orm_extensions:RyobiSingleProduct',
+    EnumParsers.Scan.value: 'orm_extensions:Scan',
+    EnumParsers.ScrewfixSingleProduct.value: 'orm_extensions:ScrewfixSingleProduct',
+    EnumParsers.ToolStationSingleProduct.value: 'orm_extensions:ToolStationSingleProduct',
+}
+
+_TARGETS = dict(_BUILTIN)  # name: 'module:attribute', an entry point, or the loaded class
+_LOCK = _threading.RLock()
+_DISCOVERED = False
+
+
+def register(name: str, target: str | type) -> None:
+    """
+    Register a parser, replacing any parser already registered under name.
+
+    Args:
+        name: The monitor.parser value, e.g. EnumParsers.Currys.value
+        target: The parser class, or 'module:attribute' to import it on first use
+    """
+    with _LOCK:
+        _TARGETS[name] = target
+
+
+def get(name: str) -> type:
+    """
+    Get the parser class registered under name, importing it on first use.
+
+    Args:
+        name: The monitor.parser value, e.g. EnumParsers.Currys.value
+
+    Raises:
+        errors.UnknownParserError: If no parser is registered under name, built in or by entry point
+
+    Returns:
+        type: The parser class
+    """
+    with _LOCK:
+        if name not in _TARGETS:
+            _discover()
+        target = _TARGETS.get(name)
+        if target is None:
+            raise UnknownParserError(f'No parser registered for "{name}"')
+        if isinstance(target, type):
+            return target
+
+        if isinstance(target, str):
+            module, _, attribute = target.partition(':')
+            Parser = getattr(_importlib.import_module(module), attribute)
+        else:  # an entry point or _SpecParser
+            Parser = target.load()
+        _TARGETS[name] = Parser
+        return Parser
+
+
+def names() -> list[str]:
+    """Get the names of every registered parser, built in, by spec and by entry point, without importing them"""
+    with _LOCK:
+        _discover()
+        return sorted(_TARGETS)
+
+
+# region module helper methods
+class _SpecParser:
+    """Target for a parser that only has a selector spec, built by orm_extensions.spec_parser on load"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def load(self) -> type:
+        return _importlib.import_module('orm_extensions').spec_parser(self.name)
+
+
+def _discover() -> None:
+    """Add parsers from parser_specs and the price_watch.parsers entry point group, once.
+    Registered and built in parsers take precedence, then specs."""
+    global _DISCOVERED
+    if _DISCOVERED:
+        return
+    _DISCOVERED = True
+    for name in _importlib.import_module('parser_specs').names():
+        _TARGETS.setdefault(name, _SpecParser(name))
+    for EntryPoint in _metadata.entry_points(group=ENTRY_POINT_GROUP):
+        _TARGETS.setdefault(EntryPoint.name, EntryPoint)
+# endregion module helper methods
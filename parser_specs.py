@@ -0,0 +1,292 @@
+"""
+Declarative selector specs for the monitor parsers.
+
+Each supplier is described by data in parser_specs.json, keyed by parser name (EnumParsers value),
+and scraped by the one generic engine in orm_extensions.MonitorBaseMixin. Adding a supplier, or fixing
+one after a site change, is an edit to the json. Files in config.PARSER_SPECS_FILES are merged over it.
+
+A spec has:
+    container   find_all args for a product card, e.g. ["div", "productitem"]. Also used for the SoupStrainer.
+    stock       Lower case phrase a card must contain to be in stock, or null for no stock test
+    price       Field, parsed with one of PRICE_PARSERS named by "parse"
+    url         Field, its href (unless attr says otherwise) joined to the site or page url as "join" says.
+                {"join": "page"} uses the page url.
+    title       Field
+    pagination  One of
+                    {"type": "none"}
+                    {"type": "query", "param": p, "value": v}  add p=v to the monitor url, e.g. to get one long page
+                    {"type": "links", "select": css, "join": j}  follow the hrefs of the links on page 1
+                    {"type": "offset", "present": css, "count": css, "per_page": n, "path": "?start={start}"}
+                        build the page urls from the result count, if present matches
+                    {"type": "last_page", "count": css, "per_page": n, "param": p}
+                        fetch only the last page, which includes every result, in place of page 1
+                Any of them can have "delay": false to fetch the other pages without the random pause
+                between them, for sites that were never scraped with one
+    notes       Free text, ignored
+
+A field has a CSS "select" (or a list of them, one value each), then optionally
+    within      Look only in the first match of this CSS, or at that match itself, rather than the whole card
+    attr        Read this attribute rather than the text
+    items       Indexes into all the matches of select, rather than the first match
+    optional    Use '' if nothing matches, rather than raising
+
+Joins are "none", "site", "url" (plain concatenation), or "site_path" and "url_path" (joined with one '/').
+Fully qualified hrefs are never joined.
+
+Selectors are compiled with soupsieve once per process and reused for every card and page.
+
+Examples:
+    >>> Spec = get('Currys')
+    >>> [Spec.price(card) for card in Spec.cards(soup) if Spec.in_stock(_card_text(card))]
+"""
+import functools as _functools
+import json as _json
+import os.path as _path
+from urllib.parse import parse_qsl as _parse_qsl
+from urllib.parse import urlencode as _urlencode
+from urllib.parse import urlparse as _urlparse
+
+import soupsieve as _soupsieve
+from bs4 import BeautifulSoup, Tag
+
+import funclite.stringslib as _stringslib
+
+import config as _config
+from errors import UnknownParserError
+
+__all__ = ['PRICE_PARSERS', 'ParserSpec', 'SPECS_PATH', 'get', 'names', 'urlconcat']
+
+SPECS_PATH = _path.join(_path.dirname(_path.abspath(__file__)), 'parser_specs.json')
+
+# name: function of the list of field values, returning the price
+PRICE_PARSERS = {
+    'float': lambda v: float(v[0].replace('£', '').replace(',', '')),
+    'number': lambda v: _stringslib.numbers_in_str(v[0], type_=float)[0],  # first number in the text
+    'pounds_99': lambda v: int(v[0]) + 0.99,
+    'concat': lambda v: float(''.join(v)),  # e.g. pounds and pence in separate elements
+    'pounds_pence': lambda v: _stringslib.numbers_in_str(v[0], type_=int)[0] + _stringslib.numbers_in_str(v[1], type_=int)[0] / 100,
+}
+
+PAGINATION_TYPES = ('none', 'query', 'links', 'offset', 'last_page')
+JOINS = ('none', 'site', 'url', 'site_path', 'url_path', 'page')
+
+
+class ParserSpec:
+    """
+    A compiled selector spec.
+
+    Args:
+        name: Parser name, e.g. 'Currys'
+        spec: The spec, as in parser_specs.json
+
+    Raises:
+        ValueError: If the spec is invalid, e.g. an unknown price parser or a bad selector
+    """
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.container = tuple(spec['container'])
+        self.stock = spec['stock'].lower() if spec.get('stock') else None
+        self.pagination = spec.get('pagination') or {'type': 'none'}
+
+        self._price = _Field(name, 'price', spec['price'])
+        self._parse_price = PRICE_PARSERS.get(spec['price'].get('parse', 'float'))
+        if self._parse_price is None:
+            raise ValueError(f'{name}: unknown price parser "{spec["price"].get("parse")}"')
+        self._url = _Field(name, 'url', spec['url'], attr='href')
+        self._url_join = spec['url'].get('join', 'none')
+        self._title = _Field(name, 'title', spec['title'])
+
+        if self.pagination['type'] not in PAGINATION_TYPES:
+            raise ValueError(f'{name}: unknown pagination type "{self.pagination["type"]}"')
+        for join in (self._url_join, self.pagination.get('join', 'none')):
+            if join not in JOINS:
+                raise ValueError(f'{name}: unknown join "{join}"')
+        self._page_links = _compile(name, self.pagination['select']) if 'select' in self.pagination else None
+        self._page_present = _compile(name, self.pagination['present']) if 'present' in self.pagination else None
+        self._page_count = _compile(name, self.pagination['count']) if 'count' in self.pagination else None
+
+    # region cards
+    def cards(self, soup: BeautifulSoup) -> list[Tag]:
+        """The product cards on a page"""
+        return soup.find_all(*self.container)
+
+    def in_stock(self, card_text: str) -> bool:
+        """Is the card in stock. card_text is from orm_extensions._card_text."""
+        return self.stock is None or self.stock in card_text
+
+    def price(self, card: Tag) -> float:
+        return self._parse_price(self._price.values(card))
+
+    def product_url(self, card: Tag, page_url: str, site: str) -> str:
+        if self._url_join == 'page':  # single product page
+            return page_url
+        return _join(self._url_join, self._url.values(card)[0], page_url, site)
+
+    def title(self, card: Tag) -> str:
+        return self._title.values(card)[0]
+    # endregion cards
+
+    # region pages
+    def first_page(self, url: str) -> str:
+        """The url of the first page to fetch for a monitor url"""
+        if self.pagination['type'] == 'query':
+            return _query_set(url, self.pagination['param'], self.pagination['value'], replace=False)
+        return url
+
+    @property
+    def needs_full_first_page(self) -> bool:
+        """Does page 1 need parsing in full, rather than just the product cards, to find the other pages"""
+        return self.pagination['type'] in ('links', 'offset', 'last_page')
+
+    @property
+    def page_delay(self) -> bool:
+        """Pause between fetching the other pages, unless the pagination says "delay": false"""
+        return self.pagination.get('delay', True)
+
+    @property
+    def replaces_first_page(self) -> bool:
+        """Do the page_urls replace page 1, rather than follow it"""
+        return self.pagination['type'] == 'last_page'
+
+    def page_urls(self, soup: BeautifulSoup, url: str, site: str) -> list[str]:
+        """
+        The urls of the other pages, from page 1.
+
+        Args:
+            soup: Page 1, parsed in full
+            url: Page 1 url
+            site: Site address, see MonitorBaseMixin.site
+
+        Returns:
+            list[str]: Page urls, which may repeat or include page 1
+        """
+        P = self.pagination
+        if P['type'] == 'links':
+            return [_join(P.get('join', 'none'), a['href'], url, site) for a in self._page_links.select(soup) if a.get('href')]
+
+        if P['type'] == 'offset':
+            if not self._page_present.select_one(soup):
+                return []
+            count = self._count(soup)
+            pages = count // P['per_page'] + 1 if count else 1
+            return [urlconcat(url, P['path'].format(start=(page - 1) * P['per_page'])) for page in range(2, pages + 1)]
+
+        if P['type'] == 'last_page':
+            pages = (self._count(soup) or 0) // P['per_page']
+            return [_query_set(url, P['param'], str(pages))] if pages > 1 else []
+        return []
+
+    def _count(self, soup: BeautifulSoup) -> int | None:
+        """Result count on page 1, if shown"""
+        element = self._page_count.select_one(soup)
+        if element is None:
+            return None
+        numbers = _stringslib.numbers_in_str(element.text)
+        return int(numbers[0]) if numbers else None
+    # endregion pages
+
+
+@_functools.lru_cache(maxsize=None)
+def get(name: str) -> ParserSpec:
+    """
+    Get the compiled spec for a parser. Compiled once per process.
+
+    Raises:
+        errors.UnknownParserError: If there is no spec for name
+    """
+    specs = _specs()
+    if name not in specs:
+        raise UnknownParserError(f'No selector spec for "{name}"')
+    return ParserSpec(name, specs[name])
+
+
+def names() -> list[str]:
+    """Names of the parsers with specs, without compiling them"""
+    return sorted(_specs())
+
+
+def urlconcat(url: str, s: str) -> str:
+    """Join url and s with exactly one '/', e.g. ('https://a.com/', '/b') gives 'https://a.com/b'"""
+    tmp_url = url[:-1] if url[-1] == '/' else url
+    if s[0] == '/':
+        return f'{tmp_url}{s}'
+    else:
+        return f'{tmp_url}/{s}'
+
+
+# region module helper methods
+class _Field:
+    """A compiled field of a spec"""
+
+    def __init__(self, parser: str, name: str, spec: dict, attr: str | None = None):
+        self.name = f'{parser} {name}'
+        select = spec.get('select')
+        self.selectors = [_compile(parser, s) for s in ([select] if isinstance(select, str) else select or [])]
+        self.within = _compile(parser, spec['within']) if spec.get('within') else None
+        self.attr = spec.get('attr', attr)
+        self.items = spec.get('items')
+        self.optional = spec.get('optional', False)
+
+    def values(self, card: Tag) -> list[str]:
+        scope = self.within.select_one(card) if self.within else card
+        if self.items:
+            found = self.selectors[0].select(scope) if scope is not None else []
+            return [self._value(found[i] if i < len(found) else None) for i in self.items]
+        return [self._value(self._select_one(S, scope)) for S in self.selectors]
+
+    def _select_one(self, selector, scope: Tag | None) -> Tag | None:
+        if scope is None:
+            return None
+        if self.within and selector.match(scope):
+            return scope
+        return selector.select_one(scope)
+
+    def _value(self, element: Tag | None) -> str:
+        if element is None:
+            if self.optional:
+                return ''
+            raise ValueError(f'{self.name} selector matched nothing')
+        return element[self.attr] if self.attr else element.text
+
+
+def _compile(parser: str, css: str):
+    try:
+        return _soupsieve.compile(css)
+    except _soupsieve.SelectorSyntaxError as e:
+        raise ValueError(f'{parser}: bad selector "{css}"') from e
+
+
+def _join(kind: str, href: str, url: str, site: str) -> str:
+    if href.startswith(('http://', 'https://')):
+        return href
+    if kind == 'site':
+        return f'{site}{href}'
+    if kind == 'url':
+        return f'{url}{href}'
+    if kind == 'site_path':
+        return urlconcat(site, href)
+    if kind == 'url_path':
+        return urlconcat(url, href)
+    return href
+
+
+def _query_set(url: str, param: str, value: str, replace: bool = True) -> str:
+    """Set param=value in the query string of url. If not replace, a param already in the url is kept."""
+    parts = _urlparse(url)
+    pairs = _parse_qsl(parts.query, keep_blank_values=True)
+    if not replace and any(k == param for k, _ in pairs):
+        return url
+    pairs = [(k, v) for k, v in pairs if k != param] + [(param, value)]
+    return parts._replace(query=_urlencode(pairs)).geturl()
+
+
+@_functools.lru_cache(maxsize=None)
+def _specs() -> dict[str, dict]:
+    with open(SPECS_PATH, encoding='utf-8') as f:
+        specs = _json.load(f)
+    for fname in _config.PARSER_SPECS_FILES:
+        with open(fname, encoding='utf-8') as f:
+            specs.update(_json.load(f))
+    return specs
+# endregion module helper methods
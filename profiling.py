@@ -0,0 +1,203 @@
+"""
+Profile monitor scrapes, per parser, e.g. when a site redesign suddenly makes a parser slow.
+
+A Profiler wraps each scrape, see scheduler.Scheduler.run and price_checker.py --profile, and writes to its folder:
+    <parser>.prof        cProfile mode. pstats of every scrape for the parser, for snakeviz, flameprof or gprof2dot.
+    <parser>.collapsed   sample mode. Stacks sampled every interval from the scraping thread, one
+                         'frame;frame;frame count' line per stack, for flamegraph.pl, speedscope or inferno.
+    <parser>.tracemalloc tracemalloc snapshot of the parser's hungriest page, taken while its soup was still held,
+                         see Profiler.page. Load it with tracemalloc.Snapshot.load.
+    memory.txt           Peak memory during, and memory still held after, each scrape, and the top allocations per parser.
+                         Pages are streamed, see MonitorBaseMixin.soups, so peak should not grow with the number of pages.
+
+cProfile and the sampler only profile the scraping thread, so pages fetched concurrently (SCRAPE_PARALLEL_PAGES)
+are left out. tracemalloc sees every thread, so monitors should be scraped one at a time while profiling.
+
+Examples:
+    >>> Profiler_ = Profiler('C:/temp/profile', mode='sample')
+    >>> with Profiler_.scrape(Monitor):
+    ...     Monitor.scrape()
+    >>> Profiler_.write()
+"""
+import cProfile as _cProfile
+import contextlib as _contextlib
+import os as _os
+import os.path as _path
+import pstats as _pstats
+import sys as _sys
+import threading as _threading
+import tracemalloc as _tracemalloc
+
+__all__ = ['MODES', 'Profiler']
+
+MODES = ('cprofile', 'sample')
+
+
+class Profiler:
+    """
+    Profile of monitor scrapes, per parser.
+
+    Args:
+        folder: Folder to write the profiles to, created if it doesn't exist
+        mode: 'cprofile' for deterministic profiles, or 'sample' for sampled stacks with much less overhead
+        interval: Seconds between samples, sample mode only
+        trace_memory: Take tracemalloc snapshots of peak memory
+    """
+
+    def __init__(self, folder: str, mode: str = 'cprofile', interval: float = 0.005, trace_memory: bool = True):
+        if mode not in MODES:
+            raise ValueError(f'Unknown profile mode "{mode}", expected one of {MODES}')
+        self.folder = folder
+        self.mode = mode
+        self.trace_memory = trace_memory
+        self._stats = {}  # parser: pstats.Stats
+        self._memory = []  # (parser, monitorid, peak bytes, held bytes)
+        self._snapshots = {}  # parser: (bytes held, tracemalloc.Snapshot)
+        self._before = {}  # monitorid: bytes traced when its scrape started
+        self._lock = _threading.Lock()
+        self._sampler = _Sampler(interval) if mode == 'sample' else None
+        _os.makedirs(folder, exist_ok=True)
+        if self._sampler:
+            self._sampler.start()
+        if trace_memory and not _tracemalloc.is_tracing():
+            _tracemalloc.start()
+
+    @_contextlib.contextmanager
+    def scrape(self, Monitor):
+        """
+        Profile the block, a scrape of Monitor. Monitor calls page as it finishes each page, for the tracemalloc snapshot.
+
+        Args:
+            Monitor: The monitor instance, e.g. an orm_extensions.Currys
+        """
+        parser = Monitor.parser
+        Profile = _cProfile.Profile() if self.mode == 'cprofile' else None
+        if self.trace_memory:
+            before = self._before[Monitor.monitorid] = _tracemalloc.get_traced_memory()[0]
+            _tracemalloc.reset_peak()
+        Monitor._profiler = self
+        try:
+            if Profile is not None:
+                with Profile:
+                    yield
+            else:
+                with self._sampler.track(parser):
+                    yield
+        finally:
+            Monitor._profiler = None
+            if self.trace_memory:
+                current, peak = _tracemalloc.get_traced_memory()
+                self._memory_add(parser, Monitor.monitorid, peak - before, current - before)
+                self._before.pop(Monitor.monitorid, None)
+            if Profile is not None:
+                with self._lock:
+                    if parser in self._stats:
+                        self._stats[parser].add(Profile)
+                    else:
+                        self._stats[parser] = _pstats.Stats(Profile)
+
+    def page(self, Monitor) -> None:
+        """
+        Called by Monitor.scrape with a page's soup still held. Snapshots tracemalloc if this is the most memory
+        any scrape of the parser has held at the end of a page, as the decomposed soup is gone by the end of the scrape.
+
+        Args:
+            Monitor: The monitor instance being scraped under scrape
+        """
+        before = self._before.get(Monitor.monitorid)
+        if before is None:
+            return
+        held = _tracemalloc.get_traced_memory()[0] - before
+        with self._lock:
+            if held > self._snapshots.get(Monitor.parser, (-1, None))[0]:
+                self._snapshots[Monitor.parser] = (held, _tracemalloc.take_snapshot())
+
+    def write(self) -> list[str]:
+        """
+        Write the profiles and the memory report to the folder. Stops the sampler.
+
+        Returns:
+            list[str]: The files written
+        """
+        files = []
+        with self._lock:
+            for parser, Stats in self._stats.items():
+                files.append(self._fname(parser, 'prof'))
+                Stats.dump_stats(files[-1])
+            for parser, (_, Snapshot) in self._snapshots.items():
+                files.append(self._fname(parser, 'tracemalloc'))
+                Snapshot.dump(files[-1])
+        if self._sampler:
+            self._sampler.stop()
+            for parser, stacks in self._sampler.stacks.items():
+                files.append(self._fname(parser, 'collapsed'))
+                with open(files[-1], 'w', encoding='utf-8') as f:
+                    f.writelines(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+        if self.trace_memory:
+            files.append(_path.join(self.folder, 'memory.txt'))
+            with open(files[-1], 'w', encoding='utf-8') as f:
+                f.write(self.memory_report())
+        return files
+
+    def memory_report(self, top: int = 10) -> str:
+        """Peak memory during, and memory still held after, each scrape, then the top allocations of each parser's hungriest scrape"""
+        lines = [f'{"parser":26} {"monitor":>7} {"peak MB":>8} {"held MB":>8}']
+        with self._lock:
+            for parser, monitorid, peak, held in sorted(self._memory, key=lambda m: -m[2]):
+                lines.append(f'{parser:26} {monitorid:7} {peak / 1024 / 1024:8.1f} {held / 1024 / 1024:8.1f}')
+            for parser, (peak, Snapshot) in sorted(self._snapshots.items()):
+                lines += ['', f'{parser}, top allocations with its hungriest page held']
+                lines += [f'  {Stat}' for Stat in Snapshot.statistics('lineno')[:top]]
+        return '\n'.join(lines) + '\n'
+
+    def _memory_add(self, parser: str, monitorid: int, peak: int, held: int) -> None:
+        with self._lock:
+            self._memory.append((parser, monitorid, peak, held))
+
+    def _fname(self, parser: str, ext: str) -> str:
+        return _path.join(self.folder, f'{parser}.{ext}')
+
+
+# region module helper methods
+class _Sampler:
+    """Samples the stacks of tracked threads every interval, counting each distinct stack per key"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = {}  # key: {collapsed stack: samples}
+        self._threads = {}  # thread ident: key
+        self._stop = _threading.Event()
+        self._thread = _threading.Thread(target=self._run, name='profiling', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    @_contextlib.contextmanager
+    def track(self, key: str):
+        """Sample the current thread as key for the duration of the block"""
+        ident = _threading.get_ident()
+        self._threads[ident] = key
+        try:
+            yield
+        finally:
+            self._threads.pop(ident, None)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = _sys._current_frames()  # noqa
+            for ident, key in list(self._threads.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({_path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                if stack:
+                    stacks = self.stacks.setdefault(key, {})
+                    collapsed = ';'.join(reversed(stack))
+                    stacks[collapsed] = stacks.get(collapsed, 0) + 1
+# endregion module helper methods
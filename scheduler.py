@@ -0,0 +1,310 @@
+"""
+Adaptive, per host scheduling of monitor scrapes.
+
+Each monitor has its own next_run, set after every scrape to SCHEDULER_INTERVAL_SECONDS plus a random
+jitter of up to SCHEDULER_JITTER_SECONDS from then, so monitors spread out rather than all falling due at once.
+Due monitors are grouped by the host of their url. Each host gets its own worker thread, and monitors
+for the same host are scraped one after another with the politeness delay from config.py between them.
+
+Every page request takes a token from its host's budget of SCHEDULER_HOST_REQUESTS_PER_MINUTE first,
+waiting if the host has had its share, see acquire and MonitorBaseMixin._page_to_str.
+
+A host error (see is_host_error), e.g. a captcha or an HTTP 429, backs off that host alone. The rest of its
+monitors are left for later, and none are due again until the backoff is over. The backoff starts at
+SCHEDULER_BACKOFF_SECONDS, doubles with each consecutive host error up to SCHEDULER_MAX_BACKOFF_SECONDS,
+and is cleared by the next scrape the host answers. Other hosts keep their cadence.
+Backoff is kept in memory, so a restart clears it.
+
+Every scrape sets monitor.last_run and next_run, and an error sets last_error and last_error_when.
+
+Examples:
+    >>> Scheduler = get_scheduler()
+    >>> Scheduler.run(Scheduler.due(monitors))
+    >>> sleep(Scheduler.seconds_until_due(monitors))
+"""
+import random as _random
+import threading as _threading
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from datetime import datetime as _datetime
+from datetime import timedelta as _timedelta
+from time import monotonic as _monotonic
+from time import sleep as _sleep
+from urllib.parse import urlparse as _urlparse
+
+import requests as _requests
+
+import config as _config
+import errors as _errors
+import http_fetch as _http_fetch
+import metrics as _metrics
+from orm import DATABASE as _DATABASE
+from orm import Monitor as _Monitor
+
+__all__ = ['HOST_ERROR_STATUS_CODES', 'Scheduler', 'get_scheduler', 'host_of', 'is_host_error',
+           'politeness_delay', 'run_cycle']
+
+# HTTP status codes, besides 5xx, that mean the host is blocking or throttling us
+HOST_ERROR_STATUS_CODES = (403, 429)
+
+
+class Scheduler:
+    """
+    Per monitor next run times, per host request budgets and per host backoff. Thread safe.
+    Arguments default to the SCHEDULER_ values in config.py.
+
+    Args:
+        interval_seconds: Seconds between scrapes of a monitor
+        jitter_seconds: Up to this many seconds are added to each interval at random
+        backoff_seconds: Backoff after a host's first host error
+        max_backoff_seconds: Longest backoff
+        requests_per_minute: Page requests allowed per host per minute, 0 for no limit
+        burst: Page requests a host can be sent back to back before requests_per_minute applies
+        max_workers: Max hosts scraped at the same time
+    """
+
+    def __init__(self, interval_seconds: float | None = None, jitter_seconds: float | None = None,
+                 backoff_seconds: float | None = None, max_backoff_seconds: float | None = None,
+                 requests_per_minute: float | None = None, burst: int | None = None, max_workers: int | None = None):
+        self.interval_seconds = _config.SCHEDULER_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+        self.jitter_seconds = _config.SCHEDULER_JITTER_SECONDS if jitter_seconds is None else jitter_seconds
+        self.backoff_seconds = _config.SCHEDULER_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.max_backoff_seconds = _config.SCHEDULER_MAX_BACKOFF_SECONDS if max_backoff_seconds is None else max_backoff_seconds
+        self.requests_per_minute = _config.SCHEDULER_HOST_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute
+        self.burst = burst or _config.SCHEDULER_HOST_BURST
+        self.max_workers = max_workers or _config.SCHEDULER_MAX_WORKERS
+        self._hosts = {}  # host: _Host
+        self._lock = _threading.Lock()
+
+    # region scheduling
+    def due(self, monitors: list, now: _datetime | None = None) -> list:
+        """
+        Get the monitors due a scrape, longest overdue first.
+        Monitors without a next_run are due now. Monitors of hosts that are backing off are left out.
+
+        Args:
+            monitors: Monitor parser instances (e.g. orm_extensions.Currys)
+            now: Defaults to now
+        """
+        now = now or _datetime.now()
+        due = [M for M in monitors if (M.next_run is None or M.next_run <= now) and not self.backing_off(host_of(M.url), now)]
+        return sorted(due, key=lambda M: M.next_run or _datetime.min)
+
+    def seconds_until_due(self, monitors: list, now: _datetime | None = None) -> float:
+        """
+        Get the seconds until the next of monitors is due, allowing for host backoff.
+
+        Returns:
+            float: 0 if a monitor is due now, inf if there are no monitors
+        """
+        now = now or _datetime.now()
+        whens = [max(M.next_run or now, self.backoff_until(host_of(M.url)) or now) for M in monitors]
+        return max(0., (min(whens) - now).total_seconds()) if whens else float('inf')
+
+    def run(self, monitors: list, max_workers: int | None = None, profiler=None) -> None:
+        """
+        Scrape monitors now, concurrently across hosts and serially within a host, and record each run on the monitor.
+        A host error stops the rest of that host's monitors, they are scraped once its backoff is over.
+
+        Args:
+            monitors: Monitor parser instances (e.g. orm_extensions.Currys), each must have url and scrape()
+            max_workers: Max concurrent hosts, defaults to max_workers of the scheduler
+            profiler: A profiling.Profiler to run every scrape under. Pass max_workers=1 too, tracemalloc sees every thread.
+        """
+        by_host = {}
+        for M in monitors:
+            by_host.setdefault(host_of(M.url), []).append(M)
+        if not by_host:
+            return
+
+        max_workers = max_workers or self.max_workers
+        with _ThreadPoolExecutor(max_workers=min(max_workers, len(by_host)), thread_name_prefix='scrape') as Pool:
+            futures = [Pool.submit(self._run_host, host, monitors_, profiler) for host, monitors_ in by_host.items()]
+            for future in futures:
+                future.result()
+    # endregion scheduling
+
+    # region hosts
+    def acquire(self, url: str) -> float:
+        """
+        Take a request from the budget of the host of url, waiting until the host has one to spare.
+
+        Args:
+            url: The url about to be fetched
+
+        Returns:
+            float: Seconds waited
+        """
+        if not self.requests_per_minute:
+            return 0.
+        host = host_of(url)
+        Host = self._host(host)
+        rate = self.requests_per_minute / 60
+        waited = 0.
+        while True:
+            with Host.lock:
+                now = _monotonic()
+                Host.tokens = min(self.burst, Host.tokens + (now - Host.updated) * rate)
+                Host.updated = now
+                if Host.tokens >= 1:
+                    Host.tokens -= 1
+                    break
+                wait = (1 - Host.tokens) / rate
+            _sleep(wait)
+            waited += wait
+        if waited:
+            _metrics.observe_budget_wait(host, waited)
+        return waited
+
+    def backoff_until(self, host: str) -> _datetime | None:
+        """When the backoff of host is over, None if it isn't backing off"""
+        with self._lock:
+            Host = self._hosts.get(host)
+            return Host.backoff_until if Host else None
+
+    def backing_off(self, host: str, now: _datetime | None = None) -> bool:
+        until = self.backoff_until(host)
+        return until is not None and until > (now or _datetime.now())
+    # endregion hosts
+
+    # region private methods
+    def _host(self, host: str) -> '_Host':
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(self.burst)
+            return self._hosts[host]
+
+    def _run_host(self, host: str, monitors: list, profiler=None) -> None:
+        for i, M in enumerate(monitors):
+            if self.backing_off(host):
+                print(f'Backing off {host}, {len(monitors) - i} monitors left for later')
+                return
+            if i:
+                _sleep(politeness_delay())
+            try:
+                with _DATABASE.connection_context():  # return the pooled connection when done
+                    if profiler is None:
+                        M.scrape()  # scrape logs its own errors, this is a backstop so one monitor can't kill the host
+                    else:
+                        with profiler.scrape(M):
+                            M.scrape()
+                error = getattr(M, '_error', None)
+            except Exception as e:
+                print(f'Unhandled error scraping {host} monitorid {M.monitorid}: {repr(e)}')
+                error = e
+            try:
+                with _DATABASE.connection_context():
+                    self._record(M, error)
+            except Exception as e:
+                print(f'Error recording the run of monitorid {M.monitorid}: {repr(e)}')
+
+    def _record(self, M, error: Exception | None) -> None:
+        """Set next_run, and back off or clear the host, from the outcome of a scrape of M"""
+        now = _datetime.now()
+        host = host_of(M.url)
+        if error is not None and is_host_error(error):
+            next_run = self._host_failed(host, error, now)
+        else:
+            self._host_answered(host)
+            next_run = now + _timedelta(seconds=self.interval_seconds + _random.uniform(0, self.jitter_seconds))
+
+        fields = {'last_run': now, 'next_run': next_run}
+        if error is not None:
+            fields.update(last_error=repr(error)[:8096], last_error_when=now)
+        _Monitor.update(**fields).where(_Monitor.monitorid == M.monitorid).execute()
+        for name, value in fields.items():
+            setattr(M, name, value)
+
+    def _host_failed(self, host: str, error: Exception, now: _datetime) -> _datetime:
+        """Back off host after a host error. Returns when the backoff is over."""
+        Host = self._host(host)
+        with self._lock:
+            Host.failures += 1
+            seconds = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (Host.failures - 1) * _random.uniform(1, 1.25))
+            Host.backoff_until = until = now + _timedelta(seconds=seconds)
+            failures = Host.failures
+        print(f'Backing off {host} for {seconds:.0f} seconds after {failures} host errors, the last was {repr(error)}')
+        _metrics.observe_backoff(host, seconds)
+        return until
+
+    def _host_answered(self, host: str) -> None:
+        Host = self._host(host)
+        with self._lock:
+            recovered = Host.failures > 0
+            Host.failures = 0
+            Host.backoff_until = None
+        if recovered:
+            _metrics.observe_backoff(host, 0)
+    # endregion private methods
+
+
+# region module methods
+_SCHEDULER: Scheduler | None = None
+_SCHEDULER_LOCK = _threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """Get the process wide scheduler, created on first use from the SCHEDULER_ values in config.py"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = Scheduler()
+        return _SCHEDULER
+
+
+def host_of(url: str) -> str:
+    """The host of url, lower case, e.g. 'www.currys.co.uk'"""
+    return _urlparse(url).netloc.lower()
+
+
+def is_host_error(e: Exception) -> bool:
+    """
+    Does e mean the host is blocking or struggling, rather than something wrong with one monitor.
+    A captcha, an HTTP 5xx or one of HOST_ERROR_STATUS_CODES, or a timeout or connection error.
+    """
+    if isinstance(e, (_errors.CaptchaError,) + _http_fetch.TRANSPORT_ERRORS):
+        return True
+    if isinstance(e, _requests.HTTPError):
+        status = getattr(e.response, 'status_code', None)
+        return status is None or status in HOST_ERROR_STATUS_CODES or status >= 500
+    return False
+
+
+def politeness_delay() -> float:
+    """
+    Get a randomised delay in seconds from SCRAPE_DELAY_BETWEEN_PAGES_SECONDS and SCRAPE_DELAY_RANDOM_FACTOR.
+
+    Returns:
+        float: The delay, e.g. between 4 and 6 for a delay of 5 and a factor of 0.2
+    """
+    delay = _config.SCRAPE_DELAY_BETWEEN_PAGES_SECONDS
+    factor = _config.SCRAPE_DELAY_RANDOM_FACTOR
+    return max(0., _random.uniform(delay * (1 - factor), delay * (1 + factor)))
+
+
+def run_cycle(monitors: list, max_workers: int | None = None, profiler=None) -> None:
+    """
+    Scrape every monitor now, due or not, with the process wide scheduler. See Scheduler.run.
+
+    Args:
+        monitors: Monitor parser instances (e.g. orm_extensions.Currys), each must have url and scrape()
+        max_workers: Max concurrent hosts, defaults to config.SCHEDULER_MAX_WORKERS
+        profiler: A profiling.Profiler to run every scrape under. Pass max_workers=1 too, tracemalloc sees every thread.
+
+    Returns:
+        None
+    """
+    get_scheduler().run(monitors, max_workers=max_workers, profiler=profiler)
+# endregion module methods
+
+
+# region module helper methods
+class _Host:
+    """Request budget, a token bucket, and backoff of a host"""
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.updated = _monotonic()
+        self.failures = 0  # consecutive host errors
+        self.backoff_until: _datetime | None = None
+        self.lock = _threading.Lock()  # the budget, backoff is under Scheduler._lock
+# endregion module helper methods
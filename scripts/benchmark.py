@@ -0,0 +1,345 @@
+"""
+Offline benchmarks against saved page sources.
+
+Save page sources to a folder as <Parser>.html or <Parser>_<anything>.html,
+e.g. Currys_page1.html, where Parser is registered in parser_registry.
+
+Examples:
+    Compare the old full html.parser parse against lxml with the product container SoupStrainer
+    > python scripts/benchmark.py parse C:/development/price_watch/pages
+
+    Per product card cost of serialising, matching and the in stock test, old vs _card_text
+    > python scripts/benchmark.py cards C:/development/price_watch/pages -m 9070xt "in stock"
+
+    Check normaliser gives the same output as the old _fix_source on a golden corpus, and compare MB/s
+    > python scripts/benchmark.py normalise C:/development/price_watch/pages
+
+    Replay pages recorded with price_checker.py --fixtures record through every parser, with no network,
+    and report fetch, normalise, parse, match and db_write time per supplier. Save a baseline, then fail
+    on a regression of more than 25% against it, e.g. in CI.
+    > python scripts/benchmark.py parsers C:/development/price_watch/fixtures --save baseline.json
+    > python scripts/benchmark.py parsers C:/development/price_watch/fixtures --baseline baseline.json
+
+    Replay the fixtures that ship with the repo, as tests/test_parsers.py does
+    > python scripts/benchmark.py parsers tests/fixtures
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os.path as path
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import fixtures
+import log_sink
+import metrics
+import orm
+import orm_extensions
+import parser_registry
+from normaliser import Normaliser
+
+
+def main():
+    """main"""
+    cmdline = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = cmdline.add_subparsers(dest='benchmark', required=True)
+
+    cmd = sub.add_parser('parse', help='Parse time and peak memory per supplier, before and after lxml + SoupStrainer')
+    cmd.add_argument('folder', help='Folder of saved page sources')
+    cmd.add_argument('-n', '--number', type=int, default=5, help='Parses per page to average over')
+
+    cmd = sub.add_parser('cards', help='Per card cost of serialise, match and in stock test, before and after _card_text')
+    cmd.add_argument('folder', help='Folder of saved page sources')
+    cmd.add_argument('-m', '--match', nargs='+', default=['9070xt'], help='match_and terms')
+    cmd.add_argument('-n', '--number', type=int, default=20, help='Passes over the cards to average over')
+
+    cmd = sub.add_parser('normalise', help='Golden check and MB/s of normaliser against the old _fix_source')
+    cmd.add_argument('folder', nargs='?', help='Folder of saved page sources, added to the synthetic corpus')
+    cmd.add_argument('-n', '--number', type=int, default=5, help='Passes over the corpus to average over')
+
+    cmd = sub.add_parser('parsers', help='Per stage time per supplier, replaying recorded fixtures with no network')
+    cmd.add_argument('folder', nargs='?', help='Fixtures folder, see fixtures. Defaults to config.FIXTURES_DIR')
+    cmd.add_argument('-p', '--parsers', nargs='+', help='Only these parsers, default all recorded')
+    cmd.add_argument('-n', '--number', type=int, default=5, help='Scrapes per monitor to take the median of')
+    cmd.add_argument('--save', help='Write the results to this json file, for use as a --baseline')
+    cmd.add_argument('--baseline', help='Compare with results written by --save. Exits 1 on a regression or a scrape error.')
+    cmd.add_argument('--tolerance', type=float, default=0.25, help='Slowdown on the baseline allowed per supplier, e.g. 0.25 for 25%%')
+
+    args = cmdline.parse_args()
+    if args.benchmark == 'parse':
+        bench_parse(args.folder, args.number)
+    elif args.benchmark == 'cards':
+        bench_cards(args.folder, args.match, args.number)
+    elif args.benchmark == 'normalise':
+        sys.exit(0 if bench_normalise(args.folder, args.number) else 1)
+    elif args.benchmark == 'parsers':
+        sys.exit(0 if bench_parsers(args.folder, args.parsers, args.number, args.save, args.baseline, args.tolerance) else 1)
+
+
+def bench_parse(folder: str, number: int = 5) -> None:
+    """
+    Print parse time and peak memory per page, for the full html.parser parse vs the parser's _soupify.
+
+    Args:
+        folder: Folder of saved page sources
+        number: Parses per page to average over
+    """
+    print(f'Parser backend: {orm_extensions._PARSER}')  # noqa
+    print(f'{"page":40} {"KB":>7} {"before ms":>10} {"after ms":>10} {"x":>6} {"before MB":>10} {"after MB":>10}')
+    for fname, Parser, src in _pages(folder):
+        Monitor = Parser()
+        before = _time_ms(lambda: BeautifulSoup(src, 'html.parser'), number)
+        after = _time_ms(lambda: Monitor._soupify(src), number)  # noqa
+        before_mb = _peak_mb(lambda: BeautifulSoup(src, 'html.parser'))
+        after_mb = _peak_mb(lambda: Monitor._soupify(src))  # noqa
+        print(f'{fname:40} {len(src) / 1024:7.0f} {before:10.1f} {after:10.1f} {before / after:6.1f} {before_mb:10.1f} {after_mb:10.1f}')
+
+
+def bench_cards(folder: str, terms: list[str], number: int = 20) -> None:
+    """
+    Print the per card cost of turning a card into text, matching it and the in stock test.
+
+    Before is str(product).lower() with the terms and haystack lowercased per term, as scrape used to.
+    After is _card_text once per card, shared by the match and stock test.
+
+    Args:
+        folder: Folder of saved page sources
+        terms: Terms to match, as for match_and
+        number: Passes over the cards to average over
+    """
+    terms_lower = [t.lower() for t in terms]
+
+    def _before(cards):
+        for product in cards:
+            s = str(product).lower()
+            _ = all([t.lower() in s.lower() for t in terms]) and 'in stock' in s
+
+    def _after(cards):
+        for product in cards:
+            s = orm_extensions._card_text(product)  # noqa
+            _ = all([t in s for t in terms_lower]) and 'in stock' in s
+
+    print(f'{"page":40} {"cards":>6} {"before us":>10} {"after us":>10} {"x":>6}')
+    for fname, Parser, src in _pages(folder):
+        cards = Parser()._soupify(src).find_all(*Parser.PRODUCT_CONTAINER)  # noqa
+        if not cards:
+            print(f'{fname:40} {0:6}')
+            continue
+        before = _time_ms(lambda: _before(cards), number) * 1000 / len(cards)
+        after = _time_ms(lambda: _after(cards), number) * 1000 / len(cards)
+        print(f'{fname:40} {len(cards):6} {before:10.1f} {after:10.1f} {before / after:6.1f}')
+
+
+def bench_normalise(folder: str | None = None, number: int = 5) -> bool:
+    """
+    Check Normaliser against the old nested str.replace _fix_source and print throughput of both.
+
+    The golden corpus is a fixed seed synthetic corpus built from model number fragments in every casing,
+    plus any saved pages in folder.
+
+    Args:
+        folder: Optional folder of saved page sources
+        number: Passes over the corpus to average over
+
+    Returns:
+        bool: True if the outputs were identical for the whole corpus
+    """
+    N = Normaliser()
+    corpus = _golden_corpus()
+    if folder:
+        corpus += [src for _, _, src in _pages(folder)]
+
+    mismatches = [s for s in corpus if N.normalise(s) != _fix_source_legacy(s)]
+    for s in mismatches[:10]:
+        print(f'MISMATCH {s[:80]!r}\n  old: {_fix_source_legacy(s)[:80]!r}\n  new: {N.normalise(s)[:80]!r}')
+    print(f'{len(corpus)} documents, {len(mismatches)} mismatches')
+
+    mb = sum(len(s) for s in corpus) / 1024 / 1024
+    for name, func in (('old', _fix_source_legacy), ('new', N.normalise)):
+        secs = _time_ms(lambda: [func(s) for s in corpus], number) / 1000
+        print(f'{name}: {mb / secs:8.1f} MB/s')
+    return not mismatches
+
+
+def bench_parsers(folder: str | None = None, parsers: list[str] | None = None, number: int = 5,
+                  save: str | None = None, baseline: str | None = None, tolerance: float = 0.25,
+                  db: str | None = None) -> bool:
+    """
+    Scrape every recorded monitor from its fixtures and print the median ms per stage, per supplier.
+
+    Monitors are recreated from their recordings in a scratch database, and their history is cleared
+    before every scrape so the database write is timed each time. The fixtures mode and orm.DATABASE
+    are put back as they were when done.
+
+    Args:
+        folder: Fixtures folder, defaults to config.FIXTURES_DIR
+        parsers: Only these parsers, default all recorded
+        number: Scrapes per monitor to take the median of
+        save: Write the results to this json file
+        baseline: Compare with results written by save
+        tolerance: Slowdown on the baseline allowed per supplier, e.g. 0.25 for 25%
+        db: Scratch database file, kept afterwards. Defaults to a temporary file that is removed.
+
+    Returns:
+        bool: False if a scrape failed, or a supplier total regressed on baseline by more than tolerance
+    """
+    with _replay_into(folder, db) as (Store, db):
+        print(f'Replaying {Store.root} into scratch database {db}')
+
+        ok, results = True, {}
+        stages = metrics.STAGES + ('total',)
+        print(f'{"parser":26} {"monitor":>7} {"pages":>5} {"rows":>5} ' + ' '.join(f'{s:>9}' for s in stages))
+        for parser in parsers or Store.parsers():
+            Parser = parser_registry.get(parser)
+            for monitor in Store.monitors(parser):
+                monitorid = monitor['monitorid']
+                with orm.DATABASE.connection_context():
+                    _benchmark_monitor(monitor)
+                runs, errors = [], []
+                for _ in range(number):
+                    with orm.DATABASE.connection_context():
+                        orm.MonitorHistory.delete().where(orm.MonitorHistory.monitorid == monitorid).execute()
+                        orm.MonitorLatestPrice.delete().where(orm.MonitorLatestPrice.monitorid == monitorid).execute()
+                        Monitor = Parser.get_by_id(monitorid)
+                        Monitor.scrape()
+                        runs.append(dict(Monitor._timings.seconds, total=Monitor._timings.total))  # noqa
+                        pages = Monitor._timings.counts.get('fetch', 0)  # noqa
+                        if Monitor._error is not None:  # noqa, set by _log_scraping_error, as is scrape_run.status
+                            errors.append(repr(Monitor._error))  # noqa
+
+                with orm.DATABASE.connection_context():
+                    rows = orm.MonitorHistory.select().where(orm.MonitorHistory.monitorid == monitorid).count()
+                ms = {s: statistics.median(r.get(s, 0) for r in runs) * 1000 for s in stages}
+                results[f'{parser}:{monitorid}'] = ms
+                print(f'{parser:26} {monitorid:7} {pages:5} {rows:5} ' + ' '.join(f'{ms[s]:9.1f}' for s in stages))
+                for e in errors[:1]:
+                    print(f'  ERROR {e}')
+                ok = ok and not errors
+
+    if save:
+        with open(save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        print(f'Saved {save}')
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            before = json.load(f)
+        for key, ms in results.items():
+            if key in before and ms['total'] > before[key]['total'] * (1 + tolerance):
+                print(f'REGRESSION {key} {before[key]["total"]:.1f}ms -> {ms["total"]:.1f}ms')
+                ok = False
+    return ok
+
+
+# region helpers
+@contextlib.contextmanager
+def _replay_into(folder: str | None, db: str | None):
+    """
+    Replay fixtures from folder into a scratch database, then put back the fixtures mode, orm.DATABASE,
+    and remove the scratch database if it was a temporary one.
+
+    Yields:
+        tuple[fixtures.FixtureStore, str]: The store and the scratch database file
+    """
+    Previous = fixtures.get_store()
+    database = orm.DATABASE.database
+    tmp = None if db else tempfile.mkdtemp(prefix='benchmark_')
+    db = db or path.join(tmp, 'benchmark.db')
+    try:
+        Store = fixtures.configure('replay', folder)
+        orm.DATABASE.init(db, pragmas=orm.PRAGMAS, check_same_thread=False)
+        orm.DATABASE.create_tables([orm.Product, orm.Monitor, orm.Log, orm.MonitorHistory, orm.MonitorLatestPrice, orm.ScrapeRun])
+        yield Store, db
+    finally:
+        log_sink.get_sink().flush()  # scrape logs still queued belong in the scratch database
+        orm.DATABASE.close_all()
+        orm.DATABASE.init(database)
+        fixtures.configure(Previous.mode if Previous else None, Previous.root if Previous else None)
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _benchmark_monitor(monitor: dict) -> None:
+    """Create the product and monitor rows for a recorded monitor in the scratch database"""
+    orm.Product.insert(productid=monitor['productid'], price_alert_threshold=monitor['price_alert_threshold'],
+                       product_type='benchmark').on_conflict_replace().execute()
+    orm.Monitor.insert(monitorid=monitor['monitorid'], productid=monitor['productid'], supplier=monitor['supplier'],
+                       parser=monitor['parser'], url=monitor['url'], match_and=monitor['match_and'] or '',
+                       match_or=monitor['match_or'] or '', fetch_mode=monitor['fetch_mode'],
+                       disable_alerts=0, disable=0).on_conflict_replace().execute()
+
+
+def _pages(folder: str):
+    """Yield (file name, parser class, source) for saved pages in folder"""
+    parsers = {name.lower(): name for name in parser_registry.names()}
+    for fname in sorted(glob.glob(path.join(folder, '*.html'))):
+        name = path.basename(fname)
+        parser = parsers.get(name[:-5].split('_')[0].lower())
+        if parser is None:
+            print(f'Skipping {name}, no parser called {name[:-5].split("_")[0]}')
+            continue
+        with open(fname, encoding='utf-8') as f:
+            yield name, parser_registry.get(parser), f.read()
+
+
+def _golden_corpus() -> list[str]:
+    """Fixed seed synthetic documents, dense with model numbers, spaces and suffixes in every casing"""
+    tokens = ['5', '6', '7', '9', '0', '3', '4', '50', '60', '070', '600', '700', '900',
+              ' ', '  ', 'x', 'X', 't', 'T', 'i', 'I', 'xt', 'XT', 'Xt', 'xT', 'xtx', 'XTX', 'Xtx', 'ti', 'TI', 'Ti', 'tI',
+              '9070', '9060', '5070', '7900', '6050', '<b>', 'RX ', 'RTX ', '£599.99']
+    R = random.Random(20251018)
+    corpus = [''.join(R.choice(tokens) for _ in range(R.randint(1, 16))) for _ in range(50000)]
+    page = ''.join(R.choice(tokens) for _ in range(200000))
+    return corpus + [page]
+
+
+def _fix_source_legacy(source):
+    """The nested str.replace _fix_source, kept as the reference for normaliser"""
+    for generation in ('5', '6', '7'):
+        for model in ('600', '700', '800', '900'):
+            source = source.replace(f'{generation}{model} xtx', f'{generation}{model}xtx')
+            source = source.replace(f'{generation}{model} XTX', f'{generation}{model}xtx')
+            source = source.replace(f'{generation}{model} Xtx', f'{generation}{model}xtx')
+
+            source = source.replace(f'{generation}{model} xt', f'{generation}{model}xt')
+            source = source.replace(f'{generation}{model} XT', f'{generation}{model}xt')
+            source = source.replace(f'{generation}{model} Xt', f'{generation}{model}xt')
+
+    source = source.replace('9070 xt', '9070xt')
+    source = source.replace('9060 xt', '9060xt')
+    source = source.replace('9070 XT', '9070xt')
+    source = source.replace('9060 XT', '9060xt')
+    source = source.replace('9070 Xt', '9070xt')
+    source = source.replace('9060 Xt', '9060xt')
+
+    for generation in ('30', '40', '50', '60'):
+        for model in ('50', '60', '70', '80', '90'):
+            source = source.replace(f'{generation}{model} ti', f'{generation}{model}ti')
+            source = source.replace(f'{generation}{model} TI', f'{generation}{model}ti')
+            source = source.replace(f'{generation}{model} Ti', f'{generation}{model}ti')
+    return source
+
+
+def _time_ms(func, number: int) -> float:
+    return timeit.timeit(func, number=number) / number * 1000
+
+
+def _peak_mb(func) -> float:
+    tracemalloc.start()
+    try:
+        _ = func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+# endregion helpers
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 """Selection of scripts related to the database"""
 import argparse
+from datetime import datetime
+
+from playhouse.migrate import SqliteMigrator, migrate
 
 from orm import *
 from orm_extensions import *  # noqa
@@ -46,9 +49,107 @@ def data_upsert():
                               )
 
 
+def migrate_add_fetch_mode():
+    """Add monitor.fetch_mode, see enums.EnumFetchMode. Safe to run more than once."""
+    if 'fetch_mode' in [c.name for c in DATABASE.get_columns('monitor')]:
+        return
+    Migrator = SqliteMigrator(DATABASE)
+    migrate(Migrator.add_column('monitor', 'fetch_mode', Monitor.fetch_mode))
+
+
+def migrate_add_latest_price():
+    """
+    Create monitor_latest_price and backfill it with the latest monitor_history row per monitor and product url.
+    Safe to run more than once, the backfill replaces existing rows.
+    """
+    with DATABASE.atomic():
+        MonitorLatestPrice.create_table(safe=True)
+        DATABASE.execute_sql('''
+            INSERT OR REPLACE INTO monitor_latest_price (monitorid, product_url, price, product_title, date_when)
+            SELECT monitorid, product_url, price, product_title, date_when
+            FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY monitorid, product_url
+                                               ORDER BY date_when DESC, monitor_historyid DESC) AS rn
+                  FROM monitor_history)
+            WHERE rn = 1''')
+    print(f'monitor_latest_price: {MonitorLatestPrice.select().count()} rows')
+
+
+def migrate_add_outbox():
+    """Create the outbox table, see outbox. Safe to run more than once."""
+    Outbox.create_table(safe=True)
+
+
+def migrate_add_scrape_run():
+    """Create the scrape_run table, see metrics. Safe to run more than once."""
+    ScrapeRun.create_table(safe=True)
+
+
+def migrate_add_scheduling():
+    """Add monitor.next_run, last_error and last_error_when, see scheduler. Safe to run more than once."""
+    columns = [c.name for c in DATABASE.get_columns('monitor')]
+    Migrator = SqliteMigrator(DATABASE)
+    migrate(*[Migrator.add_column('monitor', name, getattr(Monitor, name))
+              for name in ('next_run', 'last_error', 'last_error_when') if name not in columns])
+
+
+# Formats we have seen from pretty_date_now, tried in order after ISO 8601
+LEGACY_DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M',
+                       '%d %b %Y %H:%M:%S', '%d %b %Y %H:%M', '%d %B %Y %H:%M:%S', '%d %B %Y %H:%M',
+                       '%Y%m%d %H:%M:%S', '%Y%m%d %H%M%S', '%Y%m%d %H:%M', '%d/%m/%Y', '%Y-%m-%d')
+
+
+def migrate_dates_to_datetime():
+    """
+    Rewrite the pretty_date_now strings in monitor_history.date_when, log.when, alert.date_sent and monitor.last_run
+    as sortable ISO 8601 datetimes, then create the time range indexes declared on the models.
+    Safe to run more than once. Values that can't be parsed are left alone and printed.
+    """
+    columns = ((MonitorHistory, MonitorHistory.date_when), (Log, Log.when), (Alert, Alert.date_sent), (Monitor, Monitor.last_run))
+    with DATABASE.atomic():
+        for Model_, Field_ in columns:
+            pk = Model_._meta.primary_key  # noqa
+            table, column = Model_._meta.table_name, Field_.column_name  # noqa
+            updates, bad = [], 0
+            for id_, value in DATABASE.execute_sql(f'SELECT {pk.column_name}, "{column}" FROM {table} WHERE "{column}" IS NOT NULL'):
+                dt = _parse_legacy_date(value)
+                if dt is None:
+                    bad += 1
+                    print(f'Could not parse {table}.{column} "{value}" for {pk.column_name}={id_}')
+                elif str(dt) != value:
+                    updates.append((str(dt), id_))
+            DATABASE.cursor().executemany(f'UPDATE {table} SET "{column}"=? WHERE {pk.column_name}=?', updates)
+            print(f'{table}.{column}: {len(updates)} converted, {bad} could not be parsed')
+
+        for Model_ in (MonitorHistory, Log):
+            Model_._schema.create_indexes(safe=True)  # noqa
+        DATABASE.execute_sql('ANALYZE')
+
+
+def _parse_legacy_date(value) -> datetime | None:
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return None
+
+
 
 
 if __name__ == "__main__":
     pass
     # main()
     # data_upsert()
+    # migrate_add_fetch_mode()
+    # migrate_dates_to_datetime()
+    # migrate_add_latest_price()  # after migrate_dates_to_datetime, so date_when sorts
+    # migrate_add_outbox()
+    # migrate_add_scrape_run()
+    # migrate_add_scheduling()
@@ -0,0 +1,154 @@
+"""
+Load test the alert path against a mock notifier backend, see mock_notifier.
+
+Fires synthetic alerts and reports throughput, end-to-end latency (alert fired to message received)
+and failures. Nothing is sent to the real carriers.
+
+Examples:
+    Fan out 2000 alerts to two carriers with notifier.send_all, each send taking 50ms, 5% failing
+    > python scripts/load_notify.py send_all -n 2000 -c PushBullet Telegram --latency 0.05 --failure-rate 0.05
+
+    The same through the outbox and its dispatcher, in a scratch database, over the localhost HTTP stand-in
+    > python scripts/load_notify.py outbox -n 2000 --http --coalesce 1 --rate-limit 0.5
+"""
+import argparse
+import os.path as path
+import statistics
+import tempfile
+import time
+
+import mock_notifier
+import notifier
+import orm
+import outbox
+
+
+def main():
+    """main"""
+    cmdline = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cmdline.add_argument('mode', choices=['send_all', 'outbox'], help='Send with notifier.send_all, or queue in the outbox')
+    cmdline.add_argument('-n', '--number', type=int, default=1000, help='Synthetic alerts to fire')
+    cmdline.add_argument('-c', '--carriers', nargs='+', default=['PushBullet'], help='EnumNotifiers values')
+    cmdline.add_argument('--rate', type=float, default=0, help='Alerts fired per second, 0 fires them all at once')
+    cmdline.add_argument('--latency', type=float, default=0.05, help='Seconds each mock send takes')
+    cmdline.add_argument('--jitter', type=float, default=0, help='Up to this many seconds added to latency, at random')
+    cmdline.add_argument('--failure-rate', type=float, default=0, help='Proportion of mock sends that fail')
+    cmdline.add_argument('--http', action='store_true', help='Send over the localhost HTTP stand-in, rather than in process')
+    cmdline.add_argument('--coalesce', type=float, default=1, help='outbox mode, coalesce window in seconds')
+    cmdline.add_argument('--rate-limit', type=float, default=0, help='outbox mode, min seconds between sends per carrier')
+    cmdline.add_argument('--timeout', type=float, default=120, help='outbox mode, give up waiting for the outbox to empty after this many seconds')
+    args = cmdline.parse_args()
+
+    Backend = mock_notifier.MockCarrier(args.latency, args.jitter, args.failure_rate, seed=1)
+    Server = None
+    if args.http:
+        Server = mock_notifier.MockHttpServer(latency_seconds=args.latency, jitter_seconds=args.jitter,
+                                              failure_rate=args.failure_rate, seed=1).start()
+        Recorder, Backend = Server, mock_notifier.HttpCarrier(Server.url)
+    else:
+        Recorder = Backend
+    notifier.set_backend(Backend)
+
+    try:
+        if args.mode == 'send_all':
+            fired = load_send_all(args.number, args.carriers, args.rate)
+        else:
+            fired = load_outbox(args.number, args.carriers, args.rate, args.coalesce, args.rate_limit, args.timeout)
+        report(fired, Recorder, args.carriers)
+    finally:
+        notifier.set_backend(None)
+        if Server is not None:
+            Server.close()
+
+
+def load_send_all(number: int, carriers: list[str], rate: float = 0) -> dict[int, float]:
+    """
+    Fire alerts with notifier.send_all, then wait for the sends to finish.
+
+    Returns:
+        dict[int, float]: alert number: time.time() it was fired
+    """
+    fired, futures = {}, []
+    for i in range(number):
+        fired[i] = time.time()
+        futures += notifier.send_all(f'Alert {i}', _alert_body(i), carriers)
+        if rate:
+            time.sleep(1 / rate)
+    for future in futures:
+        future.result()
+    return fired
+
+
+def load_outbox(number: int, carriers: list[str], rate: float, coalesce: float, rate_limit: float, timeout: float) -> dict[int, float]:
+    """
+    Queue alerts with outbox.enqueue in a scratch database and send them with a dispatcher.
+
+    Returns:
+        dict[int, float]: alert number: time.time() it was fired
+    """
+    db = path.join(tempfile.mkdtemp(prefix='load_notify_'), 'outbox.db')
+    orm.DATABASE.init(db, pragmas=orm.PRAGMAS, check_same_thread=False)
+    orm.Outbox.create_table()
+    print(f'Scratch database {db}')
+
+    outbox._DISPATCHER = outbox.Dispatcher(coalesce_seconds=coalesce, min_seconds_between_sends={'default': rate_limit},  # noqa
+                                           backoff_seconds=0.5, poll_seconds=0.1).start()
+    fired = {}
+    for i in range(number):
+        fired[i] = time.time()
+        with orm.DATABASE.connection_context():
+            outbox.enqueue(f'Alert {i}', _alert_body(i), carriers)
+        if rate:
+            time.sleep(1 / rate)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with orm.DATABASE.connection_context():
+            if not orm.Outbox.select().where(orm.Outbox.status == 'pending').exists():
+                break
+        time.sleep(0.2)
+    outbox.shutdown()
+    with orm.DATABASE.connection_context():
+        failed = orm.Outbox.select().where(orm.Outbox.status == 'failed').count()
+    print(f'Outbox rows failed after all retries: {failed}')
+    return fired
+
+
+def report(fired: dict[int, float], Recorder, carriers: list[str]) -> None:
+    """Print throughput and latency per carrier"""
+    start = min(fired.values())
+    messages = Recorder.messages
+    print(f'{len(fired)} alerts, {len(messages)} messages received, {Recorder.failures} injected failures')
+    for carrier in carriers:
+        latencies = [received - fired[i] for i, c, received in _received(Recorder) if c == carrier]
+        carrier_messages = [M for M in messages if M.carrier == carrier]
+        if not latencies:
+            print(f'{carrier}: nothing received')
+            continue
+        elapsed = max(M.received for M in carrier_messages) - start
+        latencies.sort()
+        print(f'{carrier}: {len(latencies)}/{len(fired)} alerts in {len(carrier_messages)} messages, '
+              f'{len(latencies) / elapsed:.1f} alerts/s, latency ms '
+              f'p50 {statistics.median(latencies) * 1000:.0f} '
+              f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} '
+              f'max {latencies[-1] * 1000:.0f}')
+
+
+# region helpers
+def _alert_body(i: int) -> str:
+    return f'[alert {i}] 18/10/2026 12:00 Supplier Sapphire Pulse 9070xt 16GB £549.99\nhttps://example.com/product/{i}'
+
+
+def _received(Recorder) -> list[tuple[int, str, float]]:
+    """(alert number, carrier, received) for every alert in every message received, digests included"""
+    received = []
+    for M in Recorder.messages:
+        for line in M.body.splitlines():
+            if line.startswith('[alert '):
+                received.append((int(line[7:line.index(']')]), M.carrier, M.received))
+    return received
+# endregion helpers
+
+
+if __name__ == '__main__':
+    main()
@@ -1,115 +1,122 @@
-"""Script that runs the price checker"""
-import ast
+"""
+Script that runs the price checker
+
+Examples:
+    Run as normal
+    > python scripts/price_checker.py
+
+    Save every page fetched, for replaying with no network, e.g. by scripts/benchmark.py parsers
+    > python scripts/price_checker.py --fixtures record --fixtures-dir C:/development/price_watch/fixtures
+
+    Profile one cycle, one monitor at a time, writing a cProfile .prof and a tracemalloc snapshot per parser
+    > python scripts/price_checker.py --profile cprofile --profile-dir C:/temp/profile
+
+    Sample three cycles replayed from fixtures, writing collapsed stacks per parser for flamegraph.pl or speedscope
+    > python scripts/price_checker.py --profile sample --cycles 3 --fixtures replay
+"""
+import argparse
 import random
-from datetime import datetime, timedelta
+from datetime import datetime
 from time import sleep
 
-from xlwings.mac_dict import enums
-
 import config
-import dblib.sqlitelib as sqlitelib
-import funclite.iolib as iolib
-import funclite.stringslib as stringslib
 
-from orm_extensions import *
-import notifier
-import errors
+from errors import UnknownParserError
+from orm_extensions import AlertExt
+import fixtures
+import metrics
 import orm
-import enums
+import outbox
+import page_cache
+import parser_registry
+import profiling
+import scheduler
 
 
 def main() -> None:
     """
-        Every 10 minutes will update prices inside of the database.
-    """
-    prices = {}
-    now = datetime.now()
-    error_time = 0
-
+        Scrape each enabled monitor when it is due and send any alerts.
 
-    with sqlitelib.Conn('prices.db') as Conn:
-        Crud = sqlitelib.CRUD(Conn)
-        cursor = Conn.cursor()
-        retrying = False
-
-        first = True
-        while True:
-            check_interval = 60 * 10 + random.randrange(0, 120)
-            interval = 30 + random.randrange(0, 10)
-
-            try:
-                right_now = datetime.now()
-                if (right_now - now).seconds > 4 * 60 * 60:
-                    now = right_now
-
-                print(f"{right_now} ~~ Starting price check...")
-                #                               0           1     2     3       4       5           6           7
-                rows = cursor.execute("SELECT productid, parser, url, price, supplier, match_and, match_or, monitorid FROM monitor WHERE disable=0").fetchall()
-                new_prices = {}
-                prices = {}
-
-                PP = iolib.PrintProgress(iter_=rows, init_msg='Reading prices...')
-                for row in rows:
-                    match_and = ast.literal_eval(row[5])
-                    match_or = ast.literal_eval(row[6])
-                    if not match_and: match_and = tuple()
-                    if not match_or: match_or = tuple()
-
-                    Scraper = globals()[row[1]]
-                    new_prices[row[0]] = Scraper.scrape(row[2], row[1], match_and=match_and, match_or=match_or)  # get_price returns a tuple of price, product url
-                    price_alert_threshold = Crud.get_value('product', 'price_alert_threshold', {'productid': row[0]})
-                    if new_prices[row[0][0]] < price_alert_threshold and (first or new_prices[row[0][0]] < prices[row[0][0]]):
-                        print('Price %s is below threshold %s for product %s' % (new_prices[row[0][0]], price_alert_threshold, row[0]))
-
-                        # Alerts
-                        title = f'{row[0]} in stock at {row[4]} for £{new_prices[row[0][0]]}'
-                        body = f'Product {row[0]} in stock at {row[4]} for £{new_prices[row[0][0]]}\n{new_prices[row[0][1]]}'
-
-                        # Pushbullet
-                        if enums.EnumAlertCarriers.PushBullet in config.NOTIFIERS:
-                            notifier.PushBullet.send(title, body, row[7])
-
-                        if enums.EnumAlertCarriers.SMS_Twilio in config.NOTIFIERS:
-                            notifier.TwilioSMS.send(title, body, row[7])
-
-                        if enums.EnumAlertCarriers.WhatsApp in config.NOTIFIERS:
-                            notifier.WhatsApp.send(title, body, row[7])
-
-                        if enums.EnumAlertCarriers.Telegram in config.NOTIFIERS:
-                            notifier.Telegram.send(title, body, row[7])
-
-                if first:
-                    prices = new_prices
-
-                print("Updating prices in database...")
-                lst = []
-                for item in new_prices.items():
-                    # sqlite no date type, text date format is "YYYY-MM-DD HH:MM:SS.SSS"
-                    # Only update if changes
-                    if first or new_prices[row[0][0]] != prices[row[0][0]]:
-                        lst += [[item[1][0], stringslib.pretty_date_now(with_time=True), item[1][1], item[0]]]
-                        prices[row[0][0]] = new_prices[row[0][0]]
-
-                cursor.executemany("UPDATE monitor SET price = ?, last_run=?, purchase_url=?; WHERE productid = ?", lst)
-                Conn.commit()
-
-                if retrying:
-                    retrying = False
-                    print("Price tracker is connected again!")
-                    error_time = 0
-
-                missing = ((right_now + timedelta(seconds=check_interval)) - datetime.now()).seconds
-                print(f"Prices updated! {missing} seconds until next check!")
-                first = False
-                sleep(missing)  # noqa
-
-            except Exception as err:
-                print(err)
-                error_time += interval
-                retrying = True
-                print(f"Price tracker has disconnected, retrying in {error_time} seconds!")
-                sleep(error_time)  # noqa
+        Monitors are due every config.SCHEDULER_INTERVAL_SECONDS or so, each on its own clock, see scheduler.
+        Monitors for different hosts are scraped at the same time, and a host that shows a captcha or
+        throttles us is backed off on its own while the others carry on.
+        Alerts are queued in the outbox and sent in the background, see outbox.
+        Stage timings go to the scrape_run table and the metrics file and endpoint, see metrics.
+    """
+    cmdline = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cmdline.add_argument('--fixtures', choices=fixtures.MODES,
+                         help='Record every page fetched to the fixture store, or replay pages from it with no network')
+    cmdline.add_argument('--fixtures-dir', help='Fixtures folder, defaults to config.FIXTURES_DIR')
+    cmdline.add_argument('--profile', choices=profiling.MODES,
+                         help='Run --cycles cycles of every monitor back to back, one monitor at a time, under cProfile or the sampling profiler, then exit')
+    cmdline.add_argument('--cycles', type=int, default=1, help='Cycles to profile')
+    cmdline.add_argument('--profile-dir', default='profile', help='Folder for the profiles, see profiling')
+    args = cmdline.parse_args()
+    if args.fixtures:
+        fixtures.configure(args.fixtures, args.fixtures_dir)
+    Profiler = profiling.Profiler(args.profile_dir, args.profile) if args.profile else None
+    Scheduler = scheduler.get_scheduler()
+    cycles = 0
 
+    error_time = 0
+    retrying = False
+    outbox.get_dispatcher()  # sends the alerts queued by AlertExt.alerts_send
+    metrics.start()  # if config.METRICS_PORT is set
+
+    while True:
+        try:
+            right_now = datetime.now()
+            with orm.DATABASE.connection_context():
+                rows = orm.Monitor.select(orm.Monitor.monitorid, orm.Monitor.parser).where(orm.Monitor.disable == 0).tuples()
+                # Fresh instances every time so edits to the monitor table are picked up
+                monitors = []
+                for monitorid, parser in rows:
+                    try:
+                        monitors.append(parser_registry.get(parser).get_by_id(monitorid))
+                    except UnknownParserError as e:
+                        print(f'Skipping monitorid {monitorid}: {e}')
+
+            due = monitors if Profiler else Scheduler.due(monitors, right_now)
+            if due:
+                print(f"{right_now} ~~ Starting price check of {len(due)} of {len(monitors)} monitors...")
+                Timings = metrics.StageTimings()
+                with Timings.stage('scrape'):
+                    Scheduler.run(due, max_workers=1 if Profiler else None, profiler=Profiler)
+
+                print("Queueing alerts...")
+                with Timings.stage('notify'), orm.DATABASE.connection_context():
+                    AlertExt.alerts_send(carriers=[n.value for n in config.NOTIFIERS])
+                page_cache.get_cache().evict()
+                metrics.observe_cycle((datetime.now() - right_now).total_seconds(), Timings)
+                print(' '.join(f'{stage} {Timings.seconds.get(stage, 0):.1f}s' for stage in metrics.CYCLE_STAGES))
+                metrics.export()  # if config.METRICS_TEXTFILE is set
+
+            if retrying:
+                retrying = False
+                print("Price tracker is connected again!")
+                error_time = 0
+
+            cycles += 1
+            if Profiler:
+                if cycles >= args.cycles:
+                    break
+                continue
+
+            wait = min(Scheduler.seconds_until_due(monitors), config.SCHEDULER_POLL_SECONDS)
+            if due:
+                print(f"Prices updated! {wait:.0f} seconds until next check!")
+            sleep(wait)
+
+        except Exception as err:
+            print(err)
+            error_time = min(max(30, error_time * 2), config.SCHEDULER_MAX_BACKOFF_SECONDS)  # doubles until it reconnects
+            retrying = True
+            print(f"Price tracker has disconnected, retrying in {error_time} seconds!")
+            sleep(error_time + random.randrange(0, 10))  # noqa
+
+    for fname in Profiler.write():
+        print(f'Wrote {fname}')
+    print(Profiler.memory_report())
 
 
 
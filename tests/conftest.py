@@ -0,0 +1,33 @@
+"""Put the package and its scripts on the path, using config_template when there is no config.py"""
+import importlib
+import os.path
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'scripts')]
+try:
+    import config  # noqa
+except ImportError:
+    sys.modules['config'] = importlib.import_module('config_template')
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A scratch database with the tables, put back to the configured database afterwards"""
+    import log_sink
+    import orm
+
+    previous = orm.DATABASE.database
+    orm.DATABASE.init(str(tmp_path / 'test.db'), pragmas=orm.PRAGMAS)
+    orm.DATABASE.create_tables([orm.Product, orm.Monitor, orm.MonitorHistory, orm.MonitorLatestPrice,
+                                orm.Log, orm.Outbox, orm.ScrapeRun])
+    try:
+        yield orm.DATABASE
+    finally:
+        if log_sink._SINK is not None:  # noqa, rows logged by the test go to the scratch database
+            log_sink._SINK.flush()  # noqa
+        orm.DATABASE.close_all()
+        orm.DATABASE.init(previous)
@@ -0,0 +1,101 @@
+"""log_sink.LogSink batching, levels, overflow and flushing on close"""
+import threading
+import time
+
+import pytest
+
+import log_sink
+from enums import EnumLogLevel
+from orm import Log
+
+INFO = EnumLogLevel.INFO.value
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Sizes of the insert_many batches written to the log table"""
+    sizes = []
+    insert_many = Log.insert_many
+
+    def record(rows, *args, **kwargs):
+        sizes.append(len(rows))
+        return insert_many(rows, *args, **kwargs)
+    monkeypatch.setattr(Log, 'insert_many', record)
+    return sizes
+
+
+def stopped_sink(**kwargs) -> log_sink.LogSink:
+    """A sink whose writer thread has exited, so rows stay queued until flushed"""
+    Sink = log_sink.LogSink(flush_seconds=0.05, **kwargs)
+    Sink._stop.set()  # noqa
+    Sink._thread.join()  # noqa
+    return Sink
+
+
+def test_batching(db, batches):
+    Sink = log_sink.LogSink(batch_size=3, flush_seconds=0.2)
+    for i in range(7):
+        Sink.log(None, 'Test', INFO, str(i))
+    Sink.close()
+    assert sorted(row.comment for row in Log.select()) == [str(i) for i in range(7)]
+    assert max(batches) <= 3 and sum(batches) == 7
+
+
+def test_flush_writes_in_batches(db, batches):
+    Sink = stopped_sink(batch_size=3)
+    for i in range(7):
+        Sink.log(None, 'Test', INFO, str(i))
+    assert Log.select().count() == 0  # queued, not written
+    assert Sink.flush()
+    assert Log.select().count() == 7
+    assert batches == [3, 3, 1]
+
+
+def test_min_level(db):
+    Sink = stopped_sink(min_level=EnumLogLevel.WARNING.value)
+    Sink.log(None, 'Test', EnumLogLevel.DEBUG.value, 'debug')
+    Sink.log(None, 'Test', INFO, 'info')
+    Sink.log(None, 'Test', EnumLogLevel.ERROR.value, 'error')
+    Sink.flush()
+    assert [row.comment for row in Log.select()] == ['error']
+
+
+def test_overflow_drops_rows(db):
+    Sink = stopped_sink(max_queue=2)
+    for i in range(5):
+        Sink.log(None, 'Test', INFO, str(i))
+    assert Sink.dropped == 3
+    Sink.flush()
+    assert [row.comment for row in Log.select().order_by(Log.logid)] == ['0', '1']
+
+
+def test_shutdown_flushes_the_process_sink(db, monkeypatch):
+    monkeypatch.setattr(log_sink, '_SINK', None)
+    log_sink.log(None, 'Test', INFO, 'on exit')
+    Sink = log_sink._SINK  # noqa
+    log_sink.shutdown()
+    assert log_sink._SINK is None  # noqa
+    assert not Sink._thread.is_alive()  # noqa
+    assert [row.comment for row in Log.select()] == ['on exit']
+
+
+def test_close_gives_up_on_a_stuck_writer(db):
+    Sink = log_sink.LogSink(flush_seconds=0.1)
+    Sink._write_lock.acquire()  # noqa, the writer thread blocks in its next write
+    try:
+        Sink.log(None, 'Test', INFO, 'stuck')
+        deadline = time.monotonic() + 5
+        while not Sink._queue.empty() and time.monotonic() < deadline:  # noqa, wait for the writer to take the row
+            time.sleep(0.01)
+        Sink.log(None, 'Test', INFO, 'queued')
+
+        closer = threading.Thread(target=Sink.close)
+        start = time.monotonic()
+        closer.start()
+        closer.join(timeout=5)
+        assert not closer.is_alive()
+        assert time.monotonic() - start < 2  # a few flush_seconds, not forever
+    finally:
+        Sink._write_lock.release()  # noqa
+    Sink._thread.join(timeout=5)  # noqa
+    assert Sink.flush(timeout=5)
@@ -0,0 +1,66 @@
+"""Matcher terms, and the match_and and match_or column values they are parsed from"""
+import pytest
+
+from matcher import Matcher
+from orm_extensions import _compiled_matcher, _make_tuple
+
+
+@pytest.mark.parametrize('and_terms, or_terms, s, expected', [
+    (('9070xt', '16gb'), (), 'sapphire pulse 9070xt 16gb', True),  # every and term
+    (('9070xt', '16gb'), (), 'sapphire pulse 9070xt', False),
+    ((), ('sapphire', 'powercolor'), 'powercolor reaper 9070xt', True),  # any or term
+    ((), ('sapphire', 'powercolor'), 'xfx swift 9070xt', False),
+    (('9070xt',), ('sapphire', 'powercolor'), 'sapphire 9060xt', False),  # and and or
+    ((), (), 'anything', True),
+])
+def test_and_or(and_terms, or_terms, s, expected):
+    assert Matcher(and_terms, or_terms).match(s) is expected
+
+
+@pytest.mark.parametrize('and_terms, or_terms, s, expected', [
+    (('9070xt', '!oc'), (), 'sapphire pulse 9070xt', True),
+    (('9070xt', '!oc'), (), 'sapphire nitro 9070xt oc', False),
+    (('9070xt', '!oc'), (), 'sapphire nitro 9070xt rock', False),  # a substring, so 'rock' has oc in it
+    ((), ('sapphire', '!refurbished'), 'sapphire 9070xt refurbished', False),  # negative in match_or
+    ((), ('!refurbished',), 'xfx 9070xt', True),  # only negative or terms, so no positive or term is needed
+])
+def test_negation(and_terms, or_terms, s, expected):
+    assert Matcher(and_terms, or_terms).match(s) is expected
+
+
+@pytest.mark.parametrize('terms, s, expected', [
+    (('=xt',), 'radeon 9070 xt', True),
+    (('=xt',), 'radeon 9070xt', False),
+    (('9070xt', '!=oc'), 'sapphire nitro 9070xt rock', True),  # whole word, so 'rock' doesn't count
+    (('9070xt', '!=oc'), 'sapphire nitro 9070xt oc', False),
+])
+def test_whole_word(terms, s, expected):
+    assert Matcher(terms).match(s) is expected
+
+
+def test_spaces_are_kept():
+    assert Matcher((' ti',)).match('rtx 5070 ti')
+    assert not Matcher((' ti',)).match('title')
+
+
+def test_case_folding():
+    assert Matcher(('9070XT', '=OC'), ('Sapphire',)).match('sapphire 9070xt oc')
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('', ()),
+    (None, ()),
+    ('9070xt', ('9070xt',)),  # a SyntaxError to literal_eval
+    ('9070', ('9070',)),  # an int to literal_eval
+    ('9070.5', ('9070.5',)),
+    ("'9070xt'", ('9070xt',)),
+    ("('9070xt', '!oc')", ('9070xt', '!oc')),
+    ("['sapphire', 'xfx']", ['sapphire', 'xfx']),
+])
+def test_make_tuple(value, expected):
+    assert _make_tuple(value) == expected
+
+
+def test_numeric_column_value():
+    assert _compiled_matcher('9070', '').match('sapphire pulse 9070xt')
+    assert not _compiled_matcher('5070', '').match('sapphire pulse 9070xt')
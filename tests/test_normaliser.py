@@ -0,0 +1,21 @@
+"""Normaliser must give exactly the output of the nested str.replace _fix_source it replaced, see scripts/benchmark.py normalise"""
+import pytest
+
+from benchmark import _fix_source_legacy, _golden_corpus
+from normaliser import Normaliser
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('Sapphire 9070 XT and RTX 5070 Ti', 'Sapphire 9070xt and RTX 5070ti'),
+    ('RX 7900 XTX, 7900 XT, 7900 xT', 'RX 7900xtx, 7900xt, 7900 xT'),  # only the listed spellings
+    ('9070  XT 9070XT', '9070  XT 9070XT'),  # one space only
+    ('19070 xt 9070 xtx', '19070xt 9070xtx'),  # as legacy, no word boundaries
+])
+def test_examples(source, expected):
+    assert Normaliser().normalise(source) == expected == _fix_source_legacy(source)
+
+
+def test_golden_corpus():
+    N = Normaliser()
+    mismatches = [s for s in _golden_corpus() if N.normalise(s) != _fix_source_legacy(s)]
+    assert not mismatches, f'{len(mismatches)} mismatches, e.g. {mismatches[0][:80]!r}'
@@ -0,0 +1,121 @@
+"""outbox.Dispatcher coalescing, rate limits, retries and per row attempts, against mock_notifier.MockCarrier"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import notifier
+import outbox
+from enums import EnumNotifiers, EnumOutboxStatus
+from mock_notifier import MockCarrier
+from orm import Outbox
+
+CARRIER = EnumNotifiers.PushBullet.value
+
+
+@pytest.fixture
+def mock():
+    Mock = MockCarrier(seed=1)
+    previous = notifier.set_backend(Mock)
+    yield Mock
+    notifier.set_backend(previous)
+
+
+@pytest.fixture
+def dispatcher(db, mock):
+    """A dispatcher that is not started, each test calls dispatch itself"""
+    Dispatchers = []
+
+    def make(**kwargs) -> outbox.Dispatcher:
+        Dispatchers.append(outbox.Dispatcher(**dict({'coalesce_seconds': 0, 'backoff_seconds': 30}, **kwargs)))
+        return Dispatchers[-1]
+
+    yield make
+    for D in Dispatchers:
+        D._pool.shutdown(wait=True)  # noqa
+
+
+def rows() -> dict[str, Outbox]:
+    """body: outbox row"""
+    return {row.body: row for row in Outbox.select()}
+
+
+def retry_now() -> None:
+    """Bring every pending retry forward to now, rather than waiting out the backoff"""
+    Outbox.update(next_attempt=datetime.now() - timedelta(seconds=1)).where(Outbox.status == EnumOutboxStatus.Pending.value).execute()
+
+
+def test_coalesced_rows_sent_together(dispatcher, mock):
+    D = dispatcher()
+    outbox.enqueue('Price Alerts 1', 'a', [CARRIER])
+    outbox.enqueue('Price Alerts 2', 'b', [CARRIER])
+    assert D.dispatch() == 1
+
+    assert len(mock.messages) == 1
+    assert mock.messages[0].title == 'Price Alerts 2'  # the latest title
+    assert mock.messages[0].body == 'a\nb'
+    assert {(row.status, row.attempts) for row in rows().values()} == {(EnumOutboxStatus.Sent.value, 1)}
+
+
+def test_coalesce_window(dispatcher, mock):
+    D = dispatcher(coalesce_seconds=60)
+    outbox.enqueue('Price Alerts', 'a', [CARRIER])
+    assert D.dispatch() == 0  # held for later rows
+    assert D.dispatch(flush=True) == 1
+    assert mock.counts() == {CARRIER: 1}
+
+
+def test_rate_limit(dispatcher, mock):
+    D = dispatcher(min_seconds_between_sends={'default': 60})
+    outbox.enqueue('Price Alerts', 'a', [CARRIER])
+    assert D.dispatch() == 1
+    outbox.enqueue('Price Alerts', 'b', [CARRIER])
+    assert D.dispatch() == 0  # sent too recently
+    assert rows()['b'].status == EnumOutboxStatus.Pending.value
+
+
+def test_failed_row_backs_off_and_is_retried(dispatcher, mock):
+    D = dispatcher()
+    mock.failure_rate = 1
+    outbox.enqueue('Price Alerts', 'a', [CARRIER])
+    before = datetime.now()
+    assert D.dispatch() == 0
+
+    row = rows()['a']
+    assert (row.status, row.attempts) == (EnumOutboxStatus.Pending.value, 1)
+    assert row.next_attempt >= before + timedelta(seconds=30)
+    assert 'MockCarrierError' in row.error
+    assert D.dispatch() == 0 and mock.failures == 1  # backing off, not tried again
+
+    retry_now()
+    assert D.dispatch() == 0
+    assert rows()['a'].attempts == 2
+    assert rows()['a'].next_attempt >= datetime.now() + timedelta(seconds=59)  # doubled
+
+    mock.failure_rate = 0
+    retry_now()
+    assert D.dispatch() == 1
+    row = rows()['a']
+    assert (row.status, row.attempts, row.error) == (EnumOutboxStatus.Sent.value, 3, None)
+
+
+def test_attempts_counted_per_row(dispatcher, mock):
+    D = dispatcher(max_attempts=3)
+    mock.failure_rate = 1
+    outbox.enqueue('Price Alerts', 'old', [CARRIER])
+    D.dispatch()
+    retry_now()
+    D.dispatch()
+    assert rows()['old'].attempts == 2
+
+    outbox.enqueue('Price Alerts', 'new', [CARRIER])  # coalesced with the row in retry
+    retry_now()
+    D.dispatch()
+    old, new = rows()['old'], rows()['new']
+    assert (old.status, old.attempts) == (EnumOutboxStatus.Failed.value, 3)
+    assert (new.status, new.attempts) == (EnumOutboxStatus.Pending.value, 1)  # not failed on its first try
+
+    mock.failure_rate = 0
+    retry_now()
+    assert D.dispatch() == 1
+    assert [M.body for M in mock.messages] == ['new']
+    assert (rows()['new'].status, rows()['new'].attempts) == (EnumOutboxStatus.Sent.value, 2)
@@ -0,0 +1,22 @@
+"""Replay the recorded fixtures in tests/fixtures through every parser, see scripts/benchmark.py parsers"""
+import os.path
+
+import benchmark
+import orm
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# parser: {monitorid: monitor_history rows expected from its recorded pages}
+EXPECTED_ROWS = {
+    'Argos': {1: 2},  # two in stock cards under the threshold, one out of stock
+    'AWDIT': {2: 2},  # special price with an old price, normal price with a bundle price, one out of stock
+}  # the other parsers have no recordings yet, record one with price_checker.py --fixtures record
+
+
+def test_fixtures_replay(db):
+    assert benchmark.bench_parsers(FIXTURES_DIR, number=1, db=db.database)  # replays into the db fixture
+
+    with db.connection_context():
+        for parser, monitors in EXPECTED_ROWS.items():
+            for monitorid, rows in monitors.items():
+                assert orm.MonitorHistory.select().where(orm.MonitorHistory.monitorid == monitorid).count() == rows, parser
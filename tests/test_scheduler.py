@@ -0,0 +1,133 @@
+"""scheduler.Scheduler due monitors, host backoff, request budgets and run records, on a fake clock"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import scheduler
+from errors import CaptchaError
+from orm import Monitor, Product
+
+HOST = 'www.example.com'
+URL = f'https://{HOST}/graphics-cards'
+START = datetime(2026, 1, 1, 12)
+
+
+class FakeClock:
+    """Stands in for datetime.now, time.monotonic and time.sleep, only sleep moves it on"""
+
+    def __init__(self):
+        self.now = START
+        self.monotonic = 1000.
+        self.slept = []
+
+    def advance(self, seconds: float) -> None:
+        self.now += timedelta(seconds=seconds)
+        self.monotonic += seconds
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.advance(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    Clock = FakeClock()
+    monkeypatch.setattr(scheduler, '_datetime', type('FakeDatetime', (datetime,), {'now': classmethod(lambda cls: Clock.now)}))
+    monkeypatch.setattr(scheduler, '_monotonic', lambda: Clock.monotonic)
+    monkeypatch.setattr(scheduler, '_sleep', Clock.sleep)
+    monkeypatch.setattr(scheduler._random, 'uniform', lambda a, b: a)  # no jitter  # noqa
+    return Clock
+
+
+def make_scheduler(**kwargs) -> scheduler.Scheduler:
+    return scheduler.Scheduler(**dict({'interval_seconds': 600, 'jitter_seconds': 60, 'backoff_seconds': 60,
+                                       'max_backoff_seconds': 300, 'requests_per_minute': 6, 'burst': 2}, **kwargs))
+
+
+def monitor(url: str = URL, next_run: datetime | None = None):
+    return SimpleNamespace(monitorid=1, url=url, next_run=next_run)
+
+
+def test_due(clock):
+    S = make_scheduler()
+    later = monitor(next_run=START + timedelta(minutes=5))
+    overdue = monitor(next_run=START - timedelta(minutes=5))
+    new = monitor()
+    assert S.due([later, overdue, new]) == [new, overdue]
+    assert S.seconds_until_due([later]) == 300
+
+
+def test_due_leaves_out_hosts_backing_off(clock):
+    S = make_scheduler()
+    other = monitor('https://www.other.com/gpus')
+    S._host_failed(HOST, CaptchaError(), START)  # noqa
+    assert S.due([monitor(), other]) == [other]
+    assert S.seconds_until_due([monitor()]) == 60
+
+    clock.advance(60)
+    assert len(S.due([monitor(), other])) == 2
+
+
+def test_backoff_doubles_to_the_cap(clock):
+    S = make_scheduler()
+    seconds = [(S._host_failed(HOST, CaptchaError(), START) - START).total_seconds() for _ in range(5)]  # noqa
+    assert seconds == [60, 120, 240, 300, 300]
+
+
+def test_backoff_resets_on_success(clock):
+    S = make_scheduler()
+    S._host_failed(HOST, CaptchaError(), START)  # noqa
+    S._host_failed(HOST, CaptchaError(), START)  # noqa
+    S._host_answered(HOST)  # noqa
+    assert not S.backing_off(HOST)
+    assert S.backoff_until(HOST) is None
+    assert S._host_failed(HOST, CaptchaError(), START) == START + timedelta(seconds=60)  # noqa, back to the first backoff
+
+
+def test_acquire_blocks_when_the_budget_is_spent(clock):
+    S = make_scheduler()
+    assert [S.acquire(URL) for _ in range(2)] == [0, 0]  # the burst
+    assert S.acquire(URL) == pytest.approx(10)  # 6 a minute
+    assert S.acquire(URL) == pytest.approx(10)
+    assert S.acquire('https://www.other.com/gpus') == 0  # budgets are per host
+    assert clock.slept == [pytest.approx(10), pytest.approx(10)]
+
+
+def test_acquire_without_a_limit(clock):
+    S = make_scheduler(requests_per_minute=0)
+    assert sum(S.acquire(URL) for _ in range(10)) == 0
+    assert not clock.slept
+
+
+@pytest.fixture
+def row(db):
+    Product.create(productid='9070 xt', product_type='9070 xt')
+    M = Monitor.create(productid='9070 xt', supplier='Example', parser='Example', url=URL)
+    return SimpleNamespace(monitorid=M.monitorid, url=URL, next_run=None)
+
+
+def test_record_success(clock, row):
+    S = make_scheduler()
+    S._record(row, None)  # noqa
+    M = Monitor.get_by_id(row.monitorid)
+    assert (M.last_run, M.next_run, M.last_error) == (START, START + timedelta(seconds=600), None)
+    assert (row.last_run, row.next_run) == (M.last_run, M.next_run)
+
+
+def test_record_host_error(clock, row):
+    S = make_scheduler()
+    S._record(row, CaptchaError('blocked'))  # noqa
+    M = Monitor.get_by_id(row.monitorid)
+    assert (M.last_run, M.next_run, M.last_error_when) == (START, START + timedelta(seconds=60), START)  # the host backoff
+    assert M.last_error == "CaptchaError('blocked')"
+    assert S.backing_off(HOST)
+
+
+def test_record_monitor_error(clock, row):
+    S = make_scheduler()
+    S._record(row, ValueError('no price'))  # noqa
+    M = Monitor.get_by_id(row.monitorid)
+    assert M.next_run == START + timedelta(seconds=600)  # not a host error, so no backoff
+    assert M.last_error == "ValueError('no price')"
+    assert not S.backing_off(HOST)